@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""End-to-end loopback benchmark of the API transmission pipeline
+
+Generates API messages with the given size, encryption, and FEC settings,
+transmits them over loopback multicast with the same pacing as the demo
+receiver (optionally injecting packet loss and reordering), and receives them
+with the API listener. Reports the achieved throughput, the decoding latency
+percentiles, and the CPU time spent per message on each side.
+
+The decoding latency is measured from the transmission of the last packet of
+each message until the listener outputs the decoded message. It can be
+negative with FEC, when the message becomes decodable before all packets
+arrive.
+
+"""
+import json
+import logging
+import os
+import queue
+import random
+import resource
+import struct
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from blocksatcli.api import msg, net  # noqa: E402
+from blocksatcli.api.fec import fec_supported  # noqa: E402
+from blocksatcli.api.gpg import Gpg  # noqa: E402
+from blocksatcli.api.listen import ApiListener  # noqa: E402
+from blocksatcli.api.order import ApiChannel  # noqa: E402
+from blocksatcli.api.pacer import Pacer  # noqa: E402
+from blocksatcli.api.pkt import BlocksatPktHandler  # noqa: E402
+
+GPG_PASSPHRASE = "benchmark"
+MSG_ID_FMT = '!I'  # message index prepended to each payload
+
+
+def percentile(values, p):
+    """Percentile of a list of values (nearest-rank method)"""
+    if (len(values) == 0):
+        return float('nan')
+    ordered = sorted(values)
+    idx = max(int(round(p / 100 * len(ordered))) - 1, 0)
+    return ordered[min(idx, len(ordered) - 1)]
+
+
+def gen_messages(args, gpg):
+    """Generate the API messages to be transmitted
+
+    Returns:
+        List with the packed Blocksat packets of each message.
+
+    """
+    rnd = random.Random(args.seed)
+    id_len = struct.calcsize(MSG_ID_FMT)
+    all_pkts = []
+    for i in range(args.n_msgs):
+        payload = struct.pack(MSG_ID_FMT, i) + rnd.randbytes(
+            max(args.msg_size - id_len, 0))
+        tx_msg = msg.generate(payload,
+                              filename="msg{}".format(i),
+                              plaintext=not args.encrypt,
+                              encapsulate=True,
+                              fec=args.fec,
+                              gpg=gpg,
+                              trust=True,
+                              fec_overhead=args.fec_overhead)
+        handler = BlocksatPktHandler()
+        handler.split(tx_msg.get_data(), i + 1, ApiChannel.USER.value)
+        all_pkts.append([pkt.pack() for pkt in handler.get_frags(i + 1)])
+    return all_pkts
+
+
+def impair(pkts, rnd, loss, reorder, depth):
+    """Apply random packet loss and reordering to a list of packets
+
+    Args:
+        pkts    : List of packets.
+        rnd     : Random number generator.
+        loss    : Probability of losing each packet.
+        reorder : Probability of displacing each packet.
+        depth   : Maximum displacement (in packets) of a reordered packet.
+
+    """
+    pkts = [x for x in pkts if rnd.random() >= loss]
+    for i in range(len(pkts)):
+        if (rnd.random() < reorder):
+            j = min(i + rnd.randint(1, depth), len(pkts) - 1)
+            pkts[i], pkts[j] = pkts[j], pkts[i]
+    return pkts
+
+
+def transmit(args, sock, all_pkts, t_sent, stats):
+    """Transmit the messages with paced bursts of packets"""
+    rnd = random.Random(args.seed)
+    pacer = Pacer(args.bitrate)
+    t_cpu = time.thread_time()
+    for i, msg_pkts in enumerate(all_pkts):
+        msg_pkts = impair(msg_pkts, rnd, args.loss, args.reorder,
+                          args.reorder_depth)
+        for i_start in range(0, len(msg_pkts), args.burst):
+            burst = msg_pkts[i_start:i_start + args.burst]
+            pacer.pace(sum([len(x) for x in burst]))
+            sock.send_many(burst)
+        t_sent[i] = time.monotonic()
+        stats['tx_pkts'] += len(msg_pkts)
+    stats['tx_cpu'] = time.thread_time() - t_cpu
+
+
+def receive(listener, gpg, args, stats):
+    """Run the API listener and measure its CPU usage"""
+    t_cpu = time.thread_time()
+    t_cpu_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with tempfile.TemporaryDirectory() as download_dir:
+        listener.run(gpg,
+                     download_dir,
+                     args.dest,
+                     args.interface,
+                     ApiChannel.USER.value,
+                     plaintext=not args.encrypt,
+                     save_raw=False,
+                     no_save=True)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Include the CPU time of the gpg processes used for decryption
+    stats['rx_cpu'] = time.thread_time() - t_cpu + \
+        (children.ru_utime - t_cpu_children.ru_utime) + \
+        (children.ru_stime - t_cpu_children.ru_stime)
+
+
+def run(args, gpg):
+    all_pkts = gen_messages(args, gpg)
+    n_bytes = args.n_msgs * args.msg_size
+
+    # Receiver
+    rx_queue = queue.Queue()
+    listener = ApiListener(recv_queue=rx_queue, recv_timeout=1)
+    stats = {'tx_pkts': 0, 'tx_cpu': 0, 'rx_cpu': 0}
+    rx_thread = threading.Thread(target=receive,
+                                 args=(listener, gpg, args, stats),
+                                 daemon=True)
+    rx_thread.start()
+    listener.recv_loop_ready.wait()
+
+    # Transmitter
+    sock = net.UdpSock(args.dest, args.interface, mcast_rx=False)
+    sock.set_mcast_tx_opts()
+    if (args.gso and not sock.enable_gso()):
+        print("UDP GSO not supported on this system")
+    t_sent = {}
+    t_start = time.monotonic()
+    tx_thread = threading.Thread(target=transmit,
+                                 args=(args, sock, all_pkts, t_sent, stats))
+    tx_thread.start()
+
+    # Collect the decoded messages until all of them are received or the
+    # reception times out after the end of the transmission
+    t_decoded = {}
+    while (len(t_decoded) < args.n_msgs):
+        timeout = None if tx_thread.is_alive() else args.drain
+        try:
+            data = rx_queue.get(timeout=timeout or 1)
+        except queue.Empty:
+            if (tx_thread.is_alive()):
+                continue
+            break
+        idx, = struct.unpack_from(MSG_ID_FMT, data)
+        t_decoded[idx] = time.monotonic()
+
+    tx_thread.join()
+    listener.stop()
+    rx_thread.join()
+
+    n_rx = len(t_decoded)
+    duration = (max(t_decoded.values()) - t_start) if n_rx else float('nan')
+    latencies = [1e3 * (t_decoded[i] - t_sent[i]) for i in t_decoded]
+    return {
+        'n_msgs': args.n_msgs,
+        'n_decoded': n_rx,
+        'tx_pkts': stats['tx_pkts'],
+        'kernel_drops': listener.kernel_drops,
+        'msgs_per_sec': n_rx / duration,
+        'mbytes_per_sec': n_rx * args.msg_size / duration / 1e6,
+        'offered_mbytes': n_bytes / 1e6,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else float('nan')
+        },
+        'tx_cpu_ms_per_msg': 1e3 * stats['tx_cpu'] / args.n_msgs,
+        'rx_cpu_ms_per_msg': 1e3 * stats['rx_cpu'] / max(n_rx, 1)
+    }
+
+
+def print_results(res):
+    print("Decoded messages:   {} / {}".format(res['n_decoded'],
+                                               res['n_msgs']))
+    print("Kernel Rx drops:    {}".format(res['kernel_drops']))
+    print("Throughput:         {:.1f} msgs/s, {:.3f} MB/s".format(
+        res['msgs_per_sec'], res['mbytes_per_sec']))
+    print("Decoding latency:   p50 {p50:.2f} ms, p90 {p90:.2f} ms, "
+          "p99 {p99:.2f} ms, max {max:.2f} ms".format(**res['latency_ms']))
+    print("CPU per message:    Tx {:.3f} ms, Rx {:.3f} ms".format(
+        res['tx_cpu_ms_per_msg'], res['rx_cpu_ms_per_msg']))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--dest',
+                        default="239.0.0.253:4433",
+                        help="Multicast address in ip:port format")
+    parser.add_argument('-i',
+                        '--interface',
+                        default="lo",
+                        help="Network interface")
+    parser.add_argument('-n',
+                        '--n-msgs',
+                        type=int,
+                        default=200,
+                        help="Number of messages")
+    parser.add_argument('-s',
+                        '--msg-size',
+                        type=int,
+                        default=10000,
+                        help="Size of each message in bytes")
+    parser.add_argument('--encrypt',
+                        action='store_true',
+                        default=False,
+                        help="Encrypt the messages with a temporary GPG key")
+    parser.add_argument('--fec',
+                        action='store_true',
+                        default=False,
+                        help="Encode the messages with FEC")
+    parser.add_argument('--fec-overhead',
+                        type=float,
+                        default=0.1,
+                        help="FEC overhead")
+    parser.add_argument('--bitrate',
+                        type=float,
+                        default=20000,
+                        help="Transmit bit rate in kbps (0 for no pacing). "
+                        "Without pacing, the socket buffers may overflow.")
+    parser.add_argument('--burst',
+                        type=int,
+                        default=1,
+                        help="Maximum number of packets sent back-to-back")
+    parser.add_argument('--gso',
+                        action='store_true',
+                        default=False,
+                        help="Send the bursts using UDP GSO")
+    parser.add_argument('--loss',
+                        type=float,
+                        default=0,
+                        help="Packet loss probability")
+    parser.add_argument('--reorder',
+                        type=float,
+                        default=0,
+                        help="Probability of displacing each packet")
+    parser.add_argument('--reorder-depth',
+                        type=int,
+                        default=8,
+                        help="Maximum displacement of a reordered packet")
+    parser.add_argument('--drain',
+                        type=float,
+                        default=2,
+                        help="Time in seconds to wait for pending messages "
+                        "after the end of the transmission")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--json',
+                        metavar='FILE',
+                        help="Save the results in JSON format to this file, "
+                        "e.g., for comparison across revisions")
+    args = parser.parse_args()
+
+    if (args.fec and not fec_supported):
+        parser.error("FEC support requires the zfec package")
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as gpghome:
+        gpg = None
+        if (args.encrypt):
+            gpg = Gpg(gpghome)
+            gpg.create_keys("Benchmark", "benchmark@localhost", "",
+                            GPG_PASSPHRASE)
+        res = run(args, gpg)
+
+    res['config'] = {
+        k: v
+        for k, v in vars(args).items() if k not in ['json', 'dest']
+    }
+    print_results(res)
+    if (args.json):
+        with open(args.json, 'w') as fd:
+            json.dump(res, fd, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Loopback benchmark of the UDP transmission with and without GSO
+
+Sends Blocksat packets over the loopback interface using one system call per
+packet and using UDP generic segmentation offload (GSO), and reports the
+number of packets sent per second of CPU time (i.e., packets/s per core).
+
+"""
+import os
+import sys
+import time
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from blocksatcli.api import net  # noqa: E402
+from blocksatcli.api.pkt import BlocksatPktHandler  # noqa: E402
+
+
+def run(sock, raw_pkts, burst, duration):
+    """Send the packets repeatedly for the given duration
+
+    Returns:
+        Tuple with the number of packets sent and the CPU time in seconds.
+
+    """
+    bursts = [raw_pkts[i:i + burst] for i in range(0, len(raw_pkts), burst)]
+    n_pkts = 0
+    s_wall = time.monotonic()
+    s_cpu = time.process_time()
+    while (time.monotonic() - s_wall < duration):
+        for pkts in bursts:
+            sock.send_many(pkts)
+        n_pkts += len(raw_pkts)
+    return n_pkts, time.process_time() - s_cpu
+
+
+def main():
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--dest',
+                        default="239.0.0.2:4433",
+                        help="Destination address in ip:port format")
+    parser.add_argument('-i',
+                        '--interface',
+                        default="lo",
+                        help="Network interface")
+    parser.add_argument('--burst',
+                        type=int,
+                        default=net.UDP_MAX_SEGMENTS,
+                        help="Number of packets per burst")
+    parser.add_argument('--msg-size',
+                        type=int,
+                        default=2**20,
+                        help="Size of the API message in bytes")
+    parser.add_argument('-t',
+                        '--duration',
+                        type=float,
+                        default=5,
+                        help="Duration of each run in seconds")
+    args = parser.parse_args()
+
+    handler = BlocksatPktHandler()
+    handler.split(os.urandom(args.msg_size), 1, 1)
+    raw_pkts = [pkt.pack() for pkt in handler.get_frags(1)]
+
+    sock = net.UdpSock(args.dest, args.interface, mcast_rx=False)
+    sock.set_mcast_tx_opts()
+
+    modes = [('sendto', False)]
+    if sock.enable_gso():
+        modes.append(('gso', True))
+    else:
+        print("UDP GSO not supported on this system")
+
+    print("{:<8} {:>12} {:>16}".format("Mode", "pkts/s", "pkts/s per core"))
+    for label, gso in modes:
+        sock.gso = gso
+        n_pkts, cpu_time = run(sock, raw_pkts, args.burst, args.duration)
+        print("{:<8} {:>12.0f} {:>16.0f}".format(label, n_pkts / args.duration,
+                                                 n_pkts / cpu_time))
+
+
+if __name__ == '__main__':
+    main()
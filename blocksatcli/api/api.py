@@ -1,26 +1,43 @@
 """Blocksat API"""
+import hashlib
 import json
 import logging
 import os
 import shlex
 import subprocess
+import tempfile
 import textwrap
+import time
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from shutil import which
 from typing import Optional
 
+import requests
+
 from .. import config as blocksatcli_config
 from .. import defs
 from . import bidding
 from . import msg as api_msg
 from . import net
+from . import plugins as api_plugins
+from .capture import replay_capture
 from .demorx import DemoRx
 from .gpg import Gpg, config_keyring
-from .listen import ApiListener
-from .order import (API_CHANNELS, ORDER_QUEUES, ORDER_STATUS,
-                    PAID_API_CHANNELS, SENDABLE_API_CHANNELS, ApiChannel,
-                    ApiOrder)
+from .hooks import (DEFAULT_CONCURRENCY, DEFAULT_QUEUE_SIZE, OVERFLOW_POLICIES,
+                    SPILL_FILE, HookExecutor)
+from .listen import RCVBUF_DURATION, ApiListener
+from .mockserver import MockApiServer
+from .order import (API_CHANNELS, FINAL_ORDER_STATUS, ORDER_QUEUES,
+                    ORDER_STATUS, PAID_API_CHANNELS, SENDABLE_API_CHANNELS,
+                    ApiChannel, ApiOrder, OrderTracker, record_tx_logs)
 from .pkt import calc_ota_msg_len
+from .pktcache import PktCache
+from .pubsub import MsgPublisher
+from .relay import (DEFAULT_BATCH, DEFAULT_REPORT_INTERVAL, ApiRelay,
+                    open_dest_sock)
+from .writer import FSYNC_POLICIES, DownloadWriter
 
 logger = logging.getLogger(__name__)
 
@@ -57,51 +74,63 @@ def send(args, gpg: Optional[Gpg] = None, capture_error=False):
         gpg.prompt_passphrase('Password to private key used for message '
                               'signing: ')
 
-    # File or text message to send over satellite
-    if (args.file is None):
-        if (args.message is None):
-            data = input("Type a message: ").encode()
-            print()
+    msg_opts = {
+        'plaintext': args.plaintext,
+        'encapsulate': (not args.send_raw),
+        'sign': args.sign,
+        'fec': args.fec,
+        'gpg': gpg,
+        'recipient': args.recipient,
+        'trust': args.trust,
+        'sign_key': args.sign_key,
+        'fec_overhead': args.fec_overhead
+    }
+
+    if (args.batch is not None):
+        return send_batch(args, msg_opts, server_addr)
+
+    with ExitStack() as stack:
+        # File or text message to send over satellite. Files are processed
+        # through temporary files and uploaded in chunks so that large files
+        # are never fully loaded in memory.
+        if (args.file is None):
+            if (args.message is None):
+                data = input("Type a message: ").encode()
+                print()
+            else:
+                data = args.message.encode()
+
+            assert (len(data) > 0), "Empty message"
+
+            # Put text within an API message
+            msg = api_msg.generate(data, **msg_opts)
+            msg_len = msg.get_length()
+            msg_data = msg.get_data()
         else:
-            data = args.message.encode()
-        basename = None
-    else:
-        basename = os.path.basename(args.file)
-        with open(args.file, 'rb') as f:
-            data = f.read()
-
-    assert (len(data) > 0), \
-        "Empty {}".format("file" if args.file else "message")
-
-    # Put file or text within an API message
-    msg = api_msg.generate(data,
-                           filename=basename,
-                           plaintext=args.plaintext,
-                           encapsulate=(not args.send_raw),
-                           sign=args.sign,
-                           fec=args.fec,
-                           gpg=gpg,
-                           recipient=args.recipient,
-                           trust=args.trust,
-                           sign_key=args.sign_key,
-                           fec_overhead=args.fec_overhead)
-
-    # Actual number of bytes used for satellite transmission
-    tx_len = calc_ota_msg_len(msg.get_length())
-    logger.info("Satellite transmission will use %d bytes" % (tx_len))
-
-    # Ask user for bid or take it from argument
-    if (args.channel in PAID_API_CHANNELS):
-        bid = args.bid if args.bid else bidding.ask_bid(tx_len)
-    else:
-        bid = None
+            assert (os.path.getsize(args.file) > 0), "Empty file"
 
-    # API transmission order
-    order = ApiOrder(server_addr,
-                     tls_cert=args.tls_cert,
-                     tls_key=args.tls_key,
-                     capture_error=capture_error)
-    res = order.send(msg.get_data(), bid, args.regions, args.channel)
+            # Put file within an API message
+            tmp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            msg_path = api_msg.generate_file(args.file, tmp_dir, **msg_opts)
+            msg_len = os.path.getsize(msg_path)
+            msg_data = stack.enter_context(open(msg_path, 'rb'))
+
+        # Actual number of bytes used for satellite transmission
+        tx_len = calc_ota_msg_len(msg_len)
+        logger.info("Satellite transmission will use %d bytes" % (tx_len))
+
+        # Ask user for bid or take it from argument
+        if (args.channel in PAID_API_CHANNELS):
+            bid = args.bid if args.bid else bidding.ask_bid(tx_len)
+        else:
+            bid = None
+
+        # API transmission order
+        order = ApiOrder(server_addr,
+                         tls_cert=args.tls_cert,
+                         tls_key=args.tls_key,
+                         capture_error=capture_error)
+        res = order.send(msg_data, bid, args.regions, args.channel)
 
     # Only the paid API channels return a Lightning invoice for the
     # transmission order
@@ -129,10 +158,185 @@ def send(args, gpg: Optional[Gpg] = None, capture_error=False):
         pass
 
 
+def _get_batch_files(path):
+    """Get the list of files to be sent in batch mode
+
+    Args:
+        path : Directory or manifest file. If a directory, all regular files
+               from the directory (non-recursively) are sent in alphabetical
+               order. If a manifest, each line is the path to a file to be
+               sent. Relative paths are resolved relative to the manifest's
+               directory, while empty lines and lines starting with "#" are
+               ignored.
+
+    Returns:
+        List of file paths.
+
+    """
+    if (os.path.isdir(path)):
+        return [
+            os.path.join(path, f) for f in sorted(os.listdir(path))
+            if os.path.isfile(os.path.join(path, f))
+        ]
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    files = []
+    with open(path, 'r') as fd:
+        for line in fd:
+            line = line.strip()
+            if (not line or line.startswith('#')):
+                continue
+            files.append(os.path.join(base_dir, os.path.expanduser(line)))
+    return files
+
+
+def _send_batch_item(path, args, msg_opts, server_addr, session):
+    """Generate and submit the transmission order of a batch file
+
+    Returns:
+        Dictionary with the result of the file submission.
+
+    """
+    res = {'file': path, 'tx_len': None, 'bid': None, 'order': None}
+    try:
+        assert (os.path.getsize(path) > 0), "Empty file"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            msg_path = api_msg.generate_file(path, tmp_dir, **msg_opts)
+            res['tx_len'] = calc_ota_msg_len(os.path.getsize(msg_path))
+
+            # The same bid applies to all messages, if defined. Otherwise,
+            # use the suggested bid for each message.
+            if (args.channel in PAID_API_CHANNELS):
+                res['bid'] = args.bid if args.bid else \
+                    bidding.suggest_bid(res['tx_len'])
+
+            order = ApiOrder(server_addr,
+                             tls_cert=args.tls_cert,
+                             tls_key=args.tls_key,
+                             capture_error=True,
+                             session=session)
+            with open(msg_path, 'rb') as fd:
+                order.send(fd,
+                           res['bid'],
+                           args.regions,
+                           args.channel,
+                           verbose=False)
+        res['order'] = order
+    except SystemExit as e:
+        # API error captured by the order object
+        res['error'] = str(e.code)
+    except Exception as e:
+        # Capture any failure (e.g., an unusable GPG key) so that it does
+        # not prevent the other orders from being recorded
+        res['error'] = str(e) or e.__class__.__name__
+    return res
+
+
+def _print_batch_summary(results):
+    """Print the summary table of a batch transmission"""
+    name_len = max([len(os.path.basename(r['file']))
+                    for r in results] + [len("File")])
+    row_fmt = "{:<" + str(name_len) + "}  {:>10}  {:>12}  {:<36}  {}"
+    print(
+        row_fmt.format("File", "Size (B)", "Bid (msat)", "UUID",
+                       "Lightning Invoice"))
+    for r in results:
+        order = r['order']
+        if (order is None):
+            uuid = "-"
+            status = "Error: {}".format(r['error'])
+        else:
+            uuid = order.uuid
+            status = order.ln_invoice["payreq"] if order.ln_invoice else "-"
+        print(
+            row_fmt.format(os.path.basename(r['file']),
+                           r['tx_len'] if r['tx_len'] is not None else "-",
+                           r['bid'] if r['bid'] is not None else "-", uuid,
+                           status))
+
+    n_sent = len([r for r in results if r['order'] is not None])
+    print("\n{} of {} transmission orders submitted".format(
+        n_sent, len(results)))
+
+
+def send_batch(args, msg_opts, server_addr):
+    """Send multiple files over satellite
+
+    Generates the API messages on a pool of worker threads and submits the
+    corresponding transmission orders over a single HTTP session, with at most
+    args.batch_workers orders in progress at a time. The transmission records
+    are saved on the tx log at once when all orders are submitted. Unlike the
+    single-file mode, it does not prompt for bids and does not wait for the
+    transmissions.
+
+    Args:
+        args        : Parsed "api send" arguments.
+        msg_opts    : Keyword arguments for the API message generation.
+        server_addr : API server address.
+
+    Returns:
+        List of dictionaries with the result of each file submission.
+
+    """
+    files = _get_batch_files(args.batch)
+    if (len(files) == 0):
+        raise ValueError("No files found in {}".format(args.batch))
+
+    # Look up the GPG keys once for all files
+    msg_opts = dict(msg_opts)
+    plaintext = msg_opts.get('plaintext', True)
+    sign = msg_opts.get('sign', False)
+    if (not plaintext or sign):
+        msg_opts['recipient'], msg_opts['sign_key'] = api_msg.resolve_keys(
+            msg_opts['gpg'], plaintext, sign, msg_opts.get('recipient'),
+            msg_opts.get('sign_key'))
+        msg_opts['keys_resolved'] = True
+
+    logger.info("Sending {} files with {} workers".format(
+        len(files), args.batch_workers))
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.batch_workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    with session, ThreadPoolExecutor(args.batch_workers) as executor:
+        results = list(
+            executor.map(
+                lambda path: _send_batch_item(path, args, msg_opts,
+                                              server_addr, session), files))
+
+    orders = [r['order'] for r in results if r['order'] is not None]
+    record_tx_logs(args.cfg_dir, orders)
+
+    # Execute arbitrary command with each Lightning invoice
+    if (args.invoice_exec):
+        for order in orders:
+            if (order.ln_invoice is None):
+                continue
+            cmd = shlex.split(
+                args.invoice_exec.replace("{}", order.ln_invoice["payreq"]))
+            logger.debug("Execute:\n> {}".format(" ".join(cmd)))
+            subprocess.run(cmd)
+
+    _print_batch_summary(results)
+    return results
+
+
 def listen(args,
            listen_loop: Optional[ApiListener] = None,
-           gpg: Optional[Gpg] = None):
-    """Listen to API messages received over satellite"""
+           gpg: Optional[Gpg] = None,
+           pkt_source=None):
+    """Listen to API messages received over satellite
+
+    Args:
+        args        : Parsed "api listen" or "api replay" arguments.
+        listen_loop : Optional ApiListener object.
+        gpg         : Optional Gpg object.
+        pkt_source  : Optional iterable with the packets to process instead
+                      of the packets received over the network.
+
+    """
     gnupghome = os.path.join(args.cfg_dir, args.gnupghome)
 
     if (args.save_dir is not None):
@@ -211,7 +415,9 @@ def listen(args,
             gpg = None
 
     # Define the interface used to listen for messages
-    if (args.interface):
+    if (pkt_source is not None):
+        interface = None
+    elif (args.interface):
         interface = args.interface
     elif (args.demo):
         interface = "lo"
@@ -219,7 +425,8 @@ def listen(args,
         # Infer the interface based on the user's setup
         user_info = blocksatcli_config.read_cfg_file(args.cfg, args.cfg_dir)
         interface = blocksatcli_config.get_net_if(user_info)
-    logger.info("Listening on interface: {}".format(interface))
+    if (interface is not None):
+        logger.info("Listening on interface: {}".format(interface))
 
     if not args.no_save:
         logger.info("Downloads will be saved at: {}".format(download_dir))
@@ -236,6 +443,55 @@ def listen(args,
         logger.warning("To enable it, please install the 'zfec' package or "
                        "'blocksat-cli[fec]'.")
 
+    # In-process consumers of the decoded messages
+    plugin_funcs = list(api_plugins.load_entry_point_plugins().values())
+    for spec in (args.plugin or []):
+        try:
+            plugin_funcs.append(api_plugins.load_plugin(spec))
+        except ValueError as e:
+            logger.error(str(e))
+            return
+
+    # Local distribution of the decoded messages
+    if (args.pubsub):
+        try:
+            publisher = MsgPublisher(args.pubsub,
+                                     int(args.pubsub_buffer * 2**20))
+        except OSError as e:
+            logger.error("Failed to open the socket at {}: {}".format(
+                args.pubsub, e))
+            return
+        plugin_funcs.append(publisher.publish)
+    else:
+        publisher = None
+
+    if (plugin_funcs):
+        logger.info("Feeding the messages to {} plugin(s)".format(
+            len(plugin_funcs)))
+        plugins = api_plugins.PluginPool(plugin_funcs,
+                                         workers=args.plugin_workers,
+                                         queue_size=args.plugin_queue)
+    else:
+        plugins = None
+
+    writer = DownloadWriter(fsync=args.fsync,
+                            background=args.background_writer)
+
+    # Executor of the --exec commands. Without --exec, the commands spilled
+    # by a previous session stay on disk until --exec is used again.
+    if (args.exec):
+        spill_path = os.path.join(args.cfg_dir, "api", SPILL_FILE)
+        if (args.hook_overflow == 'spill'):
+            os.makedirs(os.path.dirname(spill_path), exist_ok=True)
+        hook_executor = HookExecutor(concurrency=args.hook_concurrency,
+                                     queue_size=args.hook_queue,
+                                     timeout=args.hook_timeout,
+                                     overflow=args.hook_overflow,
+                                     spill_path=spill_path,
+                                     tag=args.exec)
+    else:
+        hook_executor = None
+
     # Listen continuously
     if (not listen_loop):
         listen_loop = ApiListener()
@@ -255,7 +511,69 @@ def listen(args,
                     server_addr=server_addr,
                     tls_cert=args.tls_cert,
                     tls_key=args.tls_key,
-                    region=args.region)
+                    region=args.region,
+                    capture=args.capture,
+                    pkt_source=pkt_source,
+                    rx_rate=args.rx_rate * 1e3 if args.rx_rate else None,
+                    trace=args.trace,
+                    metrics_port=args.metrics_port,
+                    writer=writer,
+                    hook_executor=hook_executor,
+                    plugins=plugins)
+    writer.close()
+    if (plugins is not None):
+        plugins.close()
+    if (publisher is not None):
+        publisher.close()
+    if (hook_executor is not None):
+        if (hook_executor.get_backlog() > 0):
+            logger.info("Waiting for {} pending hook command(s)".format(
+                hook_executor.get_backlog()))
+        hook_executor.close()
+
+
+def replay(args):
+    """Replay a capture of API packets through the listener pipeline"""
+    if (not os.path.exists(args.file)):
+        logger.error("File {} does not exist".format(args.file))
+        return
+    listen(args, pkt_source=replay_capture(args.file, args.speed))
+
+
+def relay(args):
+    """Relay the received API packets to other hosts"""
+    if (args.interface):
+        interfaces = args.interface
+    else:
+        # Infer the interface based on the user's setup
+        user_info = blocksatcli_config.read_cfg_file(args.cfg, args.cfg_dir)
+        interfaces = [blocksatcli_config.get_net_if(user_info)]
+
+    # One input socket per receiving interface
+    in_socks = []
+    for interface in interfaces:
+        logger.info("Listening on interface: {}".format(interface))
+        sock = net.UdpSock(args.sock_addr, interface)
+        if (args.rx_rate):
+            sock.set_rcvbuf(int(args.rx_rate * 1e3 / 8 * RCVBUF_DURATION))
+        in_socks.append(sock)
+
+    out_socks = [
+        open_dest_sock(dest, args.tx_interface, args.ttl, args.dscp, args.gso)
+        for dest in args.dest
+    ]
+
+    api_relay = ApiRelay(in_socks,
+                         out_socks,
+                         channel=args.channel,
+                         dedupe=(not args.no_dedupe),
+                         batch=args.batch)
+    try:
+        api_relay.run(report_interval=args.report_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api_relay.log_stats()
 
 
 def bump(args, capture_error=False):
@@ -294,6 +612,11 @@ def get(args, verbose=True, capture_error=False):
     order.get(args.uuid, args.auth_token)
     if verbose:
         print(json.dumps(order.order, indent=4))
+    if (args.follow):
+        follow_orders(args, [dict(order.order, uuid=order.uuid)],
+                      auth_token=order.auth_token,
+                      channel=order.order.get('channel',
+                                              ApiChannel.USER.value))
     return order.order
 
 
@@ -306,9 +629,44 @@ def list_orders(args, verbose=True, capture_error=False):
     res = order.get_orders(args.status, args.channel, args.queue, args.limit)
     if verbose:
         print(json.dumps(res, indent=4))
+    if (args.follow):
+        follow_orders(args, res, channel=args.channel)
     return res
 
 
+def follow_orders(args, orders, auth_token=None, channel=None):
+    """Print the state changes of the given orders until they are final
+
+    Args:
+        args       : Parsed "api get" or "api list" arguments.
+        orders     : List of order dictionaries.
+        auth_token : Authentication token, if following a single order.
+        channel    : API channel of the orders.
+
+    """
+    orders = [x for x in orders if x.get('status') not in FINAL_ORDER_STATUS]
+    if (len(orders) == 0):
+        return
+
+    tracker = OrderTracker(get_server_addr(args.net, args.server),
+                           channel=channel or ApiChannel.USER.value,
+                           callback=lambda uuid, order: print("{}: {}".format(
+                               uuid, order['status'])),
+                           tls_cert=args.tls_cert,
+                           tls_key=args.tls_key)
+    for order in orders:
+        tracker.add(order['uuid'], auth_token, order=order)
+
+    logger.info("Following {} order(s)...".format(len(orders)))
+    tracker.start()
+    try:
+        tracker.wait(FINAL_ORDER_STATUS)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracker.stop()
+
+
 def delete(args, capture_error=False):
     """Cancel an API order"""
     server_addr = get_server_addr(args.net, args.server)
@@ -333,8 +691,20 @@ def demo_rx(args):
     for interface in args.interface:
         sock = net.UdpSock(args.dest, interface, mcast_rx=False)
         sock.set_mcast_tx_opts(args.ttl, args.dscp)
+        if (args.gso and not sock.enable_gso()):
+            logger.warning("UDP GSO is not supported on this system. "
+                           "Sending one packet at a time.")
         socks.append(sock)
 
+    # On-disk packet cache, with a separate directory for each server, given
+    # that the sequence numbers are specific to each server
+    pkt_cache = None
+    if (args.disk_cache > 0):
+        cache_dir = os.path.join(
+            args.cfg_dir, "api", "demorx-cache",
+            hashlib.sha256(server_addr.encode()).hexdigest()[:16])
+        pkt_cache = PktCache(cache_dir, int(args.disk_cache * 2**20))
+
     rx = DemoRx(server_addr,
                 socks,
                 args.bitrate,
@@ -344,10 +714,233 @@ def demo_rx(args):
                 args.tls_cert,
                 args.tls_key,
                 args.poll,
-                sock_by_region=args.if_by_region)
+                sock_by_region=args.if_by_region,
+                burst=args.burst,
+                prefetch_size=int(args.prefetch_cache * 2**20),
+                pkt_cache=pkt_cache)
     rx.run()
 
 
+def mock_server(args):
+    """Run the mock Satellite API server"""
+    server = MockApiServer(latency=args.latency * 1e-3,
+                           pay_delay=args.pay_delay,
+                           tx_rate=args.tx_rate,
+                           max_queued=args.max_queued)
+    url = server.start(args.bind, args.port)
+    logger.info("Mock Satellite API server listening on {}".format(url))
+    try:
+        while (True):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+def add_rx_decode_args(parser):  # pragma: no cover
+    """Add the arguments controlling the decoding of received API messages
+
+    Args:
+        parser : Parser of the "api listen" or "api replay" command.
+
+    """
+    parser.add_argument(
+        '-c',
+        '--channel',
+        type=int,
+        default=ApiChannel.USER.value,
+        choices=API_CHANNELS,
+        help="Listen to a specific API transmission channel. If set to 0, "
+        "listen to all channels. By default, listen to user transmissions, "
+        "which are sent on channel 1")
+    parser.add_argument(
+        '--save-raw',
+        default=False,
+        action="store_true",
+        help="Save the raw decrypted data into the download directory while "
+        "ignoring the existence of a data encapsulation structure")
+    parser.add_argument(
+        '--plaintext',
+        default=False,
+        action="store_true",
+        help="Do not try to decrypt the incoming messages. Instead, assume "
+        "they are in plaintext format and save them as files named with "
+        "timestamps. Note this operation mode saves all incoming messages, "
+        "including those broadcast by other users. In contrast, the default "
+        "mode (with decryption) only saves the successfully decrypted "
+        "messages.")
+    parser.add_argument(
+        '--sender',
+        default=None,
+        help="Public key fingerprint of a target sender used to filter the "
+        "incoming messages. When specified, the application processes only "
+        "the messages that are digitally signed by the selected sender, "
+        "including clearsigned messages.")
+    parser.add_argument('--no-password',
+                        default=False,
+                        action="store_true",
+                        help="Set to access GPG keyring without a password")
+    parser.add_argument(
+        '--echo',
+        default=False,
+        action='store_true',
+        help="Print the contents of all incoming text messages to the "
+        "console, as long as these messages are decodable in UTF-8")
+    stdout_exec_arg_group = parser.add_mutually_exclusive_group()
+    stdout_exec_arg_group.add_argument(
+        '--stdout',
+        default=False,
+        action='store_true',
+        help="Serialize the received data to stdout instead of saving on a "
+        "file")
+    stdout_exec_arg_group.add_argument(
+        '--no-save',
+        default=False,
+        action='store_true',
+        help="Do not save the files decoded from the received API messages")
+    stdout_exec_arg_group.add_argument(
+        '--exec',
+        help="Execute arbitrary shell command for each downloaded file. "
+        "Use the magic string \'{}\' to represent the file path within the "
+        "command. For instance, run \"--exec \'cat {}\'\" to print every "
+        "incoming file to stdout. For security, this option must be used in "
+        "conjunction with the --sender option to limit the execution of the "
+        "specified command to digitally signed messages from a specified "
+        "sender only. See option --insecure for an alternative.")
+    parser.add_argument(
+        "--save-dir",
+        default=None,
+        help="Directory where the decoded messages are saved. When not "
+        "specified, defaults to the \"api/downloads\" subdirectory within the "
+        "configuration directory (by default at \"~/.blocksat/\").")
+    parser.add_argument(
+        '--fsync',
+        choices=FSYNC_POLICIES,
+        default='batch',
+        help="Policy for syncing the saved files to disk. With \"file\", "
+        "sync each file before moving on. With \"batch\", sync the files "
+        "saved within a short interval together. With \"none\", let the "
+        "operating system decide when to sync. The files are always written "
+        "atomically, so partially written files are never visible.")
+    parser.add_argument(
+        '--background-writer',
+        default=False,
+        action='store_true',
+        help="Save the files on a background thread so that the reception "
+        "does not wait for the disk")
+    parser.add_argument(
+        '--insecure',
+        default=False,
+        action="store_true",
+        help="Run the --exec option while receiving messages from any sender. "
+        "In this case, any successfully decrypted message (i.e., any message) "
+        "encrypted using your public key will trigger the --exec command, "
+        "which is considered insecure. Use at your own risk and avoid unsafe "
+        "commands.")
+    parser.add_argument(
+        '--plugin',
+        action='append',
+        metavar='MODULE:CALLABLE',
+        help="Python callable to feed with each decoded message in-process, "
+        "given as \"module:callable\". The callable receives a read-only "
+        "memoryview of the message data and a dictionary with its metadata "
+        "(channel, sequence number, verified signer, file name, and saved "
+        "path). With --background-writer, the saved file may still be in "
+        "flight when the callable runs. Can be used multiple times. The "
+        "plugins installed under the "
+        "\"{}\" entry point group are loaded automatically.".format(
+            api_plugins.ENTRY_POINT_GROUP))
+    parser.add_argument(
+        '--plugin-workers',
+        type=int,
+        default=api_plugins.DEFAULT_WORKERS,
+        help="Number of threads calling the plugins. With more than one "
+        "thread, the plugins may consume the messages out of order.")
+    parser.add_argument(
+        '--plugin-queue',
+        type=int,
+        default=api_plugins.DEFAULT_QUEUE_SIZE,
+        help="Maximum number of messages waiting for the plugins. When "
+        "full, the reception waits for the plugins.")
+    parser.add_argument(
+        '--pubsub',
+        metavar='PATH',
+        default=None,
+        help="Path to a Unix socket on which to publish the decoded messages "
+        "to local subscribers. Each subscriber selects the channels of "
+        "interest and receives each message framed with its metadata, so "
+        "that multiple local applications can consume the messages decoded "
+        "by a single listener.")
+    parser.add_argument(
+        '--pubsub-buffer',
+        type=float,
+        default=16,
+        help="Maximum amount of data in MB buffered for each subscriber of "
+        "the --pubsub socket. Subscribers that fall behind by more than "
+        "this amount are disconnected.")
+    parser.add_argument(
+        '--hook-concurrency',
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Maximum number of --exec commands running concurrently. The "
+        "commands run in the background so that the "
+        "reception does not wait for them")
+    parser.add_argument(
+        '--hook-queue',
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Maximum number of --exec commands waiting to run")
+    parser.add_argument(
+        '--hook-timeout',
+        type=float,
+        default=None,
+        help="Timeout in seconds for each --exec command or gossip snapshot "
+        "load")
+    parser.add_argument(
+        '--hook-overflow',
+        choices=OVERFLOW_POLICIES,
+        default='block',
+        help="What to do with a new command when the queue of --exec "
+        "commands is full. With \"block\", wait for room in the queue, "
+        "which stalls the reception. With \"drop-oldest\", discard the "
+        "oldest command waiting to run. With \"spill\", save the command "
+        "on disk (within the configuration directory) and run it later, even "
+        "if the application restarts. On restart, the commands saved under a "
+        "different --exec option are discarded.")
+    btc_src_gossip_arg_group = parser.add_mutually_exclusive_group()
+    btc_src_gossip_arg_group.add_argument(
+        '--gossip',
+        default=False,
+        action="store_true",
+        help="Configure the application to receive Lightning gossip snapshots "
+        "and load them using the historian-cli application. This argument "
+        "overrides the following options: 1) --plaintext (enabled); and 2) "
+        "--channel (set to {}).".format(ApiChannel.GOSSIP.value))
+    btc_src_gossip_arg_group.add_argument(
+        '--btc-src',
+        default=False,
+        action="store_true",
+        help="Configure the application to receive API messages carrying the "
+        "Bitcoin Satellite and Bitcoin Core source codes. This argument "
+        "overrides the following options: 1) --plaintext (enabled); and 2) "
+        "--channel (set to {}).".format(ApiChannel.BTC_SRC.value))
+    parser.add_argument(
+        '--historian-path',
+        default=None,
+        help="Path to the historian-cli application. If not set, look for "
+        "historian-cli globally")
+    parser.add_argument(
+        '--historian-destination',
+        default=None,
+        help="Destination for gossip snapshots, formatted as "
+        "[nodeid]@[ipaddress]:[port]. If not set, historian-cli attempts to "
+        "discover the destination automatically. This parameter is provided "
+        "as a positional argument of command \'historian-cli snapshot load\', "
+        "which is called for each downloaded file in gossip mode (i.e., when "
+        "argument --gossip is set).")
+
+
 def subparser(subparsers):  # pragma: no cover
     """Subparser for usb command"""
     p = subparsers.add_parser('api',
@@ -420,6 +1013,14 @@ def subparser(subparsers):  # pragma: no cover
     msg_group.add_argument('-m',
                            '--message',
                            help='Text message to send through the API')
+    msg_group.add_argument(
+        '--batch',
+        metavar='DIR|MANIFEST',
+        help="Send multiple files through the API. Takes either a directory, "
+        "whose files are all sent, or a manifest file listing one file path "
+        "per line. In this mode, the bid given by --bid applies to every "
+        "file, otherwise the suggested bid is used for each file. Also, the "
+        "command returns after submitting the orders, as with --no-wait")
     p2.add_argument('--bid',
                     default=None,
                     type=int,
@@ -497,6 +1098,12 @@ def subparser(subparsers):  # pragma: no cover
         action="store_true",
         help="Return immediately after submitting an API transmission order. "
         "Do not wait for the payment and transmission confirmations")
+    p2.add_argument(
+        '--batch-workers',
+        default=4,
+        type=int,
+        help="Number of files processed and transmission orders submitted "
+        "concurrently in batch mode")
     p2.set_defaults(func=send)
 
     # Listen
@@ -531,120 +1138,45 @@ def subparser(subparsers):  # pragma: no cover
         default=False,
         help="Use the same interface as the demo-rx tool, i.e., the loopback "
         "interface")
+    add_rx_decode_args(p3)
+    p3.add_argument('-r',
+                    '--region',
+                    choices=defs.satellite_regions,
+                    type=int,
+                    help="Coverage region for Rx confirmations")
     p3.add_argument(
-        '-c',
-        '--channel',
-        type=int,
-        default=ApiChannel.USER.value,
-        choices=API_CHANNELS,
-        help="Listen to a specific API transmission channel. If set to 0, "
-        "listen to all channels. By default, listen to user transmissions, "
-        "which are sent on channel 1")
-    p3.add_argument(
-        '--save-raw',
-        default=False,
-        action="store_true",
-        help="Save the raw decrypted data into the download directory while "
-        "ignoring the existence of a data encapsulation structure")
-    p3.add_argument(
-        '--plaintext',
-        default=False,
-        action="store_true",
-        help="Do not try to decrypt the incoming messages. Instead, assume "
-        "they are in plaintext format and save them as files named with "
-        "timestamps. Note this operation mode saves all incoming messages, "
-        "including those broadcast by other users. In contrast, the default "
-        "mode (with decryption) only saves the successfully decrypted "
-        "messages.")
-    p3.add_argument(
-        '--sender',
-        default=None,
-        help="Public key fingerprint of a target sender used to filter the "
-        "incoming messages. When specified, the application processes only "
-        "the messages that are digitally signed by the selected sender, "
-        "including clearsigned messages.")
-    p3.add_argument('--no-password',
-                    default=False,
-                    action="store_true",
-                    help="Set to access GPG keyring without a password")
-    p3.add_argument(
-        '--echo',
-        default=False,
-        action='store_true',
-        help="Print the contents of all incoming text messages to the "
-        "console, as long as these messages are decodable in UTF-8")
-    stdout_exec_arg_group = p3.add_mutually_exclusive_group()
-    stdout_exec_arg_group.add_argument(
-        '--stdout',
-        default=False,
-        action='store_true',
-        help="Serialize the received data to stdout instead of saving on a "
-        "file")
-    stdout_exec_arg_group.add_argument(
-        '--no-save',
-        default=False,
-        action='store_true',
-        help="Do not save the files decoded from the received API messages")
-    stdout_exec_arg_group.add_argument(
-        '--exec',
-        help="Execute arbitrary shell command for each downloaded file. "
-        "Use the magic string \'{}\' to represent the file path within the "
-        "command. For instance, run \"--exec \'cat {}\'\" to print every "
-        "incoming file to stdout. For security, this option must be used in "
-        "conjunction with the --sender option to limit the execution of the "
-        "specified command to digitally signed messages from a specified "
-        "sender only. See option --insecure for an alternative.")
-    p3.add_argument(
-        "--save-dir",
+        '--capture',
+        metavar='FILE',
         default=None,
-        help="Directory where the decoded messages are saved. When not "
-        "specified, defaults to the \"api/downloads\" subdirectory within the "
-        "configuration directory (by default at \"~/.blocksat/\").")
+        help="Append every received UDP packet, with its reception timestamp "
+        "and source address, to this capture file, so that the reception can "
+        "be reproduced later with the \"api replay\" command.")
     p3.add_argument(
-        '--insecure',
-        default=False,
-        action="store_true",
-        help="Run the --exec option while receiving messages from any sender. "
-        "In this case, any successfully decrypted message (i.e., any message) "
-        "encrypted using your public key will trigger the --exec command, "
-        "which is considered insecure. Use at your own risk and avoid unsafe "
-        "commands.")
-    btc_src_gossip_arg_group1 = p3.add_mutually_exclusive_group()
-    btc_src_gossip_arg_group1.add_argument(
-        '--gossip',
-        default=False,
-        action="store_true",
-        help="Configure the application to receive Lightning gossip snapshots "
-        "and load them using the historian-cli application. This argument "
-        "overrides the following options: 1) --plaintext (enabled); and 2) "
-        "--channel (set to {}).".format(ApiChannel.GOSSIP.value))
-    btc_src_gossip_arg_group1.add_argument(
-        '--btc-src',
-        default=False,
-        action="store_true",
-        help="Configure the application to receive API messages carrying the "
-        "Bitcoin Satellite and Bitcoin Core source codes. This argument "
-        "overrides the following options: 1) --plaintext (enabled); and 2) "
-        "--channel (set to {}).".format(ApiChannel.BTC_SRC.value))
+        '--rx-rate',
+        type=float,
+        default=1000,
+        help="Expected peak rate of the incoming API traffic in kbps. The UDP "
+        "receive buffer is sized to hold {} seconds of traffic at this rate, "
+        "so that the packets are not dropped while the listener is busy "
+        "decoding a message. Set to 0 to keep the system's default "
+        "buffer.".format(RCVBUF_DURATION))
     p3.add_argument(
-        '--historian-path',
+        '--trace',
+        metavar='FILE',
         default=None,
-        help="Path to the historian-cli application. If not set, look for "
-        "historian-cli globally")
+        help="Append the latency span of each received message to this file "
+        "in JSON Lines format and log the latency percentiles on exit. The "
+        "span has the arrival time of the first and last packets and the "
+        "time at which the message became decodable, was decrypted, was "
+        "saved, and had its --exec command or gossip snapshot loading "
+        "completed")
     p3.add_argument(
-        '--historian-destination',
+        '--metrics-port',
+        type=int,
         default=None,
-        help="Destination for gossip snapshots, formatted as "
-        "[nodeid]@[ipaddress]:[port]. If not set, historian-cli attempts to "
-        "discover the destination automatically. This parameter is provided "
-        "as a positional argument of command \'historian-cli snapshot load\', "
-        "which is called for each downloaded file in gossip mode (i.e., when "
-        "argument --gossip is set).")
-    p3.add_argument('-r',
-                    '--region',
-                    choices=defs.satellite_regions,
-                    type=int,
-                    help="Coverage region for Rx confirmations")
+        help="Serve the listener metrics (e.g., received packets per "
+        "channel, fragment and decoding statistics, and latency histograms) "
+        "via HTTP in Prometheus text format on this port")
     p3.set_defaults(func=listen)
 
     # Bump
@@ -758,6 +1290,36 @@ def subparser(subparsers):  # pragma: no cover
         default=1000,
         help="Maximum bit rate of the output packet stream in kbps. "
         "Set 0 to transmit as fast as the socket(s) can handle.")
+    p6.add_argument(
+        '--burst',
+        type=int,
+        default=1,
+        help="Maximum number of packets sent back-to-back. Higher values "
+        "reduce the pacing overhead at high bit rates at the expense of a "
+        "burstier packet stream.")
+    p6.add_argument(
+        '--gso',
+        default=False,
+        action='store_true',
+        help="Use UDP generic segmentation offload (GSO) to send each burst "
+        "of packets (see --burst) with a single system call. Requires Linux "
+        "4.18 or later.")
+    p6.add_argument(
+        '--prefetch-cache',
+        type=float,
+        default=64,
+        help="Capacity in MB of the cache holding the data of upcoming "
+        "orders (paid or transmitting), fetched ahead of their transmission "
+        "to avoid the download latency when the transmission starts. Set 0 "
+        "to disable prefetching.")
+    p6.add_argument(
+        '--disk-cache',
+        type=float,
+        default=0,
+        help="Capacity in MB of the on-disk cache holding the packets of the "
+        "transmitted messages, used to serve retransmissions without "
+        "downloading the messages again. The cache is kept inside the "
+        "configuration directory. Set 0 to disable the cache.")
     p6.add_argument('-e',
                     '--event',
                     choices=["transmitting", "sent"],
@@ -779,6 +1341,12 @@ def subparser(subparsers):  # pragma: no cover
                     '--auth-token',
                     default=None,
                     help="Authentication token")
+    p7.add_argument('-f',
+                    '--follow',
+                    default=False,
+                    action='store_true',
+                    help="Keep following the order and print its state "
+                    "changes until it is sent, cancelled, or expired")
     p7.set_defaults(func=get)
 
     # List orders
@@ -806,8 +1374,175 @@ def subparser(subparsers):  # pragma: no cover
                     type=int,
                     default=20,
                     help="Limit for the number of orders returned")
+    p8.add_argument('-f',
+                    '--follow',
+                    default=False,
+                    action='store_true',
+                    help="Keep following the listed orders and print their "
+                    "state changes until all of them are sent, cancelled, or "
+                    "expired")
     p8.set_defaults(func=list_orders)
 
+    # Mock server
+    p9 = subsubparsers.add_parser(
+        'mock-server',
+        description=textwrap.dedent('''\
+
+        Local mock of the Satellite API server for offline testing. Implements
+        the API endpoints used by the API apps (send, get, list, bump, delete,
+        demo-rx, and listen) with in-memory queues. The orders are paid
+        automatically and transmitted one at a time on each channel, as if
+        over a satellite link with the given bit rate. Point the API apps to
+        the mock server using the -s/--server option.
+
+        '''),
+        help='Run a local mock Satellite API server',
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    p9.add_argument('--bind',
+                    default='127.0.0.1',
+                    help="Address to which the server should bind")
+    p9.add_argument('-p', '--port', type=int, default=9292, help="Server port")
+    p9.add_argument('--latency',
+                    type=float,
+                    default=0,
+                    help="Delay in milliseconds added to every response")
+    p9.add_argument(
+        '--pay-delay',
+        type=float,
+        default=0,
+        help="Delay in seconds until each order is paid automatically. "
+        "Set a negative value to leave the orders unpaid.")
+    p9.add_argument(
+        '--tx-rate',
+        type=float,
+        default=1000,
+        help="Simulated transmission bit rate in kbps, which determines how "
+        "long each order stays in transmitting state. Set 0 for "
+        "instantaneous transmissions.")
+    p9.add_argument(
+        '--max-queued',
+        type=int,
+        default=None,
+        help="Maximum number of pending, paid, or transmitting orders on "
+        "each channel. New orders are rejected while the limit is reached.")
+    p9.set_defaults(func=mock_server)
+
+    # Replay
+    p10 = subsubparsers.add_parser(
+        'replay',
+        description="Process the UDP packets captured by the \"api listen\" "
+        "command (see option --capture) through the same message reassembly "
+        "and decoding pipeline of the listener application",
+        help="Replay a capture of received API packets",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    p10.add_argument('file', help="Capture file")
+    p10.add_argument(
+        '--speed',
+        type=float,
+        default=0,
+        help="Replay speed as a multiple of the recorded speed. Set 0 to "
+        "replay as fast as possible.")
+    add_rx_decode_args(p10)
+    p10.set_defaults(func=replay,
+                     sock_addr=None,
+                     interface=None,
+                     demo=False,
+                     region=None,
+                     capture=None,
+                     rx_rate=None,
+                     trace=None,
+                     metrics_port=None)
+
+    # Relay
+    p11 = subsubparsers.add_parser(
+        'relay',
+        description=textwrap.dedent('''\
+
+        Relay the API packets received from the satellite receiver to other
+        hosts. Receives the UDP packets carrying API data, like the "api
+        listen" command, and re-emits them to one or more unicast or multicast
+        destinations, so that a single receiver can feed the API listeners
+        running on multiple hosts.
+
+        '''),
+        help="Relay the received API packets to other hosts",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    p11.add_argument(
+        '-d',
+        '--dest',
+        nargs="+",
+        required=True,
+        help="Destination addresses (ip:port) to which the packets are "
+        "relayed. Unicast and multicast addresses are supported.")
+    p11.add_argument(
+        '--sock-addr',
+        default=defs.api_dst_addr,
+        help="Multicast UDP address (ip:port) used to listen for API data")
+    p11.add_argument(
+        '-i',
+        '--interface',
+        nargs="+",
+        default=None,
+        help="Network interface(s) that receive API data. If multiple "
+        "interfaces are provided (e.g., from redundant receivers), the "
+        "packets received over all of them are relayed. By default, use the "
+        "interface of the receiver set up by the \"cfg\" command.")
+    p11.add_argument(
+        '--tx-interface',
+        default=None,
+        help="Network interface over which to send the packets to multicast "
+        "destinations. By default, use the system's default interface.")
+    p11.add_argument('-c',
+                     '--channel',
+                     type=int,
+                     default=ApiChannel.ALL.value,
+                     choices=API_CHANNELS,
+                     help="API channel to relay. If set to 0, relay all "
+                     "channels.")
+    p11.add_argument(
+        '--no-dedupe',
+        default=False,
+        action='store_true',
+        help="Relay the repeated packets instead of dropping them. By "
+        "default, the packets already relayed recently (e.g., received over "
+        "multiple interfaces) are dropped.")
+    p11.add_argument('--ttl',
+                     type=int,
+                     default=1,
+                     help="Time-to-live to set on multicast packets")
+    p11.add_argument(
+        '--dscp',
+        type=int,
+        default=0,
+        help="Differentiated services code point (DSCP) to set on the output "
+        "multicast IP packets")
+    p11.add_argument(
+        '--batch',
+        type=int,
+        default=DEFAULT_BATCH,
+        help="Maximum number of packets relayed to each destination at once")
+    p11.add_argument(
+        '--gso',
+        default=False,
+        action='store_true',
+        help="Use UDP generic segmentation offload (GSO) to send each batch "
+        "of packets (see --batch) with a single system call. Requires Linux "
+        "4.18 or later.")
+    p11.add_argument(
+        '--rx-rate',
+        type=float,
+        default=1000,
+        help="Expected peak bit rate in kbps of the incoming API traffic, "
+        "used to size the receive buffer of each input socket. Set 0 to "
+        "keep the system's default buffer size.")
+    p11.add_argument(
+        '--report-interval',
+        type=float,
+        default=DEFAULT_REPORT_INTERVAL,
+        help="Interval in seconds between the reports of the relay "
+        "throughput per destination. Set 0 to disable the reports.")
+    p11.set_defaults(func=relay)
+
     return p
 
 
@@ -0,0 +1,121 @@
+"""Capture and replay of the UDP packets received by the API listener
+
+The capture file starts with a magic string followed by one record per
+received UDP datagram. Each record consists of a fixed-size header with the
+reception timestamp (seconds since the epoch), the source IPv4 address and
+port, and the payload length, followed by the payload.
+
+"""
+import logging
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+MAGIC = b'BSATCAP1'
+RECORD_HDR_FMT = '!d4sHH'  # timestamp, source address, port, payload length
+RECORD_HDR_LEN = struct.calcsize(RECORD_HDR_FMT)
+FLUSH_INTERVAL = 1  # maximum interval in seconds between file flushes
+
+
+class CaptureWriter():
+    """Writer of UDP packet captures
+
+    Appends the records to the capture file, which is created if it does not
+    exist. The file is flushed at most every FLUSH_INTERVAL seconds.
+
+    Args:
+        path : Path to the capture file.
+
+    """
+
+    def __init__(self, path):
+        self.fd = open(path, 'ab')
+        if (self.fd.tell() == 0):
+            self.fd.write(MAGIC)
+        elif (read_magic(path) != MAGIC):
+            self.fd.close()
+            raise ValueError("{} is not a packet capture file".format(path))
+        self._last_flush = time.monotonic()
+
+    def write(self, payload, addr, timestamp=None):
+        """Append a received UDP payload to the capture
+
+        Args:
+            payload   : UDP payload.
+            addr      : Tuple with the source IP address and port.
+            timestamp : Reception timestamp. Defaults to the current time.
+
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        self.fd.write(
+            struct.pack(RECORD_HDR_FMT, timestamp, socket.inet_aton(addr[0]),
+                        addr[1], len(payload)))
+        self.fd.write(payload)
+
+        now = time.monotonic()
+        if (now - self._last_flush > FLUSH_INTERVAL):
+            self.fd.flush()
+            self._last_flush = now
+
+    def close(self):
+        self.fd.close()
+
+
+def read_magic(path):
+    with open(path, 'rb') as fd:
+        return fd.read(len(MAGIC))
+
+
+def read_capture(path):
+    """Read the records of a UDP packet capture
+
+    Args:
+        path : Path to the capture file.
+
+    Yields:
+        Tuple with the reception timestamp, the source address (tuple with
+        IP address and port), and the UDP payload of each record.
+
+    """
+    with open(path, 'rb') as fd:
+        if (fd.read(len(MAGIC)) != MAGIC):
+            raise ValueError("{} is not a packet capture file".format(path))
+
+        while True:
+            hdr = fd.read(RECORD_HDR_LEN)
+            if (len(hdr) < RECORD_HDR_LEN):
+                break
+            timestamp, ip, port, length = struct.unpack(RECORD_HDR_FMT, hdr)
+            payload = fd.read(length)
+            if (len(payload) < length):
+                break
+            yield timestamp, (socket.inet_ntoa(ip), port), payload
+
+        if (len(hdr) > 0):
+            logger.warning("Capture file {} ends with a truncated "
+                           "record".format(path))
+
+
+def replay_capture(path, speed=None):
+    """Replay the UDP payloads of a capture file
+
+    Args:
+        path  : Path to the capture file.
+        speed : Replay speed as a multiple of the recorded speed. If None or
+                zero, replay as fast as possible.
+
+    Yields:
+        Tuple with the UDP payload and the source address.
+
+    """
+    t_start = None
+    for timestamp, addr, payload in read_capture(path):
+        if (speed):
+            if (t_start is None):
+                t_start = (time.monotonic(), timestamp)
+            t_target = t_start[0] + (timestamp - t_start[1]) / speed
+            delay = t_target - time.monotonic()
+            if (delay > 0):
+                time.sleep(delay)
+        yield payload, addr
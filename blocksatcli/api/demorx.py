@@ -5,17 +5,29 @@ Read API data directly via internet and output to pipe
 
 import json
 import logging
+import threading
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
 from .. import defs
 from . import net
-from .order import API_CHANNEL_SSE_NAME, ApiOrder
+from .order import API_CHANNEL_SSE_NAME, ApiOrder, iter_sse_events
+from .pacer import Pacer
 from .pkt import BlocksatPkt, BlocksatPktHandler
 
 logger = logging.getLogger(__name__)
 MAX_SEQ_NUM = 2**31  # Maximum transmission sequence number
+PREFETCH_STATES = ['paid', 'transmitting']  # States that trigger prefetching
+DEFAULT_PREFETCH_SIZE = 2**26  # Default prefetch cache capacity in bytes
+PREFETCH_WORKERS = 2  # Number of concurrent prefetch downloads
+QUEUE_POLL_INTERVAL = 5  # Interval between polls of the queued orders (sec)
+POLL_MIN_INTERVAL = 0.5  # Polling interval while orders are active (sec)
+POLL_MAX_INTERVAL = 8  # Maximum polling interval when idle (sec)
+TX_DEDUPE_WINDOW = 1024  # Number of transmissions remembered for dedupe
+PREFETCH_HISTORY = 64  # Number of transmitted orders not to be prefetched
 
 
 class DemoRx():
@@ -32,7 +44,10 @@ class DemoRx():
                  tls_cert=None,
                  tls_key=None,
                  poll=False,
-                 sock_by_region=False):
+                 sock_by_region=False,
+                 burst=1,
+                 prefetch_size=DEFAULT_PREFETCH_SIZE,
+                 pkt_cache=None):
         """ DemoRx Constructor
 
         Args:
@@ -49,7 +64,16 @@ class DemoRx():
             sock_by_region : Map each UdpSock to a region so that each socket
                 serves messages on a single region only. Requires the socks
                 parameter to have the same length as the regions parameter.
-
+            burst    : Maximum number of packets sent back-to-back. The
+                transmission is paced such that the average bit rate does not
+                exceed the target, but packets are sent in bursts of up to
+                this number of packets.
+            prefetch_size : Capacity in bytes of the cache holding the
+                packets of orders fetched ahead of their transmission. Set
+                to zero to disable prefetching.
+            pkt_cache : PktCache object used to keep the packets of the
+                transmitted messages on disk, so that retransmissions do not
+                require downloading the messages again.
 
         """
         # Validate args
@@ -67,6 +91,7 @@ class DemoRx():
         self.tls_cert = tls_cert
         self.tls_key = tls_key
         self.poll = poll
+        self.pkt_cache = pkt_cache
         self.admin = tls_cert is not None and tls_key is not None
 
         if sock_by_region and len(self.regions_list) != len(socks):
@@ -74,34 +99,221 @@ class DemoRx():
                 "Number of sockets must be equal to the number of regions")
         self.sock_by_region = sock_by_region
 
+        if burst < 1:
+            raise ValueError("Burst must have at least one packet")
+        self.burst = burst
+
+        # Sender workers (one per socket)
+        self._tx_executor = ThreadPoolExecutor(max_workers=max(len(socks), 1))
+
+        # Prefetch cache mapping the sequence number of each upcoming order
+        # to the future resolving to its packed packets, in insertion order.
+        self.prefetch_size = prefetch_size
+        self._prefetch = OrderedDict()
+        self._prefetch_bytes = 0
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=PREFETCH_WORKERS)
+        self.prefetch_states = [
+            x for x in PREFETCH_STATES if x != self.tx_event
+        ]
+        # Orders transmitted recently, which may still be listed in the
+        # transmitting state (e.g., while pending confirmation from other
+        # regions), but should not be prefetched again
+        self._transmitted = deque(maxlen=PREFETCH_HISTORY)
+
+        # Polling state
+        self.session = None
+        self._tx_window = OrderedDict()  # recent transmissions (for dedupe)
+        self._next_queue_poll = 0
+        self._upcoming = False
+
+    def _send_raw_pkts(self, raw_pkts, sock):
+        """Transmit packed Blocksat packets over a socket
+
+        Transmit in bursts of up to self.burst packets and block between
+        bursts to guarantee the target bit rate.
+
+        Args:
+            raw_pkts : Sequence with the packed Blocksat packets.
+            sock     : Socket over which to send the packets.
+
+        Returns:
+            Dictionary with the pacing statistics.
+
+        """
+        pacer = Pacer(self.kbps)
+        for i_start in range(0, len(raw_pkts), self.burst):
+            burst = raw_pkts[i_start:i_start + self.burst]
+            burst_len = sum([len(x) for x in burst])
+            pacer.pace(burst_len)
+
+            # With UDP GSO enabled on the socket, the burst is sent with a
+            # single system call.
+            sock.send_many(burst)
+            logger.debug("Send packets %d to %d - %d bytes" %
+                         (i_start, i_start + len(burst) - 1, burst_len))
+
+        return pacer.get_stats()
+
+    def _fetch_pkts(self, seq_num, msg_len=None):
+        """Fetch the API message data and split it into packed packets
+
+        Reads the packets from the on-disk cache, if available. Otherwise,
+        downloads the message data and saves the resulting packets on the
+        cache.
+
+        Args:
+            seq_num : Transmission sequence number of the API order.
+            msg_len : Expected message length, if known.
+
+        Returns:
+            Tuple with the packed Blocksat packets or None if the message is
+            empty.
+
+        """
+        if (self.pkt_cache is not None):
+            raw_pkts = self.pkt_cache.get(seq_num, msg_len)
+            if (raw_pkts is not None):
+                logger.debug("Message {} read from the cache".format(seq_num))
+                return raw_pkts
+
+        order = ApiOrder(self.server,
+                         seq_num=seq_num,
+                         tls_cert=self.tls_cert,
+                         tls_key=self.tls_key,
+                         session=self.session)
+        data = order.get_data()
+
+        if (data is None):
+            return None
+
+        tx_handler = BlocksatPktHandler()
+        tx_handler.split(data, seq_num, self.channel)
+        raw_pkts = tuple(pkt.pack() for pkt in tx_handler.get_frags(seq_num))
+
+        if (self.pkt_cache is not None):
+            try:
+                self.pkt_cache.put(seq_num, len(data), raw_pkts)
+            except OSError as e:
+                logger.warning("Failed to cache message {}: {}".format(
+                    seq_num, e))
+
+        return raw_pkts
+
+    def _prefetch_order(self, order_info):
+        """Fetch the data of an upcoming order ahead of its transmission
+
+        The download runs on a prefetch worker and its result is kept on a
+        bounded cache, evicting the oldest orders first when the total size
+        of the cached messages exceeds the cache capacity.
+
+        Args:
+            order_info (dict): Dictionary with the order's Tx sequence number
+                and message size.
+
+        """
+        seq_num = order_info.get("tx_seq_num")
+        size = order_info.get("message_size") or 0
+        if (seq_num is None or size > self.prefetch_size
+                or seq_num in self._transmitted):
+            return
+
+        if ('regions' in order_info
+                and not set(order_info['regions']) & self.regions_set):
+            return
+
+        with self._prefetch_lock:
+            if (seq_num in self._prefetch):
+                return
+
+            while (self._prefetch
+                   and self._prefetch_bytes + size > self.prefetch_size):
+                _, (_, evicted_size) = self._prefetch.popitem(last=False)
+                self._prefetch_bytes -= evicted_size
+
+            logger.debug("Prefetch message {}".format(seq_num))
+            future = self._prefetch_executor.submit(
+                self._fetch_pkts, seq_num, order_info.get("message_size"))
+            self._prefetch[seq_num] = (future, size)
+            self._prefetch_bytes += size
+
+    def _get_pkts(self, seq_num, msg_len=None):
+        """Get the packed packets of an order to be transmitted
+
+        Takes the packets from the prefetch cache if available, waiting for
+        the prefetch download if it is still in progress. Otherwise, or if the
+        prefetch failed, fetches the data directly.
+
+        Args:
+            seq_num : Transmission sequence number of the API order.
+            msg_len : Expected message length, if known.
+
+        Returns:
+            Tuple with the packed Blocksat packets or None if the message is
+            empty.
+
+        """
+        with self._prefetch_lock:
+            entry = self._prefetch.pop(seq_num, None)
+            if (entry is not None):
+                self._prefetch_bytes -= entry[1]
+
+        if (entry is not None):
+            try:
+                return entry[0].result()
+            except requests.exceptions.RequestException as e:
+                logger.debug("Prefetch of message {} failed: {}".format(
+                    seq_num, e))
+
+        return self._fetch_pkts(seq_num, msg_len)
+
     def _send_pkts(self, pkts, socks):
         """Transmit Blocksat packets of the API message over all sockets
 
-        Transmit and sleep (i.e., block) to guarantee the target bit rate.
+        Each socket is served by a separate sender worker with an independent
+        pacer, so that a slow socket does not hold back the transmissions over
+        the other sockets. Returns when all sockets finish transmitting.
 
         Args:
-            pkts : List of BlocksatPkt objects to be send over sockets
+            pkts : List of BlocksatPkt objects to be send over sockets or
+                tuple with the already packed packets.
             socks : List of sockets over which to send packets.
 
+        Returns:
+            List with the pacing statistics of each socket.
+
         """
-        assert (isinstance(pkts, list))
-        assert (all([isinstance(x, BlocksatPkt) for x in pkts]))
-
-        byte_rate = self.kbps * 1e3 / 8  # bytes / sec
-        next_tx = time.time()
-        for i, pkt in enumerate(pkts):
-            # Send the same packet on all sockets
-            for sock in socks:
-                sock.send(pkt.pack())
-                logger.debug("Send packet %d - %d bytes" % (i, len(pkt)))
-
-            # Throttle
-            if (byte_rate > 0):
-                tx_delay = len(pkt) / byte_rate
-                next_tx += tx_delay
-                sleep = next_tx - time.time()
-                if (sleep > 0):
-                    time.sleep(sleep)
+        if (isinstance(pkts, tuple)):
+            raw_pkts = pkts
+        else:
+            assert (isinstance(pkts, list))
+            assert (all([isinstance(x, BlocksatPkt) for x in pkts]))
+            # Pack all packets once before starting the transmission. The
+            # packed packets are shared by all sender workers.
+            raw_pkts = tuple(pkt.pack() for pkt in pkts)
+
+        if (len(socks) == 1):
+            all_stats = [self._send_raw_pkts(raw_pkts, socks[0])]
+        else:
+            futures = [
+                self._tx_executor.submit(self._send_raw_pkts, raw_pkts, sock)
+                for sock in socks
+            ]
+            all_stats = [f.result() for f in futures]
+
+        for sock, stats in zip(socks, all_stats):
+            if (stats['achieved_kbps'] is None):
+                continue
+            msg = "Socket {}:{} (interface {}) - Achieved bit rate: " \
+                "{:.1f} kbps".format(sock.ip, sock.port, sock.ifindex,
+                                     stats['achieved_kbps'])
+            if (stats['jitter_ms'] is not None):
+                msg += " (target: {:g} kbps)".format(stats['target_kbps'])
+                msg += " - Jitter: {:.3f} ms (max: {:.3f} ms)".format(
+                    stats['jitter_ms'], stats['max_jitter_ms'])
+            logger.info(msg)
+        return all_stats
 
     def _handle_event(self, event_data):
         """Handle event broadcast by the SSE server
@@ -113,6 +325,10 @@ class DemoRx():
         order = json.loads(event_data)
         logger.debug("Order: " + json.dumps(order, indent=4, sort_keys=True))
 
+        # Fetch the data of upcoming orders in advance
+        if (order["status"] in self.prefetch_states and self.prefetch_size):
+            self._prefetch_order(order)
+
         # Proceed when the event matches the target Tx trigger event
         if (order["status"] != self.tx_event):
             return
@@ -120,7 +336,8 @@ class DemoRx():
         self._handle_order(order)
 
     def _handle_order(self, order_info):
-        """Fetch the order data and send it over UDP
+        """Fetch the order data (or get it from the prefetch cache) and send it
+        over UDP
 
         Args:
             order_info (dict): Dictionary with the order's Tx sequence number
@@ -152,14 +369,11 @@ class DemoRx():
         logger.info("Message %-5d\tSize: %d bytes\t" %
                     (seq_num, order_info["message_size"]))
 
-        # Get the API message data
-        order = ApiOrder(self.server,
-                         seq_num=seq_num,
-                         tls_cert=self.tls_cert,
-                         tls_key=self.tls_key)
-        data = order.get_data()
+        # Get the API message packets
+        raw_pkts = self._get_pkts(seq_num, order_info.get("message_size"))
+        self._transmitted.append(seq_num)
 
-        if (data is None):
+        if (raw_pkts is None):
             logger.debug("Empty message. Skipping...")
             return
 
@@ -172,21 +386,27 @@ class DemoRx():
         else:
             tx_socks = self.socks
 
-        # Split API message data into Blocksat packet(s)
-        tx_handler = BlocksatPktHandler()
-        tx_handler.split(data, seq_num, self.channel)
-        pkts = tx_handler.get_frags(seq_num)
-
         if (self.kbps > 0):
+            tx_len = sum([len(x) for x in raw_pkts])
             logger.debug("Transmission is going to take: "
-                         "{:g} sec".format(len(data) * 8 / (self.kbps * 1e3)))
+                         "{:g} sec".format(tx_len * 8 / (self.kbps * 1e3)))
 
         # Send the packet(s)
-        self._send_pkts(pkts, tx_socks)
+        self._send_pkts(raw_pkts, tx_socks)
 
         # Send transmission confirmation to the server
+        order = ApiOrder(self.server,
+                         seq_num=seq_num,
+                         tls_cert=self.tls_cert,
+                         tls_key=self.tls_key,
+                         session=self.session)
         order.confirm_tx(list(served_regions))
 
+        if (self.pkt_cache is not None):
+            logger.debug("Cache hits: {hits}, misses: {misses}, "
+                         "messages: {entries}, size: {size} bytes".format(
+                             **self.pkt_cache.get_stats()))
+
     def run_sse_client(self):
         """Server-sent Events (SSE) Client"""
         logger.info("Connecting with Satellite API server...")
@@ -207,26 +427,8 @@ class DemoRx():
                 logger.info("Connected. Waiting for events...\n")
 
                 # Continuously wait for events
-                event_line = 'event:' + sse_channel
-                event_next = False
-                for line in r.iter_lines():
-                    if not line:
-                        continue
-
-                    dec_line = line.decode()
-
-                    if dec_line.startswith(':'):  # comment to be ignored
-                        continue
-
-                    logger.debug(line)
-
-                    if dec_line.startswith(event_line):
-                        event_next = True
-                        continue
-
-                    if event_next and dec_line.startswith('data:'):
-                        self._handle_event(dec_line.replace('data:', ''))
-                        event_next = False
+                for event_data in iter_sse_events(r, sse_channel):
+                    self._handle_event(event_data)
 
             except requests.exceptions.HTTPError as e:
                 logger.error(e)
@@ -251,57 +453,116 @@ class DemoRx():
 
             logger.info("Reconnecting...")
 
+    def _get_tx_id(self, order_info):
+        """Get the identifier of an order's transmission attempt"""
+        is_retransmission = 'retransmission' in order_info and \
+            order_info['retransmission'] is not None and \
+            'retry_count' in order_info['retransmission']
+        tx_attempt = 0 if not is_retransmission else \
+            order_info['retransmission']['retry_count']
+        return "{}-{}".format(order_info['tx_seq_num'], tx_attempt)
+
+    def _poll_orders(self, order_mgr):
+        """Poll the transmitting orders and transmit the new ones
+
+        The queued orders are polled less frequently, both to prefetch their
+        data and to check whether there are upcoming transmissions. All
+        polling requests are conditional, so that the server can respond
+        without the order list when the list is not modified.
+
+        Args:
+            order_mgr : ApiOrder object used to poll the order queues.
+
+        Returns:
+            Tuple with the number of new transmissions and a boolean
+            indicating whether there are any active (transmitting) or upcoming
+            (paid) orders.
+
+        """
+        if (time.monotonic() >= self._next_queue_poll):
+            queued_orders = order_mgr.get_orders(['paid', 'transmitting'],
+                                                 self.channel,
+                                                 queue='queued',
+                                                 conditional=True)
+            self._upcoming = any(
+                [x['status'] == 'paid' for x in queued_orders])
+            if (self.prefetch_size):
+                for order_info in queued_orders:
+                    if (order_info['status'] in self.prefetch_states):
+                        self._prefetch_order(order_info)
+            self._next_queue_poll = time.monotonic() + QUEUE_POLL_INTERVAL
+
+        tx_orders = order_mgr.get_orders(['transmitting'],
+                                         self.channel,
+                                         queue='transmitting',
+                                         conditional=True)
+
+        # There can only be one order in transmitting state at a time
+        if len(tx_orders) > 1:
+            logger.warning("More than one order in transmitting "
+                           "state on channel {}".format(self.channel))
+
+        # Filter out any repeated orders (already transmitted), except for
+        # those the server is explicitly retransmitting. Remember only the
+        # most recent transmissions.
+        new_orders = list()
+        for order_info in tx_orders:
+            tx_id = self._get_tx_id(order_info)
+            if tx_id not in self._tx_window:
+                self._tx_window[tx_id] = True
+                if (len(self._tx_window) > TX_DEDUPE_WINDOW):
+                    self._tx_window.popitem(last=False)
+                new_orders.append(order_info)
+
+        for order_info in new_orders:
+            logger.debug("Order: " +
+                         json.dumps(order_info, indent=4, sort_keys=True))
+            self._handle_order(order_info)
+
+        return len(new_orders), len(tx_orders) > 0 or self._upcoming
+
     def run_poll_client(self):
-        """Polling-based client"""
+        """Polling-based client
+
+        Polls the API queues with an adaptive interval. The interval is
+        short while there are active or upcoming orders and doubles on each
+        idle poll, up to a maximum. Polling restarts immediately after each
+        transmission.
+
+        """
         order_mgr = ApiOrder(self.server,
                              tls_cert=self.tls_cert,
-                             tls_key=self.tls_key)
-        tx_set = set()
+                             tls_key=self.tls_key,
+                             session=self.session)
+        interval = POLL_MIN_INTERVAL
         while (True):
             try:
-                tx_orders = order_mgr.get_orders(['transmitting'],
-                                                 self.channel,
-                                                 queue='transmitting')
-
-                # There can only be one order in transmitting state at a time
-                if len(tx_orders) > 1:
-                    logger.warning("More than one order in transmitting "
-                                   "state on channel {}".format(self.channel))
-
-                # Filter out any repeated orders (already transmitted), except
-                # for those the server is explicitly retransmitting.
-                new_orders = list()
-                for order_info in tx_orders:
-                    is_retransmission = 'retransmission' in order_info and \
-                        order_info['retransmission'] is not None and \
-                        'retry_count' in order_info['retransmission']
-                    tx_attempt = 0 if not is_retransmission else \
-                        order_info['retransmission']['retry_count']
-                    order_id = "{}-{}".format(order_info['tx_seq_num'],
-                                              tx_attempt)
-                    if order_id not in tx_set:
-                        tx_set.add(order_id)
-                        new_orders.append(order_info)
-
-                if new_orders:
-                    for order_info in new_orders:
-                        logger.debug(
-                            "Order: " +
-                            json.dumps(order_info, indent=4, sort_keys=True))
-                        self._handle_order(order_info)
-                else:
-                    time.sleep(1)
+                n_new, active = self._poll_orders(order_mgr)
+                if (n_new > 0):
+                    interval = POLL_MIN_INTERVAL
+                    continue
+                interval = POLL_MIN_INTERVAL if active else min(
+                    2 * interval, POLL_MAX_INTERVAL)
+                time.sleep(interval)
 
             except requests.exceptions.ConnectionError as e:
                 logger.debug(e)
-                time.sleep(1)
+                interval = min(2 * interval, POLL_MAX_INTERVAL)
+                time.sleep(interval)
                 pass
             except KeyboardInterrupt:
                 exit()
 
     def run(self):
         """Run the demo-rx transmission loop"""
-        if self.poll:
-            self.run_poll_client()
-        else:
-            self.run_sse_client()
+        # Reuse the connections to the server across requests
+        self.session = requests.Session()
+        try:
+            if self.poll:
+                self.run_poll_client()
+            else:
+                self.run_sse_client()
+        finally:
+            self._tx_executor.shutdown()
+            self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+            self.session.close()
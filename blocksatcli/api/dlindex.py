@@ -0,0 +1,220 @@
+"""Content index of the API download directory"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+from .writer import atomic_write
+
+logger = logging.getLogger(__name__)
+INDEX_FILE = '.blocksat-index.json'
+INDEX_VERSION = 1
+HASH_CHUNK = 2**20  # read size when hashing the existing files
+
+_indexes = {}  # download directory -> DownloadIndex
+_indexes_lock = threading.Lock()
+
+
+def get_index(dst_dir):
+    """Get the (shared) download index of a directory"""
+    dst_dir = os.path.abspath(dst_dir)
+    with _indexes_lock:
+        if (dst_dir not in _indexes):
+            _indexes[dst_dir] = DownloadIndex(dst_dir)
+        return _indexes[dst_dir]
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DownloadIndex():
+    """Persistent index of the SHA-256 digests of the downloaded files
+
+    Maps the content digest of each file saved in the download directory to
+    its file name, so that repeated downloads can be detected without reading
+    the existing files again. Each entry also keeps the file size and
+    modification time to detect changes made outside the application, in
+    which case the entry is refreshed on the next lookup. Files that are not
+    in the index yet (e.g., saved by a previous version) are hashed lazily,
+    only when a download collides with their names.
+
+    The index is saved on a hidden file within the download directory.
+
+    Args:
+        dst_dir : Download directory.
+
+    """
+
+    def __init__(self, dst_dir):
+        self.dst_dir = dst_dir
+        self.path = os.path.join(dst_dir, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._files = {}  # file name -> (size, mtime_ns, digest)
+        self._by_digest = {}  # digest -> set of file names
+        self._next_suffix = {}  # (stem, ext) -> next "-N" suffix to try
+        self._pending = {}  # file name -> digest of the writes in progress
+        self._dirty = False  # whether the index needs to be saved
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as fd:
+                index = json.load(fd)
+            assert (index['version'] == INDEX_VERSION)
+            files = index['files']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, AssertionError) as e:
+            logger.debug("Discarding the download index: {}".format(e))
+            return
+
+        for name, (size, mtime_ns, digest) in files.items():
+            self._set(name, size, mtime_ns, digest)
+        self._dirty = False
+
+    def _save(self):
+        """Save the index atomically (lock must be held)"""
+        index = {
+            'version': INDEX_VERSION,
+            'files': {
+                k: list(v)
+                for k, v in self._files.items()
+            }
+        }
+        try:
+            atomic_write(self.path, json.dumps(index).encode(), fsync=False)
+        except OSError as e:
+            logger.warning("Failed to save the download index: {}".format(e))
+            return
+        self._dirty = False
+
+    def _set(self, name, size, mtime_ns, digest):
+        self._unset(name)
+        self._files[name] = (size, mtime_ns, digest)
+        self._by_digest.setdefault(digest, set()).add(name)
+        self._dirty = True
+
+    def _unset(self, name):
+        if (name not in self._files):
+            return
+        digest = self._files.pop(name)[2]
+        self._by_digest[digest].discard(name)
+        if (not self._by_digest[digest]):
+            del self._by_digest[digest]
+        self._dirty = True
+
+    def _get_digest(self, name):
+        """Get the up-to-date digest of a file, hashing it if necessary
+
+        Returns:
+            SHA-256 digest or None if the file does not exist.
+
+        """
+        try:
+            stat = os.stat(os.path.join(self.dst_dir, name))
+        except FileNotFoundError:
+            self._unset(name)
+            return None
+
+        entry = self._files.get(name)
+        if (entry is not None
+                and entry[:2] == (stat.st_size, stat.st_mtime_ns)):
+            return entry[2]
+
+        digest = _hash_file(os.path.join(self.dst_dir, name))
+        self._set(name, stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    @staticmethod
+    def _name_variants(filename):
+        """Regex matching a file name and its "-N"-suffixed variants"""
+        stem, ext = os.path.splitext(filename)
+        return re.compile(re.escape(stem) + r'(-\d+)?' + re.escape(ext) + '$')
+
+    def find(self, filename, digest):
+        """Find an existing download with the given name and contents
+
+        Args:
+            filename : Name of the file to be saved.
+            digest   : SHA-256 digest of the data to be saved.
+
+        Returns:
+            Path to an existing file holding the same data under the same
+            file name or one of its "-N"-suffixed variants, or None if not
+            found.
+
+        """
+        with self._lock:
+            # A pre-existing file with the same name may not be indexed yet
+            self._get_digest(filename)
+
+            variants = self._name_variants(filename)
+            res = None
+            for name in sorted(self._by_digest.get(digest, [])):
+                if (variants.match(name) and self._get_digest(name) == digest):
+                    res = os.path.join(self.dst_dir, name)
+                    break
+
+            # The same data may be on its way to the disk already
+            if (res is None):
+                for name, pending_digest in self._pending.items():
+                    if (pending_digest == digest and variants.match(name)):
+                        res = os.path.join(self.dst_dir, name)
+                        break
+
+            if (self._dirty):
+                self._save()
+            return res
+
+    def alloc_name(self, filename, digest):
+        """Allocate a unique file name within the download directory
+
+        Returns the given file name if available. Otherwise, returns the name
+        with the next available "-N" suffix (e.g., "file-2.txt"). The name
+        remains reserved for the given contents until the file is added to
+        the index (see add) or released (see release).
+
+        Args:
+            filename : Name of the file to be saved.
+            digest   : SHA-256 digest of the data to be saved.
+
+        """
+        stem, ext = os.path.splitext(filename)
+        with self._lock:
+            name = filename
+            i_file = self._next_suffix.get((stem, ext), 2)
+            while (name in self._pending
+                   or os.path.exists(os.path.join(self.dst_dir, name))):
+                name = stem + "-" + str(i_file) + ext
+                i_file += 1
+            if (name != filename):
+                self._next_suffix[(stem, ext)] = i_file
+            self._pending[name] = digest
+            return os.path.join(self.dst_dir, name)
+
+    def release(self, path):
+        """Release the name reserved for a file that could not be saved"""
+        with self._lock:
+            self._pending.pop(os.path.basename(path), None)
+
+    def add(self, path, digest):
+        """Add a newly saved file to the index
+
+        Args:
+            path   : Path to the saved file.
+            digest : SHA-256 digest of its contents.
+
+        """
+        stat = os.stat(path)
+        with self._lock:
+            self._pending.pop(os.path.basename(path), None)
+            self._set(os.path.basename(path), stat.st_size, stat.st_mtime_ns,
+                      digest)
+            self._save()
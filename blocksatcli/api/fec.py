@@ -1,7 +1,10 @@
 """FEC Encoding/decoding"""
 import logging
+import mmap
+import os
 import random
 import struct
+from array import array
 from math import ceil, floor
 
 try:
@@ -190,6 +193,87 @@ class Fec:
 
         return bytes(encoded_data)
 
+    def encode_file(self, src_path, dst_path):
+        """Encode a file into FEC packets using bounded memory
+
+        Streaming counterpart of method encode(). The input file is
+        memory-mapped and encoded one FEC object at a time, while each
+        resulting FEC packet is written directly into its (randomly shuffled)
+        position on the output file. Hence, the memory usage is bounded by the
+        size of a single FEC object, regardless of the file size.
+
+        Args:
+            src_path : Path to the file to encode.
+            dst_path : Path to the output file with the FEC packets.
+
+        Returns:
+            Length of the FEC-encoded file.
+
+        """
+        assert (self.overhead <= MAX_OVERHEAD), \
+            "FEC overhead exceeds the maximum of {}".format(MAX_OVERHEAD)
+
+        data_len = os.path.getsize(src_path)
+        assert (data_len > 0)
+        max_obj_size = floor(MAX_FEC_CHUNKS / (1 + self.overhead)) * CHUNK_SIZE
+        n_fec_objects = ceil(data_len / max_obj_size)
+        encoded_len = self.calc_encoded_len(data_len)
+
+        # Random position of each FEC packet on the output (see encode())
+        positions = array('L', range(encoded_len // PKT_SIZE))
+        random.shuffle(positions)
+
+        i_pkt = 0
+        with open(src_path, 'rb') as src_fd, open(dst_path, 'wb') as dst_fd, \
+                mmap.mmap(src_fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            dst_fd.truncate(encoded_len)
+            for i_obj in range(n_fec_objects):
+                s_byte = i_obj * max_obj_size  # starting byte
+                e_byte = (i_obj + 1) * max_obj_size  # ending byte
+                fec_object = data[s_byte:e_byte]
+
+                logger.debug("FEC Object: {}".format(i_obj))
+
+                fec_chunks = self._encode_obj(fec_object)
+
+                for i_chunk, chunk in enumerate(fec_chunks):
+                    metadata = struct.pack(HEADER_FORMAT, i_obj, n_fec_objects,
+                                           i_chunk, len(fec_object))
+                    dst_fd.seek(positions[i_pkt] * PKT_SIZE)
+                    dst_fd.write(metadata + chunk)
+                    i_pkt += 1
+
+        assert (i_pkt * PKT_SIZE == encoded_len)
+
+        return encoded_len
+
+    def calc_encoded_len(self, data_len):
+        """Compute the length of the FEC-encoded version of a message
+
+        Mirrors the object and chunk partitioning of method encode() without
+        running the actual encoding.
+
+        Args:
+            data_len : Length of the data to encode.
+
+        Returns:
+            Length of the concatenated FEC packets generated by encode().
+
+        """
+        assert (self.overhead <= MAX_OVERHEAD), \
+            "FEC overhead exceeds the maximum of {}".format(MAX_OVERHEAD)
+
+        max_obj_size = floor(MAX_FEC_CHUNKS / (1 + self.overhead)) * CHUNK_SIZE
+        n_fec_objects = ceil(data_len / max_obj_size)
+
+        n_fec_pkts = 0
+        for i_obj in range(n_fec_objects):
+            obj_len = min(max_obj_size, data_len - i_obj * max_obj_size)
+            n_chunks = ceil(obj_len / CHUNK_SIZE)
+            n_fec_pkts += n_chunks + ceil(self.overhead * n_chunks)
+
+        return n_fec_pkts * PKT_SIZE
+
     def _decode_obj(self, obj_len, chunks, chunk_ids):
         """Decode a single FEC object
 
@@ -2,12 +2,29 @@ import logging
 import os
 import stat
 import sys
+from math import ceil
 
 import gnupg
 
 from .. import defs, util
 
 logger = logging.getLogger(__name__)
+# Approximate sizes (in bytes) of the OpenPGP structures (see RFC 4880)
+# produced by GnuPG, used to estimate the length of encrypted and signed data
+# without actually running GnuPG:
+PGP_PKESK_OVERHEAD = 13  # public-key encrypted session key (w/o key material)
+PGP_ENCRYPTED_OVERHEAD = 64  # SEIPD, compressed and literal data packets, MDC
+PGP_SIG_OVERHEAD = 72  # one-pass signature and signature packet (w/o MPIs)
+PGP_STREAM_CHUNK = 8192  # partial body length used when streaming data
+PGP_STREAM_CHUNK_OVERHEAD = 5  # partial lengths and deflate blocks per chunk
+PGP_MSG_ARMOR_LEN = 61  # "BEGIN/END PGP MESSAGE" lines and CRC24
+PGP_SIG_ARMOR_LEN = 65  # "BEGIN/END PGP SIGNATURE" lines and CRC24
+PGP_CLEARSIGN_HEADER_LEN = 50  # "BEGIN PGP SIGNED MESSAGE" and Hash lines
+PGP_ALGO_RSA = ('1', '2', '3')
+PGP_ALGO_ELGAMAL = ('16', '20')
+PGP_ALGO_ECDH = '18'
+PGP_ALGO_DSA_FAMILY = ('17', '19', '22')  # DSA, ECDSA and EdDSA
+PGP_DEFAULT_KEY_LENGTH = 4096  # assumed when the key length is unknown
 
 
 class Gpg():
@@ -170,6 +187,21 @@ class Gpg():
                                 sign=sign,
                                 passphrase=self.passphrase)
 
+    def encrypt_file(self,
+                     src_path,
+                     dst_path,
+                     recipients,
+                     always_trust=False,
+                     sign=None):
+        """Encrypt a file, streaming it through GnuPG into another file"""
+        with open(src_path, 'rb') as fd:
+            return self.gpg.encrypt_file(fd,
+                                         recipients,
+                                         always_trust=always_trust,
+                                         sign=sign,
+                                         passphrase=self.passphrase,
+                                         output=dst_path)
+
     def decrypt(self, data):
         """Decrypt a given data array"""
         if (not self.interactive and self.passphrase is None):
@@ -193,6 +225,19 @@ class Gpg():
                              detach=detach,
                              passphrase=self.passphrase)
 
+    def sign_file(self, src_path, dst_path, keyid):
+        """Clearsign a file, streaming it through GnuPG into another file"""
+        if (not self.interactive and self.passphrase is None):
+            raise RuntimeError(
+                "Passphrase must be defined in non-interactive mode")
+
+        with open(src_path, 'rb') as fd:
+            return self.gpg.sign_file(fd,
+                                      keyid=keyid,
+                                      clearsign=True,
+                                      passphrase=self.passphrase,
+                                      output=dst_path)
+
 
 def is_gpg_keyring_set(gnupghome):
     """Check if the keyring is already configured
@@ -277,3 +322,110 @@ def config_keyring(gpg, log_if_configured=False):
 
     if (not is_gpg_keyring_set(gpg.gpghome)):
         raise RuntimeError("GPG keyring configuration failed")
+
+
+def _mpi_len(bits):
+    """Length of an OpenPGP multiprecision integer with the given bits"""
+    return 2 + ceil(bits / 8)
+
+
+def _armored_len(data_len, armor_len):
+    """Length of the ASCII-armored version of a binary OpenPGP structure"""
+    n_chars = 4 * ceil(data_len / 3)  # base64
+    n_lines = ceil(n_chars / 64)  # one newline every 64 characters
+    return n_chars + n_lines + armor_len
+
+
+def _get_key_params(key, capability):
+    """Get the algorithm and length of the key used for a given capability
+
+    Args:
+        key (dict): Key information as returned by Gpg.get_public_key() or
+            Gpg.get_priv_key().
+        capability (str): Key capability ('e' for encryption or 's' for
+            signing).
+
+    Returns:
+        tuple: Public key algorithm id (str) and key length in bits (int).
+
+    """
+    if key is None:
+        return None, PGP_DEFAULT_KEY_LENGTH
+
+    candidates = [key] + list(key.get('subkey_info', {}).values())
+    for candidate in candidates:
+        if capability in candidate.get('cap', ''):
+            break
+    else:
+        candidate = key
+
+    try:
+        length = int(candidate.get('length'))
+    except (TypeError, ValueError):
+        length = PGP_DEFAULT_KEY_LENGTH
+
+    return candidate.get('algo'), length
+
+
+def _calc_signature_len(sign_key):
+    """Estimate the length of the binary signature packets"""
+    algo, bits = _get_key_params(sign_key, 's')
+    if algo in PGP_ALGO_RSA:
+        sig_material_len = _mpi_len(bits)
+    elif algo in PGP_ALGO_DSA_FAMILY:
+        sig_material_len = 2 * _mpi_len(bits)
+    else:
+        sig_material_len = 2 * _mpi_len(PGP_DEFAULT_KEY_LENGTH)
+    return PGP_SIG_OVERHEAD + sig_material_len
+
+
+def calc_encrypted_len(data_len, recipient_key, sign_key=None):
+    """Estimate the length of an ASCII-armored GnuPG-encrypted message
+
+    The estimate assumes the data is incompressible, so that it gives an upper
+    bound for the length obtained with Gpg.encrypt() in most cases.
+
+    Args:
+        data_len (int): Length of the data to be encrypted.
+        recipient_key (dict): Public key information of the recipient.
+        sign_key (dict, optional): Private key information of the signer, if
+            the message is signed in addition to encrypted.
+
+    Returns:
+        int: Estimated length of the encrypted message.
+
+    """
+    algo, bits = _get_key_params(recipient_key, 'e')
+    if algo in PGP_ALGO_RSA:
+        key_material_len = _mpi_len(bits)
+    elif algo in PGP_ALGO_ELGAMAL:
+        key_material_len = 2 * _mpi_len(bits)
+    elif algo == PGP_ALGO_ECDH:
+        # Ephemeral point plus the wrapped session key
+        key_material_len = _mpi_len(2 * bits + 8) + 1 + 48
+    else:
+        key_material_len = 2 * _mpi_len(PGP_DEFAULT_KEY_LENGTH)
+
+    binary_len = PGP_PKESK_OVERHEAD + key_material_len + \
+        PGP_ENCRYPTED_OVERHEAD + data_len + \
+        PGP_STREAM_CHUNK_OVERHEAD * ceil(data_len / PGP_STREAM_CHUNK)
+
+    if sign_key is not None:
+        binary_len += _calc_signature_len(sign_key)
+
+    return _armored_len(binary_len, PGP_MSG_ARMOR_LEN)
+
+
+def calc_clearsigned_len(data_len, sign_key):
+    """Estimate the length of a message clearsigned by GnuPG
+
+    Args:
+        data_len (int): Length of the data to be signed.
+        sign_key (dict): Private key information of the signer.
+
+    Returns:
+        int: Estimated length of the clearsigned message.
+
+    """
+    sig_len = _armored_len(_calc_signature_len(sign_key), PGP_SIG_ARMOR_LEN)
+    return PGP_CLEARSIGN_HEADER_LEN + data_len + 1 + sig_len
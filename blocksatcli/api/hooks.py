@@ -0,0 +1,417 @@
+"""Asynchronous execution of the commands triggered by API downloads"""
+import json
+import logging
+import os
+import shlex
+import subprocess
+import threading
+import time
+from collections import deque
+
+from .latency import Histogram
+from .writer import atomic_write
+
+logger = logging.getLogger(__name__)
+OVERFLOW_POLICIES = ['block', 'drop-oldest', 'spill']
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_CONCURRENCY = 1
+SPILL_FILE = 'hook-spill.jsonl'  # within the api/ config directory
+SPILL_OFFSET_SUFFIX = '.offset'  # file with the read offset of the spill file
+
+
+def run_cmd(cmd, timeout=None):
+    """Run a hook command
+
+    Args:
+        cmd     : Command given as a list of arguments.
+        timeout : Timeout in seconds, if any.
+
+    Returns:
+        Tuple with a boolean indicating whether the command succeeded and a
+        boolean indicating whether it timed out.
+
+    """
+    logger.debug("Exec:\n> {}".format(" ".join(cmd)))
+    try:
+        if (timeout is None):
+            res = subprocess.run(cmd)
+        else:
+            res = subprocess.run(cmd, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.warning("Command {} timed out after {} seconds".format(
+            cmd[0], timeout))
+        return False, True
+    except OSError as e:
+        logger.error("Failed to run {}: {}".format(cmd[0], e))
+        return False, False
+    if (res.returncode != 0):
+        logger.warning("Command {} returned {}".format(cmd[0], res.returncode))
+        return False, False
+    return True, False
+
+
+class HookExecutor():
+    """Executor of hook commands with a bounded queue
+
+    Runs the commands triggered by each download (e.g., the --exec command or
+    the gossip snapshot loading) on worker threads, so that the API listener
+    does not stall while they run. The jobs wait on a bounded queue and run in
+    submission order. When the queue is full, the overflow policy defines
+    what happens to a new job:
+
+    - "block": wait until the queue has room (the listener stalls).
+    - "drop-oldest": discard the oldest queued job.
+    - "spill": append the job to a spill file on disk, from which it is read
+      back once the queue has room. The spilled jobs survive restarts. The
+      read offset of the spill file is saved along with it, so that the jobs
+      already read back do not run again after a restart. Each spilled job
+      records the tag of the executor (e.g., the --exec command template),
+      and the jobs spilled under a different tag are discarded on resume.
+
+    Args:
+        concurrency : Number of jobs running concurrently.
+        queue_size  : Maximum number of jobs waiting in memory.
+        timeout     : Timeout in seconds for each command, if any.
+        overflow    : Overflow policy ("block", "drop-oldest", or "spill").
+        spill_path  : Path to the spill file, required by the "spill" policy.
+        tag         : String identifying the source of the jobs (e.g., the
+                      --exec command template). Only the spilled jobs with
+                      the same tag are resumed.
+
+    """
+
+    def __init__(self,
+                 concurrency=DEFAULT_CONCURRENCY,
+                 queue_size=DEFAULT_QUEUE_SIZE,
+                 timeout=None,
+                 overflow='block',
+                 spill_path=None,
+                 tag=None):
+        assert (concurrency > 0)
+        assert (queue_size > 0)
+        assert (overflow in OVERFLOW_POLICIES), \
+            "Unknown overflow policy {}".format(overflow)
+        if (overflow == 'spill' and spill_path is None):
+            raise ValueError("The spill overflow policy requires a spill file")
+
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.tag = tag
+        self._queue = deque()  # (cmds, callback, submission time)
+        self._cond = threading.Condition()
+        self._enabled = True
+
+        # Statistics
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.dropped = 0
+        self.spilled = 0  # jobs currently on the spill file
+        self.latency = Histogram()  # from submission to completion
+        self.run_time = Histogram()
+
+        if (overflow == 'spill'):
+            self._offset_path = spill_path + SPILL_OFFSET_SUFFIX
+            self._spill_offset = 0
+            self._resumed = 0  # spilled jobs left by a previous session
+            self._count_spilled()
+
+        self._workers = []
+        for _ in range(concurrency):
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _count_spilled(self):
+        """Count the jobs left on the spill file by a previous session"""
+        try:
+            with open(self._offset_path) as fd:
+                self._spill_offset = int(fd.read())
+        except (FileNotFoundError, ValueError):
+            self._spill_offset = 0
+
+        try:
+            # Terminate the last record if torn by a crash while spilling, so
+            # that the next record is not appended to it
+            with open(self.spill_path, 'rb+') as fd:
+                if (fd.seek(0, os.SEEK_END) > 0):
+                    fd.seek(-1, os.SEEK_END)
+                    if (fd.read(1) != b'\n'):
+                        fd.write(b'\n')
+
+            with open(self.spill_path) as fd:
+                fd.seek(self._spill_offset)
+                self.spilled = sum(1 for _ in fd)
+        except FileNotFoundError:
+            self._remove_spill_file()
+            return
+
+        if (self.spilled == 0):
+            self._remove_spill_file()
+            return
+
+        self._resumed = self.spilled
+        logger.info("Resuming {} hook command(s) spilled by a previous "
+                    "session".format(self.spilled))
+
+    def _remove_spill_file(self):
+        """Remove the spill file and its read offset"""
+        for path in [self._offset_path, self.spill_path]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._spill_offset = 0
+
+    def _spill(self, cmds):
+        """Append a job to the spill file (condition lock held)"""
+        with open(self.spill_path, 'a') as fd:
+            fd.write(json.dumps({'tag': self.tag, 'cmds': cmds}) + '\n')
+        self.spilled += 1
+
+    def _unspill(self):
+        """Move the next spilled job into the queue (condition lock held)
+
+        Skips the job if its record is invalid (e.g., torn by a crash while
+        spilling) or if it was spilled under a different tag. Spilled jobs do
+        not keep their callbacks and submission times, as they may come from
+        a previous session.
+
+        """
+        with open(self.spill_path) as fd:
+            fd.seek(self._spill_offset)
+            line = fd.readline()
+            self._spill_offset = fd.tell()
+        self.spilled -= 1
+        if (self.spilled == 0):
+            self._remove_spill_file()
+        else:
+            atomic_write(self._offset_path,
+                         str(self._spill_offset).encode(),
+                         fsync=False)
+
+        resumed = self._resumed > 0
+        if (resumed):
+            self._resumed -= 1
+
+        try:
+            record = json.loads(line)
+            cmds = record['cmds']
+            assert (isinstance(cmds, list))
+            assert (all(isinstance(cmd, list) for cmd in cmds))
+        except (ValueError, TypeError, KeyError, AssertionError):
+            logger.warning("Skipping invalid spilled hook command: {}".format(
+                line.strip()))
+            return
+
+        if (record.get('tag') != self.tag):
+            logger.warning("Discarding hook command spilled under a "
+                           "different --exec option ({}): {}".format(
+                               record.get('tag'),
+                               " ".join([" ".join(x) for x in cmds])))
+            return
+
+        if (resumed):
+            for cmd in cmds:
+                logger.info("Running spilled hook command: {}".format(
+                    " ".join(cmd)))
+        self._queue.append((cmds, None, None))
+
+    def get_backlog(self):
+        """Number of jobs waiting to run (in memory or spilled)"""
+        return len(self._queue) + self.spilled
+
+    def submit(self, cmds, callback=None):
+        """Submit a job
+
+        Args:
+            cmds     : List of commands to run sequentially, each given as a
+                       list of arguments.
+            callback : Optional callable to run after the commands, unless
+                       the job is dropped or spilled.
+
+        """
+        with self._cond:
+            if (self.overflow == 'spill' and self.spilled > 0):
+                # Preserve the order with respect to the spilled jobs
+                self._spill(cmds)
+                return
+
+            if (len(self._queue) >= self.queue_size):
+                if (self.overflow == 'block'):
+                    self._cond.wait_for(
+                        lambda: len(self._queue) < self.queue_size)
+                elif (self.overflow == 'drop-oldest'):
+                    self._queue.popleft()
+                    self.dropped += 1
+                    logger.warning("Hook queue full: dropping the oldest "
+                                   "command")
+                else:
+                    logger.debug("Hook queue full: spilling to disk")
+                    self._spill(cmds)
+                    return
+
+            self._queue.append((cmds, callback, time.monotonic()))
+            self._cond.notify_all()
+
+    def _run(self, cmds):
+        for cmd in cmds:
+            ok, timed_out = run_cmd(cmd, self.timeout)
+            if (timed_out):
+                self.timeouts += 1
+            if (not ok):
+                return False
+        return True
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._queue or self.spilled or not self._enabled)
+                while (not self._queue and self.spilled):
+                    self._unspill()
+                if (not self._queue):
+                    if (self._enabled):
+                        continue  # only invalid spilled jobs were left
+                    return  # disabled and nothing left to run
+                cmds, callback, t_submit = self._queue.popleft()
+                self.running += 1
+                self._cond.notify_all()
+
+            t_start = time.monotonic()
+            ok = self._run(cmds)
+            t_end = time.monotonic()
+
+            with self._cond:
+                self.running -= 1
+                if (ok):
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.run_time.observe(t_end - t_start)
+                if (t_submit is not None):
+                    self.latency.observe(t_end - t_submit)
+                self._cond.notify_all()
+
+            if (callback is not None):
+                callback()
+
+    def close(self, wait=True):
+        """Stop the executor
+
+        Args:
+            wait : Whether to run the queued jobs before returning. Otherwise,
+                   discard them, except for the spilled jobs, which remain on
+                   the spill file.
+
+        """
+        with self._cond:
+            if (not wait):
+                self._queue.clear()
+                self.spilled = 0
+            self._enabled = False
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+
+class GossipLoader():
+    """Loader of Lightning gossip snapshots with coalescing
+
+    Loads the received gossip snapshots via "historian-cli snapshot load" on a
+    background thread, one at a time. Since each snapshot is cumulative, only
+    the newest of the snapshots received while a load is running matters.
+    Hence, the loader keeps at most one snapshot waiting, which a newer
+    snapshot replaces. The replaced (skipped) snapshots are logged and
+    counted.
+
+    Args:
+        cli     : Path to the historian-cli executable.
+        dest    : Destination for the snapshots, if any.
+        timeout : Timeout in seconds for each load, if any.
+
+    """
+
+    def __init__(self, cli, dest=None, timeout=None):
+        self.cli = cli
+        self.dest = dest
+        self.timeout = timeout
+        self._pending = None  # (path, callback) waiting to be loaded
+        self._cond = threading.Condition()
+        self._enabled = True
+
+        # Statistics
+        self.loading = False
+        self.loaded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.load_time = Histogram()
+
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def get_cmd(self, path):
+        """Get the command that loads a snapshot"""
+        cmd = [self.cli, 'snapshot', 'load', shlex.quote(path)]
+        if (self.dest is not None):
+            cmd.append(self.dest)
+        return cmd
+
+    def submit(self, path, callback=None):
+        """Submit a snapshot for loading
+
+        Args:
+            path     : Path to the snapshot file.
+            callback : Optional callable to run once the snapshot is
+                       processed. It receives False if the snapshot was
+                       skipped in favor of a newer snapshot, or True once the
+                       load command finishes (even if unsuccessfully).
+
+        """
+        with self._cond:
+            skipped = self._pending
+            self._pending = (path, callback)
+            if (skipped is not None):
+                self.skipped += 1
+                logger.info("Skipping gossip snapshot {} in favor of the "
+                            "newer {}".format(skipped[0], path))
+            self._cond.notify_all()
+
+        if (skipped is not None and skipped[1] is not None):
+            skipped[1](False)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._pending is not None or not self._enabled)
+                if (self._pending is None):
+                    return
+                path, callback = self._pending
+                self._pending = None
+                self.loading = True
+
+            t_start = time.monotonic()
+            ok, _ = run_cmd(self.get_cmd(path), self.timeout)
+            self.load_time.observe(time.monotonic() - t_start)
+
+            with self._cond:
+                self.loading = False
+                if (ok):
+                    self.loaded += 1
+                else:
+                    self.failed += 1
+                self._cond.notify_all()
+
+            if (callback is not None):
+                callback(True)
+
+    def close(self):
+        """Load the pending snapshot, if any, and stop the loader"""
+        with self._cond:
+            self._enabled = False
+            self._cond.notify_all()
+        self._worker.join()
@@ -0,0 +1,125 @@
+"""Latency tracing of the received API messages"""
+import json
+import logging
+import threading
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+# Stages of the reception span of each API message, after the first packet
+SPAN_STAGES = ['last_pkt', 'decodable', 'decrypted', 'saved', 'hook_done']
+# Upper bounds of the histogram buckets in seconds
+HIST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+                2.5, 5, 10, 30, 60, 300)
+
+
+class Histogram():
+    """Histogram of latency values with fixed buckets
+
+    Args:
+        buckets : Sorted upper bounds of the buckets. Values above the last
+                  bound fall into an additional overflow bucket.
+
+    """
+
+    def __init__(self, buckets=HIST_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile from the bucket counts
+
+        Args:
+            q : Quantile between 0 and 1.
+
+        Returns:
+            Upper bound of the bucket holding the quantile, infinity if it is
+            the overflow bucket, or None if the histogram is empty.
+
+        """
+        if (self.count == 0):
+            return None
+        target = q * self.count
+        cum_count = 0
+        for i, count in enumerate(self.counts):
+            cum_count += count
+            if (cum_count >= target and count > 0):
+                break
+        return self.buckets[i] if i < len(self.buckets) else float('inf')
+
+
+class LatencyTracer():
+    """Tracer of the reception latency of API messages
+
+    Each message's span holds the timestamps (seconds since epoch) at which
+    the message reached each stage of SPAN_STAGES, starting from the arrival
+    of its first packet. The tracer accumulates a histogram per stage with the
+    latency since the first packet. Optionally, it also appends each span in
+    JSON Lines format to a trace file.
+
+    Args:
+        trace_file : Path to the trace file.
+
+    """
+
+    def __init__(self, trace_file=None):
+        self.histograms = {stage: Histogram() for stage in SPAN_STAGES}
+        self._lock = threading.Lock()
+        self._fd = open(trace_file, 'a') if trace_file else None
+
+    def record(self, span):
+        """Record the span of a received message
+
+        Args:
+            span : Dictionary with the message's sequence number ('seq_num'),
+                   channel ('chan_num'), first packet arrival ('first_pkt'),
+                   and the timestamps of the stages it reached. The stages
+                   not reached (e.g., when the message fails to decrypt or
+                   there is no hook to run) are omitted.
+
+        """
+        with self._lock:
+            for stage in SPAN_STAGES:
+                if (span.get(stage) is not None):
+                    self.histograms[stage].observe(span[stage] -
+                                                   span['first_pkt'])
+            if (self._fd is not None):
+                self._fd.write(json.dumps(span) + '\n')
+                self._fd.flush()
+
+    def get_histograms(self):
+        """Get a copy of the latency histograms of each span stage"""
+        with self._lock:
+            res = {}
+            for stage, hist in self.histograms.items():
+                res[stage] = Histogram(hist.buckets)
+                res[stage].counts = list(hist.counts)
+                res[stage].sum = hist.sum
+                res[stage].count = hist.count
+            return res
+
+    def log_summary(self, level=logging.INFO):
+        """Log the latency percentiles of each span stage"""
+        histograms = self.get_histograms()
+        if (histograms['decodable'].count == 0):
+            return
+        logger.log(level, "Latency since the first packet (upper bounds):")
+        for stage, hist in histograms.items():
+            if (hist.count == 0):
+                continue
+            logger.log(
+                level, "{:>10}: mean {:.3f} s, p50 {} s, p90 {} s, "
+                "p99 {} s ({} msgs)".format(stage, hist.sum / hist.count,
+                                            hist.quantile(0.5),
+                                            hist.quantile(0.9),
+                                            hist.quantile(0.99), hist.count))
+
+    def close(self):
+        if (self._fd is not None):
+            self._fd.close()
@@ -1,16 +1,24 @@
+import functools
 import logging
+import os
 import queue
 import shlex
-import subprocess
 import time
 from threading import Event
 
 from . import msg as api_msg
 from . import net
+from .capture import CaptureWriter
+from .hooks import GossipLoader, HookExecutor
+from .latency import LatencyTracer
+from .metrics import ListenerMetrics
 from .order import ApiChannel, ApiOrder
 from .pkt import BlocksatPkt, BlocksatPktHandler
+from .writer import remove_tmp_files
 
 logger = logging.getLogger(__name__)
+RCVBUF_DURATION = 2  # seconds of incoming traffic held by the Rx buffer
+DROP_CHECK_INTERVAL = 1  # interval in seconds between kernel drop checks
 
 
 class ApiListener():
@@ -35,6 +43,52 @@ class ApiListener():
         self.recv_queue = recv_queue
         self.recv_timeout = recv_timeout
         self.recv_loop_ready = Event()
+        self.kernel_drops = 0
+        self._last_drop_check = 0
+        self.tracer = None
+        self.metrics = ListenerMetrics()
+
+    def _check_kernel_drops(self, sock):
+        """Report the packets dropped by the kernel on the Rx socket
+
+        The kernel drops the packets when the receive buffer overflows, i.e.,
+        when the listener does not keep up with the incoming rate. Hence,
+        unlike fragment gaps, these drops are not caused by the satellite
+        reception.
+
+        """
+        now = time.monotonic()
+        if (now - self._last_drop_check < DROP_CHECK_INTERVAL):
+            return
+        self._last_drop_check = now
+
+        drops = sock.get_drops()
+        if (drops is None or drops <= self.kernel_drops):
+            return
+        # Without the socket's own counter (see UdpSock.enable_drop_count),
+        # the drops could come from any UDP socket on the host
+        scope = "" if sock.rxq_ovfl else " on this host"
+        logger.warning(
+            "{} UDP packet(s) dropped{} due to receive buffer overflow "
+            "(total: {}). The listener may not be keeping up with the "
+            "incoming packets. Consider increasing the receive buffer (see "
+            "option --rx-rate and the net.core.rmem_max sysctl).".format(
+                drops - self.kernel_drops, scope, drops))
+        self.kernel_drops = drops
+        self.metrics.kernel_drops = drops
+
+    def _on_hook_done(self, span, done=True):
+        """Record the span of a message once its hooks are done
+
+        Args:
+            span : Span of the message.
+            done : Whether the hooks ran. False if skipped (e.g., a gossip
+                   snapshot superseded by a newer one).
+
+        """
+        if (done):
+            span['hook_done'] = time.time()
+        self.tracer.record(span)
 
     def stop(self):
         logger.debug("Stopping API listener")
@@ -57,7 +111,15 @@ class ApiListener():
             server_addr=None,
             tls_cert=None,
             tls_key=None,
-            region=None):
+            region=None,
+            capture=None,
+            pkt_source=None,
+            rx_rate=None,
+            trace=None,
+            metrics_port=None,
+            writer=None,
+            hook_executor=None,
+            plugins=None):
         """Run loop
 
         Args:
@@ -78,18 +140,87 @@ class ApiListener():
             tls_cert     : TLS client cert to authenticate on Rx confirmations
             tls_key      : TLS client key to authenticate on Rx confirmations
             region       : Satellite region to inform on Rx confirmations
+            capture      : Path to a file on which to capture the received
+                           UDP packets
+            pkt_source   : Iterable of (UDP payload, source address) tuples to
+                           process instead of the packets received via the
+                           socket, e.g., to replay a capture. The loop stops
+                           when the iterable is exhausted.
+            rx_rate      : Expected peak rate of the incoming packets in
+                           bits/sec used to size the socket receive buffer.
+                           If None, keep the system's default buffer size.
+            trace        : Path to a file on which to append the latency
+                           span of each received message (see latency.py).
+            metrics_port : Port on which to serve the listener metrics via
+                           HTTP in Prometheus text format, if defined.
+            writer       : DownloadWriter used to save the downloads. If
+                           None, save them synchronously without syncing.
+            hook_executor: HookExecutor used to run the --exec commands. If
+                           None, use a default executor and wait for the
+                           pending commands before returning.
+            plugins      : PluginPool feeding the decoded messages to
+                           in-process consumers, if any.
 
         """
         logger.debug("Starting API listener")
 
-        # Open UDP socket
-        sock = net.UdpSock(sock_addr, interface)
-        sock.sock.settimeout(self.recv_timeout)
+        # Open UDP socket, unless processing packets from another source
+        if (pkt_source is None):
+            sock = net.UdpSock(sock_addr, interface)
+            sock.sock.settimeout(self.recv_timeout)
+            # Drop the packets from other channels within the kernel
+            if (channel != ApiChannel.ALL.value):
+                sock.set_chan_filter(channel)
+            # Buffer enough traffic to absorb the processing stalls (e.g.,
+            # while decrypting a large message) and count the packets dropped
+            # when the buffer overflows anyway
+            if (rx_rate):
+                rcvbuf = int(rx_rate / 8 * RCVBUF_DURATION)
+                if (sock.set_rcvbuf(rcvbuf) < rcvbuf):
+                    logger.debug("UDP receive buffer limited below the {} "
+                                 "bytes recommended for {:g} kbps".format(
+                                     rcvbuf, rx_rate / 1e3))
+            sock.enable_drop_count()
+            sock.enable_timestamps()
+            self.kernel_drops = 0
+            pkt_iter = None
+        else:
+            pkt_iter = iter(pkt_source)
+
+        # Optional capture of the received packets
+        capture_writer = CaptureWriter(capture) if capture else None
+
+        # Clean up the partial downloads of a previous session
+        if (not no_save and os.path.isdir(download_dir)):
+            remove_tmp_files(download_dir)
+
+        # Latency tracing since the arrival of the first packet of each message
+        self.tracer = LatencyTracer(trace)
 
         # Handler to collect groups of Blocksat packets that form an API
         # message
         pkt_handler = BlocksatPktHandler()
 
+        # Executor of the commands triggered by each download
+        hooks = hook_executor or HookExecutor()
+
+        # Loader of the gossip snapshots (at most one load at a time)
+        if (gossip_opts is not None):
+            gossip_loader = GossipLoader(gossip_opts['cli'],
+                                         gossip_opts['dest'],
+                                         timeout=hooks.timeout)
+        else:
+            gossip_loader = None
+
+        # Metrics
+        self.metrics.pkt_handler = pkt_handler
+        self.metrics.tracer = self.tracer
+        self.metrics.hooks = hooks
+        self.metrics.plugins = plugins
+        self.metrics.gossip = gossip_loader
+        if (metrics_port is not None):
+            self.metrics.start_server(metrics_port)
+
         # Set of decoded messages (to avoid repeated decoding)
         decoded_msgs = set()
 
@@ -101,16 +232,32 @@ class ApiListener():
                 ready_flagged = True
 
             try:
-                udp_payload, addr = sock.recv()
+                if (pkt_iter is None):
+                    udp_payload, addr = sock.recv()
+                else:
+                    udp_payload, addr = next(pkt_iter)
+            except StopIteration:
+                break
             except TimeoutError:
+                self._check_kernel_drops(sock)
                 time.sleep(2)
                 continue
             except KeyboardInterrupt:
                 break
 
+            if (pkt_iter is None):
+                self._check_kernel_drops(sock)
+                rx_time = sock.rx_time
+            else:
+                rx_time = None
+
+            if (capture_writer is not None):
+                capture_writer.write(udp_payload, addr)
+
             # Cast payload to BlocksatPkt object
             pkt = BlocksatPkt()
-            pkt.unpack(udp_payload)
+            pkt.unpack(udp_payload, rx_time)
+            self.metrics.count_pkt(pkt.chan_num, len(udp_payload))
 
             # Filter API channel
             if (channel != ApiChannel.ALL.value and pkt.chan_num != channel):
@@ -144,6 +291,14 @@ class ApiListener():
                 continue
 
             # API message is ready to be decoded
+            t_first_pkt, t_last_pkt = pkt_handler.get_rx_times(seq_num)
+            span = {
+                'seq_num': seq_num,
+                'chan_num': pkt.chan_num,
+                'first_pkt': t_first_pkt,
+                'last_pkt': t_last_pkt,
+                'decodable': time.time()
+            }
             if (channel == ApiChannel.ALL.value):
                 logger.info("-------- API message {:d} (channel {:d})".format(
                     seq_num, pkt.chan_num))
@@ -165,6 +320,7 @@ class ApiListener():
             if (fec_decodable):
                 msg.fec_decode()
                 data = msg.data['original']
+                self.metrics.fec_decodes += 1
             else:
                 data = pkt_handler.concat(seq_num)
 
@@ -172,13 +328,14 @@ class ApiListener():
             decoded_msgs.add(chan_seq_num)
 
             # Delete message from the packet handler
-            del pkt_handler.frag_map[seq_num]
+            pkt_handler.remove(seq_num)
 
             # Clean up old (timed-out) messages from the packet handler
             pkt_handler.clean()
 
             if (len(data) <= 0):
                 logger.warning("Empty message")
+                self.tracer.record(span)
                 continue
 
             # The FEC-decoded data could be encrypted, signed, and/or
@@ -187,19 +344,39 @@ class ApiListener():
                                  plaintext=plaintext,
                                  decapsulate=(not save_raw),
                                  sender=sender,
-                                 gpg=gpg)
+                                 gpg=gpg,
+                                 drop_stats=self.metrics.drops)
             if (msg is None):
+                self.tracer.record(span)
                 continue
+            span['decrypted'] = time.time()
 
             # Finalize the processing of the decoded message
+            download_path = None
             if (stdout):
                 msg.serialize()
             elif (not no_save):
-                download_path = msg.save(download_dir)
+                download_path = msg.save(download_dir, writer=writer)
+            span['saved'] = time.time()
+            self.metrics.decoded_msgs += 1
+            self.metrics.save_latency.observe(span['saved'] -
+                                              span['decrypted'])
 
             if (self.recv_queue is not None):
                 self.recv_queue.put(msg.get_data(target='original'))
 
+            # The plugins receive the data in memory. With the background
+            # writer, the file at the given path may still be in flight.
+            if (plugins is not None):
+                plugins.submit(
+                    msg.get_data(target='original'), {
+                        'chan_num': pkt.chan_num,
+                        'seq_num': seq_num,
+                        'signer': msg.signer,
+                        'filename': msg.filename,
+                        'path': download_path
+                    })
+
             if (echo):
                 # Not all messages can be decoded in UTF-8 (binary files
                 # cannot). Also, messages that were not sent in plaintext and
@@ -213,22 +390,38 @@ class ApiListener():
             else:
                 logger.debug("Message: {}".format(msg.data['original']))
 
+            # The hooks open the downloaded file, so wait for its write (but
+            # not for its sync to disk)
+            if ((exec_cmd or gossip_opts is not None) and writer is not None
+                    and download_path is not None):
+                writer.wait()
+
+            # Run the hooks asynchronously and record the span once done
             if (exec_cmd):
                 cmd = shlex.split(
                     exec_cmd.replace("{}", shlex.quote(download_path)))
-                logger.debug("Exec:\n> {}".format(" ".join(cmd)))
-                subprocess.run(cmd)
-
-            if (gossip_opts is not None):
-                cmd = [
-                    gossip_opts['cli'], 'snapshot', 'load',
-                    shlex.quote(download_path)
-                ]
-                if (gossip_opts['dest'] is not None):
-                    cmd.append(gossip_opts['dest'])
-
-                logger.debug("Exec:\n> {}".format(" ".join(cmd)))
-                subprocess.run(cmd)
+                hooks.submit([cmd],
+                             callback=functools.partial(
+                                 self._on_hook_done, span))
+            elif (gossip_opts is not None):
+                gossip_loader.submit(download_path,
+                                     callback=functools.partial(
+                                         self._on_hook_done, span))
+            else:
+                self.tracer.record(span)
 
             if (self.recv_once):
                 self.stop()
+
+        if (capture_writer is not None):
+            capture_writer.close()
+
+        # Wait for the pending hooks
+        if (hook_executor is None):
+            hooks.close()
+        if (gossip_loader is not None):
+            gossip_loader.close()
+
+        self.tracer.log_summary(logging.INFO if trace else logging.DEBUG)
+        self.tracer.close()
+        self.metrics.stop_server()
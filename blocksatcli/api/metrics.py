@@ -0,0 +1,211 @@
+"""Metrics of the API listener in Prometheus text format"""
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from .latency import Histogram
+
+logger = logging.getLogger(__name__)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRIC_PREFIX = 'blocksat_api_'
+
+
+class ListenerMetrics():
+    """Counters of the API listener
+
+    The counters are plain integers and dictionaries updated exclusively by
+    the listener thread, so the hot path takes no locks. The HTTP server
+    thread only reads them (or takes atomic copies of the dictionaries) when
+    rendering the metrics, which is safe under the GIL.
+
+    """
+
+    def __init__(self):
+        self.rx_pkts = {}  # received packets per channel
+        self.rx_bytes = {}  # received bytes per channel
+        self.fec_decodes = 0
+        self.decoded_msgs = 0
+        self.drops = {}  # dropped messages per reason (see msg.decode)
+        self.kernel_drops = 0
+        self.save_latency = Histogram()
+        self.pkt_handler = None  # BlocksatPktHandler in use
+        self.tracer = None  # LatencyTracer in use
+        self.hooks = None  # HookExecutor in use
+        self.plugins = None  # PluginPool in use
+        self.gossip = None  # GossipLoader in use
+        self.httpd = None
+
+    def count_pkt(self, chan_num, n_bytes):
+        """Count a received packet"""
+        self.rx_pkts[chan_num] = self.rx_pkts.get(chan_num, 0) + 1
+        self.rx_bytes[chan_num] = self.rx_bytes.get(chan_num, 0) + n_bytes
+
+    def render(self):
+        """Render the metrics in Prometheus text exposition format
+
+        Returns:
+            String with the metrics.
+
+        """
+        lines = []
+
+        def add(name, mtype, help_str, samples):
+            lines.append('# HELP {}{} {}'.format(METRIC_PREFIX, name,
+                                                 help_str))
+            lines.append('# TYPE {}{} {}'.format(METRIC_PREFIX, name, mtype))
+            for suffix, labels, value in samples:
+                label_str = ','.join(
+                    ['{}="{}"'.format(k, v) for k, v in labels.items()])
+                lines.append('{}{}{}{} {}'.format(
+                    METRIC_PREFIX, name, suffix,
+                    '{' + label_str + '}' if label_str else '', value))
+
+        def hist_samples(hist, labels={}):
+            samples = []
+            cum_count = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cum_count += count
+                samples.append(('_bucket', dict(labels, le=bound), cum_count))
+            samples.append(('_bucket', dict(labels, le='+Inf'), hist.count))
+            samples.append(('_sum', labels, hist.sum))
+            samples.append(('_count', labels, hist.count))
+            return samples
+
+        rx_pkts = dict(self.rx_pkts)
+        rx_bytes = dict(self.rx_bytes)
+        add('rx_packets_total', 'counter', 'Received packets per channel',
+            [('', {
+                'channel': k
+            }, v) for k, v in sorted(rx_pkts.items())])
+        add('rx_bytes_total', 'counter', 'Received bytes per channel',
+            [('', {
+                'channel': k
+            }, v) for k, v in sorted(rx_bytes.items())])
+        add('kernel_drops_total', 'counter',
+            'Packets dropped due to socket receive buffer overflow',
+            [('', {}, self.kernel_drops)])
+
+        handler = self.pkt_handler
+        if (handler is not None):
+            add('duplicate_fragments_total', 'counter',
+                'Repeated message fragments', [('', {}, handler.dup_frags)])
+            add('out_of_order_fragments_total', 'counter',
+                'Message fragments received out of order',
+                [('', {}, handler.ooo_frags)])
+            add('partial_messages', 'gauge', 'Messages pending reassembly',
+                [('', {}, len(handler.frag_map))])
+            add('reassembly_bytes', 'gauge',
+                'Payload bytes held for message reassembly',
+                [('', {}, handler.pending_bytes)])
+
+        add('fec_decodes_total', 'counter', 'Messages decoded via FEC',
+            [('', {}, self.fec_decodes)])
+        add('decoded_messages_total', 'counter',
+            'Messages decoded successfully', [('', {}, self.decoded_msgs)])
+        add('dropped_messages_total', 'counter',
+            'Messages dropped on decoding per reason', [('', {
+                'reason': k
+            }, v) for k, v in sorted(dict(self.drops).items())])
+        add('save_seconds', 'histogram', 'Time taken to save each message',
+            hist_samples(self.save_latency))
+
+        hooks = self.hooks
+        if (hooks is not None):
+            add('hook_backlog', 'gauge',
+                'Hooks (--exec commands) waiting to run',
+                [('', {}, hooks.get_backlog())])
+            add('hooks_running', 'gauge', 'Hooks running',
+                [('', {}, hooks.running)])
+            add('hooks_total', 'counter', 'Hooks executed per result',
+                [('', {
+                    'result': 'completed'
+                }, hooks.completed), ('', {
+                    'result': 'failed'
+                }, hooks.failed)])
+            add('hook_timeouts_total', 'counter', 'Hooks that timed out',
+                [('', {}, hooks.timeouts)])
+            add('hook_drops_total', 'counter',
+                'Hooks dropped due to a full queue', [('', {}, hooks.dropped)])
+            add('hook_latency_seconds', 'histogram',
+                'Time from the submission to the completion of each hook',
+                hist_samples(hooks.latency))
+
+        gossip = self.gossip
+        if (gossip is not None):
+            add('gossip_loads_total', 'counter',
+                'Gossip snapshot loads per result', [('', {
+                    'result': 'completed'
+                }, gossip.loaded), ('', {
+                    'result': 'failed'
+                }, gossip.failed)])
+            add('gossip_skipped_total', 'counter',
+                'Gossip snapshots skipped in favor of newer ones',
+                [('', {}, gossip.skipped)])
+            add('gossip_load_seconds', 'histogram',
+                'Time taken to load each gossip snapshot',
+                hist_samples(gossip.load_time))
+
+        plugins = self.plugins
+        if (plugins is not None):
+            add('plugin_backlog', 'gauge',
+                'Messages waiting for the in-process plugins',
+                [('', {}, plugins.get_backlog())])
+            add('plugin_messages_total', 'counter',
+                'Messages consumed by the in-process plugins',
+                [('', {}, plugins.delivered)])
+            add('plugin_errors_total', 'counter',
+                'Exceptions raised by the in-process plugins',
+                [('', {}, plugins.errors)])
+            add('plugin_stalls_total', 'counter',
+                'Messages that waited for room in the plugin queue',
+                [('', {}, plugins.stalls)])
+
+        if (self.tracer is not None):
+            samples = []
+            for stage, hist in self.tracer.get_histograms().items():
+                samples += hist_samples(hist, {'stage': stage})
+            add('rx_latency_seconds', 'histogram',
+                'Latency since the first packet of each message per stage',
+                samples)
+
+        return '\n'.join(lines) + '\n'
+
+    def start_server(self, port, addr=''):
+        """Serve the metrics via HTTP on a daemon thread
+
+        Args:
+            port : Server's HTTP port.
+            addr : Address to bind to.
+
+        Returns:
+            Port on which the server is listening.
+
+        """
+        MetricsServer.metrics = self
+        self.httpd = HTTPServer((addr, port), MetricsServer)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        logger.info("Serving listener metrics at http://{}:{}/metrics".format(
+            addr or '0.0.0.0', self.httpd.server_port))
+        return self.httpd.server_port
+
+    def stop_server(self):
+        if (self.httpd is not None):
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+class MetricsServer(BaseHTTPRequestHandler):
+    """Server that replies the listener metrics requested via HTTP"""
+    metrics = None  # trick to access the ListenerMetrics object
+
+    def do_GET(self):
+        body = self.metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
@@ -0,0 +1,675 @@
+"""Mock Satellite API server
+
+In-memory implementation of the Satellite API endpoints used by the API
+clients, for offline testing and benchmarking of the transmission pipeline
+(send, demo-rx, and listen).
+
+"""
+import email.parser
+import email.policy
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+
+from .. import defs
+from .order import API_CHANNEL_SSE_NAME, PAID_API_CHANNELS, ApiChannel
+from .pkt import calc_ota_msg_len
+
+logger = logging.getLogger(__name__)
+
+# Order queues and the order states listed on each of them
+QUEUE_STATES = {
+    'pending': ['pending'],
+    'paid': ['paid'],
+    'transmitting': ['transmitting'],
+    'confirming': ['confirming'],
+    'queued': ['paid', 'transmitting', 'confirming'],
+    'sent': ['sent', 'received'],
+    'rx-pending': ['sent'],
+    'received': ['received'],
+    'retransmitting': []
+}
+ACTIVE_STATES = ['pending', 'paid', 'transmitting', 'confirming']
+SSE_KEEPALIVE_INTERVAL = 15  # interval between SSE keep-alive comments
+DEFAULT_MSAT_PER_USD = 3e6  # default exchange rate
+
+
+class ApiError(Exception):
+    """Error returned to the client in the Satellite API error format"""
+
+    def __init__(self, status, title, detail=None):
+        super().__init__(title)
+        self.status = status
+        self.title = title
+        self.detail = detail
+
+    def to_dict(self):
+        error = {'title': self.title, 'code': self.status}
+        if (self.detail is not None):
+            error['detail'] = self.detail
+        return {'errors': [error]}
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class MockApiServer():
+    """Mock Satellite API server
+
+    Keeps the orders and messages in memory and moves the orders through the
+    same states as the actual server. Unpaid orders are paid automatically
+    after a configurable delay. Then, the paid orders are transmitted one at
+    a time on each channel, by order of bid per byte, and each transmission
+    lasts as long as the message would take to be transmitted at the
+    configured bit rate, unless all regions confirm the transmission sooner.
+    Finally, the orders become received once all regions confirm the
+    reception. The state changes are broadcast as server-sent events.
+
+    Args:
+        latency    : Delay in seconds added to every response.
+        pay_delay  : Delay in seconds until orders are paid automatically.
+                     Negative to disable the automatic payment.
+        tx_rate    : Simulated transmission bit rate in kbps. Zero for
+                     instantaneous transmissions.
+        max_queued : Maximum number of active orders per channel. New
+                     orders are rejected while the channel is full.
+        regions    : Satellite regions covered by the transmissions.
+        msat_per_usd : Exchange rate returned by /currency/rate.
+
+    """
+
+    def __init__(self,
+                 latency=0,
+                 pay_delay=0,
+                 tx_rate=1000,
+                 max_queued=None,
+                 regions=None,
+                 msat_per_usd=DEFAULT_MSAT_PER_USD):
+        self.latency = latency
+        self.pay_delay = pay_delay
+        self.tx_rate = tx_rate
+        self.max_queued = max_queued
+        self.regions = regions or defs.satellite_regions
+        self.msat_per_usd = msat_per_usd
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._orders = {}  # uuid -> order
+        self._tokens = {}  # uuid -> authentication token
+        self._messages = {}  # tx_seq_num -> data
+        self._seq_orders = {}  # tx_seq_num -> uuid
+        self._deadlines = {}  # uuid -> time of the next state change
+        self._next_seq_num = 1
+        self._subscribers = []  # (channel names, queue)
+        self._stopped = False
+        self._httpd = None
+        self._threads = []
+
+    # Order management
+
+    def _public(self, order):
+        """Order information returned to the clients"""
+        return {k: v for k, v in order.items() if not k.startswith('_')}
+
+    def _broadcast(self, order, regions=None):
+        """Broadcast an order state change (lock must be held)
+
+        Args:
+            order   : Order dictionary.
+            regions : Regions to include on the event. Defaults to the
+                      regions still pending transmission confirmation.
+
+        """
+        event = self._public(order)
+        if (regions is None):
+            regions = [
+                x for x in order['regions']
+                if x not in order['tx_confirmations']
+            ]
+        event['regions'] = regions
+        channel_name = API_CHANNEL_SSE_NAME.get(order['channel'])
+        data = json.dumps(event)
+        for channels, q in self._subscribers:
+            if (channel_name in channels):
+                q.put((channel_name, data))
+
+    def _set_status(self, order, status):
+        """Change the order state and notify the subscribers (lock held)"""
+        logger.debug("Order {} (seq {}): {} -> {}".format(
+            order['uuid'], order['tx_seq_num'], order['status'], status))
+        order['status'] = status
+        self._broadcast(order)
+
+    def _n_active(self, channel):
+        return len([
+            x for x in self._orders.values()
+            if x['channel'] == channel and x['status'] in ACTIVE_STATES
+        ])
+
+    def create_order(self, data, bid=None, channel=None, regions=None):
+        """Create a new order
+
+        Args:
+            data    : Message data.
+            bid     : Bid in msat.
+            channel : API channel.
+            regions : List of regions over which to transmit the order.
+
+        Returns:
+            Dictionary with the order UUID, authentication token, and the
+            Lightning invoice (for orders on paid channels).
+
+        """
+        channel = ApiChannel.USER.value if channel is None else channel
+        if (channel not in API_CHANNEL_SSE_NAME):
+            raise ApiError(400, "Invalid channel",
+                           "Channel {} is not supported".format(channel))
+        if (len(data) == 0):
+            raise ApiError(400, "Message file is empty")
+
+        paid_channel = channel in PAID_API_CHANNELS
+        if (paid_channel and bid is None):
+            raise ApiError(400, "Bid not provided")
+        bid = bid or 0
+
+        regions = regions or self.regions
+        if (any([x not in self.regions for x in regions])):
+            raise ApiError(400, "Invalid region")
+
+        with self._cond:
+            if (self.max_queued is not None
+                    and self._n_active(channel) >= self.max_queued):
+                raise ApiError(503, "Queue full",
+                               "Too many orders on channel {}".format(channel))
+
+            order_uuid = str(uuid4())
+            auth_token = str(uuid4())
+            order = {
+                'uuid': order_uuid,
+                'bid': 0,
+                'unpaid_bid': bid,
+                'bid_per_byte': 0,
+                'message_size': len(data),
+                'message_digest': hashlib.sha256(data).hexdigest(),
+                'status': 'pending',
+                'channel': channel,
+                'regions': list(regions),
+                'tx_seq_num': None,
+                'created_at': _timestamp(),
+                'started_transmission_at': None,
+                'ended_transmission_at': None,
+                'tx_confirmations': [],
+                'rx_confirmations': [],
+                'retransmission': None,
+                '_data': data
+            }
+            self._orders[order_uuid] = order
+            self._tokens[order_uuid] = auth_token
+
+            if (not paid_channel):
+                self._pay(order)
+            elif (self.pay_delay >= 0):
+                self._deadlines[order_uuid] = time.monotonic() + \
+                    self.pay_delay
+            self._cond.notify()
+
+        res = {'uuid': order_uuid, 'auth_token': auth_token}
+        if (paid_channel):
+            res['lightning_invoice'] = self._invoice(order_uuid, bid)
+        return res
+
+    def _invoice(self, order_uuid, msat):
+        """Mock Lightning invoice"""
+        return {
+            'id': str(uuid4()),
+            'msatoshi': str(msat),
+            'description': 'Mock Satellite API order',
+            'payreq': 'lnmock' + uuid4().hex,
+            'status': 'unpaid',
+            'metadata': {
+                'uuid': order_uuid
+            }
+        }
+
+    def _pay(self, order):
+        """Pay the unpaid bid of an order (lock must be held)"""
+        order['bid'] += order['unpaid_bid']
+        order['unpaid_bid'] = 0
+        order['bid_per_byte'] = order['bid'] / calc_ota_msg_len(
+            order['message_size'])
+        if (order['status'] == 'pending'):
+            self._set_status(order, 'paid')
+
+    def _get_order(self, order_uuid, auth_token=None, admin=False):
+        """Get an order, checking the authentication token (lock held)"""
+        if (order_uuid not in self._orders):
+            raise ApiError(404, "Order not found",
+                           "UUID {} not found".format(order_uuid))
+        if (not admin and auth_token != self._tokens[order_uuid]):
+            raise ApiError(401, "Unauthorized", "Invalid authentication token")
+        return self._orders[order_uuid]
+
+    def get_order(self, order_uuid, auth_token=None, admin=False):
+        """Get the information of an order"""
+        with self._lock:
+            return self._public(self._get_order(order_uuid, auth_token, admin))
+
+    def cancel_order(self, order_uuid, auth_token=None, admin=False):
+        """Cancel an order that was not transmitted yet"""
+        with self._lock:
+            order = self._get_order(order_uuid, auth_token, admin)
+            if (order['status'] not in ['pending', 'paid']):
+                raise ApiError(400, "Cannot cancel order",
+                               "Order already {}".format(order['status']))
+            self._deadlines.pop(order_uuid, None)
+            self._set_status(order, 'cancelled')
+        return {'message': 'order cancelled'}
+
+    def bump_order(self, order_uuid, bid_increase, auth_token=None):
+        """Increase the bid of an order"""
+        with self._cond:
+            order = self._get_order(order_uuid, auth_token)
+            if (order['status'] not in ['pending', 'paid']):
+                raise ApiError(400, "Cannot bump order",
+                               "Order already {}".format(order['status']))
+            if (bid_increase <= 0):
+                raise ApiError(400, "Invalid bid increase")
+            order['unpaid_bid'] += bid_increase
+            if (self.pay_delay >= 0):
+                self._deadlines[order_uuid] = time.monotonic() + \
+                    self.pay_delay
+            self._cond.notify()
+        return {
+            'auth_token': auth_token,
+            'lightning_invoice': self._invoice(order_uuid, bid_increase)
+        }
+
+    def list_orders(self, queue_name, channel=None, limit=20):
+        """List the orders of a queue
+
+        Args:
+            queue_name : Order queue.
+            channel    : API channel.
+            limit      : Maximum number of orders.
+
+        Returns:
+            List with the most recent orders of the queue.
+
+        """
+        if (queue_name not in QUEUE_STATES):
+            raise ApiError(404, "Queue not found")
+        channel = ApiChannel.USER.value if channel is None else channel
+        with self._lock:
+            orders = [
+                self._public(x) for x in reversed(list(self._orders.values()))
+                if x['channel'] == channel
+                and x['status'] in QUEUE_STATES[queue_name]
+            ]
+        return orders[:limit]
+
+    def get_message(self, seq_num):
+        """Get the data of a transmitted message"""
+        with self._lock:
+            if (seq_num not in self._messages):
+                raise ApiError(404, "Message not found",
+                               "Sequence number {} not found".format(seq_num))
+            return self._messages[seq_num]
+
+    def _get_order_by_seq_num(self, seq_num):
+        if (seq_num not in self._seq_orders):
+            raise ApiError(404, "Message not found",
+                           "Sequence number {} not found".format(seq_num))
+        return self._orders[self._seq_orders[seq_num]]
+
+    def confirm_tx(self, seq_num, regions):
+        """Confirm the transmission of a message over the given regions"""
+        with self._cond:
+            order = self._get_order_by_seq_num(seq_num)
+            for region in regions:
+                if (region not in order['tx_confirmations']):
+                    order['tx_confirmations'].append(region)
+            confirmed = all(
+                [x in order['tx_confirmations'] for x in order['regions']])
+            if (order['status'] == 'transmitting' and confirmed):
+                self._end_transmission(order)
+                self._cond.notify()
+        return {
+            'message': 'transmission confirmed for regions {}'.format(regions)
+        }
+
+    def confirm_rx(self, seq_num, region):
+        """Confirm the reception of a message on the given region"""
+        with self._lock:
+            order = self._get_order_by_seq_num(seq_num)
+            if (region not in order['rx_confirmations']):
+                order['rx_confirmations'].append(region)
+            confirmed = all(
+                [x in order['rx_confirmations'] for x in order['regions']])
+            if (order['status'] == 'sent' and confirmed):
+                self._set_status(order, 'received')
+        return {'message': 'reception confirmed for region {}'.format(region)}
+
+    def get_rate(self):
+        """Get the exchange rates"""
+        return {'base': 'usd', 'rates': {'msatoshi': self.msat_per_usd}}
+
+    # Transmission scheduling
+
+    def _start_transmission(self, order, now):
+        """Start transmitting an order (lock must be held)"""
+        seq_num = self._next_seq_num
+        self._next_seq_num += 1
+        order['tx_seq_num'] = seq_num
+        order['started_transmission_at'] = _timestamp()
+        self._messages[seq_num] = order.pop('_data')
+        self._seq_orders[seq_num] = order['uuid']
+        tx_len = calc_ota_msg_len(order['message_size'])
+        duration = tx_len * 8 / (self.tx_rate * 1e3) if self.tx_rate > 0 \
+            else 0
+        self._deadlines[order['uuid']] = now + duration
+        self._set_status(order, 'transmitting')
+
+    def _end_transmission(self, order):
+        """End the transmission of an order (lock must be held)"""
+        self._deadlines.pop(order['uuid'], None)
+        order['ended_transmission_at'] = _timestamp()
+        # The transmission events carry all regions, as in the Tx trigger
+        # events sent by the actual server.
+        order['status'] = 'sent'
+        self._broadcast(order, regions=order['regions'])
+
+    def _schedule(self, now):
+        """Process the pending state changes (lock must be held)
+
+        Returns:
+            Time of the next scheduled state change, if any.
+
+        """
+        # Payments and transmissions due
+        for order_uuid, deadline in list(self._deadlines.items()):
+            if (deadline > now):
+                continue
+            order = self._orders[order_uuid]
+            if (order['status'] in ['pending', 'paid']):
+                del self._deadlines[order_uuid]
+                self._pay(order)
+            elif (order['status'] == 'transmitting'):
+                self._end_transmission(order)
+
+        # Start the next transmission on each idle channel
+        busy = set([
+            x['channel'] for x in self._orders.values()
+            if x['status'] == 'transmitting'
+        ])
+        for channel in API_CHANNEL_SSE_NAME:
+            if (channel in busy):
+                continue
+            paid = [
+                x for x in self._orders.values()
+                if x['channel'] == channel and x['status'] == 'paid'
+            ]
+            if (paid):
+                self._start_transmission(
+                    max(paid, key=lambda x: x['bid_per_byte']), now)
+
+        return min(self._deadlines.values()) if self._deadlines else None
+
+    def _run_scheduler(self):
+        """Scheduler loop"""
+        with self._cond:
+            while (not self._stopped):
+                next_deadline = self._schedule(time.monotonic())
+                timeout = None if next_deadline is None else max(
+                    next_deadline - time.monotonic(), 0)
+                self._cond.wait(timeout)
+
+    # Server-sent events
+
+    def subscribe(self, channels):
+        """Subscribe to the events of the given channels
+
+        Args:
+            channels : List of SSE channel names.
+
+        Returns:
+            Queue receiving tuples with the channel name and event data.
+
+        """
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.append((channels, q))
+        return q
+
+    def unsubscribe(self, q):
+        """Cancel a subscription"""
+        with self._lock:
+            self._subscribers = [x for x in self._subscribers if x[1] is not q]
+
+    # Server
+
+    def start(self, host='127.0.0.1', port=0):
+        """Start serving the API on background threads
+
+        Args:
+            host : Address to bind.
+            port : Port to bind. Zero to choose any free port.
+
+        Returns:
+            Server base URL.
+
+        """
+        self._httpd = ThreadingHTTPServer((host, port), MockApiHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.api = self
+        for target in [self._run_scheduler, self._httpd.serve_forever]:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def stop(self):
+        """Stop the server"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            for _, q in self._subscribers:
+                q.put(None)
+        if (self._httpd is not None):
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        for thread in self._threads:
+            thread.join()
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    """HTTP request handler of the mock Satellite API server"""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_bytes(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        if (self.headers.get('Transfer-Encoding', '').lower() == 'chunked'):
+            chunks = []
+            while True:
+                chunk_len = int(self.rfile.readline().split(b';')[0], 16)
+                chunk = self.rfile.read(chunk_len)
+                self.rfile.readline()  # CRLF
+                if (chunk_len == 0):
+                    break
+                chunks.append(chunk)
+            return b''.join(chunks)
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _read_form(self):
+        """Read the form fields (and files) sent on the request body
+
+        Returns:
+            Dictionary with the form fields given as strings and files given
+            as bytes.
+
+        """
+        body = self._read_body()
+        content_type = self.headers.get('Content-Type', '')
+        if (content_type.startswith('multipart/form-data')):
+            msg = email.parser.BytesParser(
+                policy=email.policy.HTTP).parsebytes(b'Content-Type: ' +
+                                                     content_type.encode() +
+                                                     b'\r\n\r\n' + body)
+            form = {}
+            for part in msg.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                payload = part.get_payload(decode=True)
+                form[name] = payload if part.get_filename() is not None \
+                    else payload.decode()
+            return form
+        return {
+            k: v[0]
+            for k, v in parse_qs(body.decode(),
+                                 keep_blank_values=True).items()
+        }
+
+    def _route(self, method):
+        api = self.server.api
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+        admin = path.startswith('/admin/')
+        if admin:
+            path = path[len('/admin'):]
+        parts = path.split('/')[1:]
+        auth_token = self.headers.get('X-Auth-Token')
+
+        if (api.latency > 0):
+            time.sleep(api.latency)
+
+        if (method == 'GET'):
+            if (len(parts) == 2 and parts[0] == 'order'):
+                return self._send_json(
+                    api.get_order(parts[1], auth_token, admin))
+            if (len(parts) == 2 and parts[0] == 'orders'):
+                return self._send_json(
+                    api.list_orders(parts[1], int(params.get('channel', 1)),
+                                    int(params.get('limit', 20))))
+            if (len(parts) == 2 and parts[0] == 'message'):
+                return self._send_bytes(api.get_message(int(parts[1])))
+            if (len(parts) == 2 and parts[0] == 'subscribe'):
+                return self._stream_events(parts[1].split(','))
+            if (parts == ['currency', 'rate']):
+                return self._send_json(api.get_rate())
+        elif (method == 'POST'):
+            form = self._read_form()
+            if (parts == ['order']):
+                regions = json.loads(form['regions']) \
+                    if 'regions' in form else None
+                return self._send_json(
+                    api.create_order(
+                        form.get('file', b''),
+                        int(form['bid']) if 'bid' in form else None,
+                        int(form['channel']) if 'channel' in form else None,
+                        regions))
+            if (len(parts) == 3 and parts[0] == 'order'
+                    and parts[2] == 'bump'):
+                return self._send_json(
+                    api.bump_order(parts[1], int(form['bid_increase']),
+                                   form.get('auth_token', auth_token)))
+            if (len(parts) == 3 and parts[:2] == ['order', 'tx']):
+                return self._send_json(
+                    api.confirm_tx(int(parts[2]),
+                                   json.loads(form.get('regions', '[]'))))
+            if (len(parts) == 3 and parts[:2] == ['order', 'rx']):
+                return self._send_json(
+                    api.confirm_rx(int(parts[2]), int(form['region'])))
+        elif (method == 'DELETE'):
+            if (len(parts) == 2 and parts[0] == 'order'):
+                return self._send_json(
+                    api.cancel_order(parts[1], auth_token, admin))
+
+        raise ApiError(404, "Not found",
+                       "{} {} not found".format(method, url.path))
+
+    def _handle(self, method):
+        try:
+            self._route(method)
+        except ApiError as e:
+            self._send_json(e.to_dict(), e.status)
+        except (KeyError, ValueError) as e:
+            self._send_json(
+                ApiError(400, "Invalid request", str(e)).to_dict(), 400)
+
+    def _write_chunk(self, data):
+        """Write a chunk of a response with chunked transfer encoding"""
+        self.wfile.write('{:x}\r\n'.format(len(data)).encode() + data +
+                         b'\r\n')
+        self.wfile.flush()
+
+    def _stream_events(self, channels):
+        """Stream the server-sent events of the given channels
+
+        The events are sent with chunked transfer encoding, such that the
+        clients can process each event as soon as its chunk arrives.
+
+        """
+        api = self.server.api
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.close_connection = True
+        q = api.subscribe(channels)
+        try:
+            self._write_chunk(b':ok\n\n')
+            while True:
+                try:
+                    item = q.get(timeout=SSE_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    self._write_chunk(b':keepalive\n\n')
+                    continue
+                if (item is None):
+                    self.wfile.write(b'0\r\n\r\n')
+                    break
+                channel, data = item
+                self._write_chunk('event:{}\ndata:{}\n\n'.format(
+                    channel, data).encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            api.unsubscribe(q)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
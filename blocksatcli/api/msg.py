@@ -1,6 +1,7 @@
 """API Messages"""
 import hashlib
 import logging
+import mmap
 import os
 import struct
 import sys
@@ -8,7 +9,10 @@ import time
 import zlib
 
 from .. import defs
+from . import dlindex
 from .fec import Fec, fec_supported
+from .gpg import calc_clearsigned_len, calc_encrypted_len
+from .writer import atomic_write
 
 logger = logging.getLogger(__name__)
 # API message header:
@@ -69,6 +73,13 @@ class ApiMsg:
         if (filename is not None):
             logger.debug("File name: {}".format(filename))
 
+        # Reason for dropping the message on decryption ("not_for_us",
+        # "decryption", or "sender"), if dropped
+        self.drop_reason = None
+
+        # Fingerprint of the signer verified on decryption or verification
+        self.signer = None
+
     def get_data(self, target=None):
         """Return message data
 
@@ -227,6 +238,8 @@ class ApiMsg:
                 "Size: {:d} bytes; Decryption: FAILED; ".format(
                     len(self.data['encrypted'])) +
                 "Not encrypted for us ({})".format(decrypted_data.status))
+            self.drop_reason = 'not_for_us' if \
+                decrypted_data.status == 'no secret key' else 'decryption'
             return False
 
         # Is the message digitally signed?
@@ -256,20 +269,26 @@ class ApiMsg:
         if (signer_filter is not None):
             if (not signed_by):
                 logger.warning("Dropping message - not signed")
+                self.drop_reason = 'sender'
                 return False
 
             if (signer_filter != signed_by):
                 logger.warning("Dropping message - not signed by the selected "
                                "sender")
+                self.drop_reason = 'sender'
                 return False
 
             if (decrypted_data.trust_level < decrypted_data.TRUST_FULLY):
                 logger.warning("Dropping message - signature unverified")
+                self.drop_reason = 'sender'
                 return False
 
         logger.info("Decrypted size: {:d} bytes".format(
             len(str(decrypted_data))))
 
+        if (verified):
+            self.signer = signed_by
+
         # We can't know whether decrypted data is encapsulated or not. So, for
         # now, put the data into both fields. If the decrypted data is
         # encapsulated, eventually "decapsulate" will be called and will
@@ -362,6 +381,7 @@ class ApiMsg:
         assert (verif_obj.trust_level == decrypted_data.trust_level)
         assert (decrypted_data.data[-1] == ord('\n'))
         self.data['original'] = decrypted_data.data[:-1]
+        self.signer = signed_by
 
         return True
 
@@ -432,7 +452,7 @@ class ApiMsg:
         res = fec.decode(self.data['fec_encoded'])
         return res is not False
 
-    def save(self, dst_dir, target='original'):
+    def save(self, dst_dir, target='original', writer=None):
         """Save data into a file
 
         Save the data of a specified container into a file. Name the file
@@ -441,13 +461,23 @@ class ApiMsg:
         If another file with the same name and different contents already
         exists in the download directory, save the data on a new file with an
         appended number (e.g., "-2", "-3", and so on). Meanwhile, if a file
-        with the same name exists and its contents are also the same as the
-        incoming data, do not proceed with the saving.
+        with the same name (or one of its numbered variants) exists and its
+        contents are also the same as the incoming data, do not proceed with
+        the saving. The contents of the existing files are compared through
+        the persistent digest index of the download directory (see
+        dlindex.py), so that the existing files are not read again.
+
+        The file is written atomically, so a partially written file is never
+        visible under the destination name (see writer.py).
 
         Args:
             dst_dir : Destination directory to save the file
             target  : Target bytes array to save (original, encapsulated or
                       encrypted).
+            writer  : Optional DownloadWriter defining the sync policy and
+                      whether to write on a background thread. If not
+                      defined, write the file synchronously without syncing
+                      it to disk.
 
         Returns:
             Path to the downloaded file. If the file already exists, return the
@@ -461,41 +491,38 @@ class ApiMsg:
         if not os.path.exists(dst_dir):
             os.makedirs(dst_dir)
 
-        # If the file already exists, check if it has the same contents as the
-        # data array to be saved. Return in the positive case (no need to save
-        # it again).
-        dst_file = os.path.join(dst_dir, self.filename)
-
-        if os.path.exists(dst_file):
-            # sha256 hash of the existing file
-            with open(dst_file, "rb") as fd:
-                existing_hash = hashlib.sha256(fd.read()).hexdigest()
-
-            # sha256 hash of the incoming data
-            incoming_hash = hashlib.sha256(data).hexdigest()
-
-            if (incoming_hash == existing_hash):
-                logger.info("File {} already exists.".format(dst_file))
-                return dst_file
+        # If the file already exists with the same contents as the data array
+        # to be saved, return (no need to save it again)
+        index = dlindex.get_index(dst_dir)
+        incoming_hash = hashlib.sha256(data).hexdigest()
+        existing_file = index.find(self.filename, incoming_hash)
+        if (existing_file is not None):
+            logger.info("File {} already exists.".format(existing_file))
+            return existing_file
 
         # At this point, if a file with the same name already exists, it can be
         # implied that it has different contents. Hence, save the incoming data
         # with the same name but an appended number.
-        filename, ext = os.path.splitext(self.filename)
-        i_file = 1
-        while (True):
-            if not os.path.exists(dst_file):
-                break
-            i_file += 1
-            dst_file = os.path.join(dst_dir,
-                                    filename + "-" + str(i_file) + ext)
+        dst_file = index.alloc_name(self.filename, incoming_hash)
+
+        def on_write(error):
+            if (error is None):
+                index.add(dst_file, incoming_hash)
+                logger.info("Saved at {}.".format(dst_file))
+            else:
+                index.release(dst_file)
 
         # Write file with user data
-        f = open(dst_file, 'wb')
-        f.write(data)
-        f.close()
+        if (writer is not None):
+            writer.write(dst_file, data, callback=on_write)
+        else:
+            try:
+                atomic_write(dst_file, data, fsync=False)
+            except OSError as e:
+                on_write(e)
+                raise
+            on_write(None)
 
-        logger.info("Saved at {}.".format(dst_file))
         return dst_file
 
     def serialize(self, target='original'):
@@ -553,14 +580,7 @@ def generate(data,
 
     # If transmitting a plaintext message, it could still be clearsigned.
     if (plaintext and sign):
-        if (sign_key):
-            # Make sure the key exists
-            gpg.get_priv_key(sign_key)
-            sign_key = sign_key
-        else:
-            sign_key = gpg.get_default_priv_key()["fingerprint"]
-
-        msg.clearsign(gpg, sign_key)
+        msg.clearsign(gpg, _select_sign_key(gpg, sign_key))
 
     # Pack data into structure (header + data), if enabled
     if (encapsulate):
@@ -568,29 +588,8 @@ def generate(data,
 
     # Encrypt, unless configured otherwise
     if (not plaintext):
-        # Default to the first public key in the keyring if the recipient is
-        # not defined.
-        if (recipient is None):
-            recipient = gpg.get_default_public_key()["fingerprint"]
-            assert (recipient != defs.blocksat_pubkey), \
-                "Default public key is not the user's public key"
-        else:
-            # Make sure the key exists
-            gpg.get_public_key(recipient)
-            recipient = recipient
-
-        # Digital signature. If configured to sign the message without a
-        # specified key, use the default key.
-        if (sign):
-            if (sign_key):
-                # Make sure the key exists
-                gpg.get_priv_key(sign_key)
-                sign_cfg = sign_key
-            else:
-                sign_cfg = gpg.get_default_priv_key()["fingerprint"]
-        else:
-            sign_cfg = False
-
+        recipient = _select_recipient(gpg, recipient)
+        sign_cfg = _select_sign_key(gpg, sign_key) if sign else False
         msg.encrypt(gpg, recipient, sign_cfg, trust)
 
     # Forward error correction encoding
@@ -600,12 +599,255 @@ def generate(data,
     return msg
 
 
+def generate_file(path,
+                  dst_dir,
+                  filename=None,
+                  plaintext=True,
+                  encapsulate=False,
+                  sign=False,
+                  fec=False,
+                  gpg=None,
+                  recipient=None,
+                  trust=False,
+                  sign_key=None,
+                  fec_overhead=0.1,
+                  keys_resolved=False):
+    """Generate an API message from a file using bounded memory
+
+    Streaming counterpart of generate(). Instead of loading the file and the
+    intermediate data containers in memory, each processing stage reads its
+    input from a file and writes its output into another file within the
+    given destination directory. The input file is memory-mapped on the
+    encapsulation stage, whereas the encryption and signing stages stream
+    the data through GnuPG, and the FEC encoding processes one FEC object at a
+    time (see Fec.encode_file()).
+
+    Args:
+        path         : Path to the file to be sent.
+        dst_dir      : Directory for the intermediate and final output files.
+        filename     : File name to be encapsulated in the message. Defaults
+                       to the base name of the given path.
+        plaintext    : Boolean indicating plaintext mode.
+        encapsulate  : Boolean indicating whether to encapsulate the data.
+        sign         : Boolean indicating whether the message should be signed.
+        fec          : Boolean indicating whether to enable FEC encoding.
+        gpg          : Gpg object.
+        recipient    : Public key fingerprint of the desired recipient.
+        trust        : Skip key validation on encryption (trust the recipient).
+        sign_key     : Fingerprint to use for signing.
+        fec_overhead : Target FEC overhead.
+        keys_resolved : Whether the recipient and sign_key arguments were
+                        already resolved via resolve_keys(), in which case
+                        the keyring is not looked up again.
+
+    Returns:
+        Path to the file containing the generated message.
+
+    """
+    if ((not plaintext or sign) and gpg is None):
+        raise ValueError("Gpg object is required for encryption or signing")
+
+    if fec and not fec_supported:
+        raise ValueError(
+            "FEC support disabled. Please install zfec or blocksat-cli[fec].")
+
+    if (filename is None):
+        filename = os.path.basename(path)
+
+    if not os.path.exists(dst_dir):
+        os.makedirs(dst_dir)
+
+    if (not keys_resolved):
+        recipient, sign_key = resolve_keys(gpg, plaintext, sign, recipient,
+                                           sign_key)
+
+    # If transmitting a plaintext message, it could still be clearsigned.
+    if (plaintext and sign):
+        logger.debug("Sign message using key {}".format(sign_key))
+        signed_path = os.path.join(dst_dir, "signed")
+        signed_obj = gpg.sign_file(path, signed_path, sign_key)
+        if (not signed_obj):
+            logger.error(signed_obj.stderr)
+            raise ValueError(signed_obj.status)
+        path = signed_path
+
+    # Pack data into structure (header + data), if enabled
+    if (encapsulate):
+        encap_path = os.path.join(dst_dir, "encapsulated")
+        with open(path, 'rb') as src_fd, open(encap_path, 'wb') as dst_fd, \
+                mmap.mmap(src_fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            crc32 = zlib.crc32(data)
+            header = struct.pack(MSG_HEADER_FORMAT, filename.encode(), crc32)
+            dst_fd.write(header)
+            dst_fd.write(data)
+        logger.debug("Checksum: {:d}".format(crc32))
+        path = encap_path
+
+    # Encrypt, unless configured otherwise
+    if (not plaintext):
+        sign_cfg = sign_key if sign else False
+        logger.debug("Encrypt for recipient {}".format(recipient))
+        encrypted_path = os.path.join(dst_dir, "encrypted")
+        encrypted_obj = gpg.encrypt_file(path,
+                                         encrypted_path,
+                                         recipient,
+                                         always_trust=trust,
+                                         sign=sign_cfg)
+        if (not encrypted_obj.ok):
+            logger.error(encrypted_obj.stderr)
+            raise ValueError(encrypted_obj.status)
+        path = encrypted_path
+
+    # Forward error correction encoding
+    if (fec):
+        fec_path = os.path.join(dst_dir, "fec_encoded")
+        Fec(fec_overhead).encode_file(path, fec_path)
+        path = fec_path
+
+    logger.debug("Generated message has {:d} bytes".format(
+        os.path.getsize(path)))
+
+    return path
+
+
+def resolve_keys(gpg,
+                 plaintext=True,
+                 sign=False,
+                 recipient=None,
+                 sign_key=None):
+    """Look up the GPG keys used to generate a message
+
+    Allows for looking up the keys once when generating multiple messages
+    with the same options (see generate_file()).
+
+    Args:
+        gpg       : Gpg object.
+        plaintext : Boolean indicating plaintext mode.
+        sign      : Boolean indicating whether the message should be signed.
+        recipient : Public key fingerprint of the desired recipient.
+        sign_key  : Fingerprint to use for signing.
+
+    Returns:
+        Tuple with the fingerprint of the recipient's public key (None in
+        plaintext mode) and the fingerprint of the signing key (None if not
+        signing).
+
+    """
+    recipient = None if plaintext else _select_recipient(gpg, recipient)
+    sign_key = _select_sign_key(gpg, sign_key) if sign else None
+    return recipient, sign_key
+
+
+def _select_sign_key(gpg, sign_key=None):
+    """Select the private key used for signing
+
+    If the key is not specified, use the default private key. Otherwise, make
+    sure the specified key exists.
+
+    Returns:
+        Fingerprint of the signing key.
+
+    """
+    if (sign_key):
+        gpg.get_priv_key(sign_key)
+        return sign_key
+    return gpg.get_default_priv_key()["fingerprint"]
+
+
+def _select_recipient(gpg, recipient=None):
+    """Select the public key of the message recipient
+
+    Default to the first public key in the keyring if the recipient is not
+    defined. Otherwise, make sure the specified key exists.
+
+    Returns:
+        Fingerprint of the recipient's public key.
+
+    """
+    if (recipient is None):
+        recipient = gpg.get_default_public_key()["fingerprint"]
+        assert (recipient != defs.blocksat_pubkey), \
+            "Default public key is not the user's public key"
+    else:
+        gpg.get_public_key(recipient)
+    return recipient
+
+
+def estimate_length(data_len,
+                    plaintext=True,
+                    encapsulate=False,
+                    sign=False,
+                    fec=False,
+                    gpg=None,
+                    recipient=None,
+                    sign_key=None,
+                    fec_overhead=0.1):
+    """Estimate the length of an API message without generating it
+
+    Predicts the length of the message that generate() would produce with the
+    same options, but without running the GPG encryption/signing and the FEC
+    encoding. The encapsulation and FEC overheads are computed exactly, whereas
+    the OpenPGP overhead is estimated based on the key types.
+
+    Args:
+        data_len     : Length of the message data.
+        plaintext    : Boolean indicating plaintext mode.
+        encapsulate  : Boolean indicating whether to encapsulate the data.
+        sign         : Boolean indicating whether the message should be signed.
+        fec          : Boolean indicating whether to enable FEC encoding.
+        gpg          : Gpg object.
+        recipient    : Public key fingerprint of the desired recipient.
+        sign_key     : Fingerprint to use for signing.
+        fec_overhead : Target FEC overhead.
+
+    Returns:
+        Estimated message length in bytes.
+
+    """
+    if ((not plaintext or sign) and gpg is None):
+        raise ValueError("Gpg object is required for encryption or signing")
+
+    # Key used for signing, if any
+    if (sign):
+        sign_key_info = gpg.get_priv_key(sign_key) if sign_key else \
+            gpg.get_default_priv_key()
+    else:
+        sign_key_info = None
+
+    msg_len = data_len
+
+    if (plaintext and sign):
+        msg_len = calc_clearsigned_len(msg_len, sign_key_info)
+
+    if (encapsulate):
+        msg_len += MSG_HEADER_LEN
+
+    if (not plaintext):
+        if (recipient is None):
+            recipient_key_info = gpg.get_default_public_key()
+        else:
+            recipient_key_info = gpg.get_public_key(recipient)
+        msg_len = calc_encrypted_len(msg_len, recipient_key_info,
+                                     sign_key_info)
+
+    if (fec):
+        msg_len = Fec(fec_overhead).calc_encoded_len(msg_len)
+
+    return msg_len
+
+
+def _count_drop(drop_stats, reason):
+    if (drop_stats is not None):
+        drop_stats[reason] = drop_stats.get(reason, 0) + 1
+
+
 def decode(data,
            plaintext=True,
            decapsulate=False,
            fec=False,
            sender=None,
-           gpg=None):
+           gpg=None,
+           drop_stats=None):
     """Decode an incoming API message
 
     Args:
@@ -615,6 +857,9 @@ def decode(data,
         fec         : Boolean indicating whether to try FEC decoding first.
         sender      : Fingerprint of a sender who must have signed the message.
         gpg         : Gpg object.
+        drop_stats  : Optional dictionary on which to count the reasons for
+                      dropping the message ("not_for_us", "decryption",
+                      "sender", or "decapsulation").
 
     Returns:
         ApiMsg if the message is successfully decoded, None otherwise.
@@ -640,6 +885,7 @@ def decode(data,
 
             # Try to decapsulate it
             if (not msg.decapsulate()):
+                _count_drop(drop_stats, 'decapsulation')
                 return
         else:
             # Assume that the message is not encapsulated. This mode is
@@ -649,6 +895,7 @@ def decode(data,
 
         # If filtering clearsigned messages, verify
         if (sender and not msg.verify(gpg, sender)):
+            _count_drop(drop_stats, 'sender')
             return
 
         logger.info("Size: {:d} bytes".format(
@@ -660,11 +907,13 @@ def decode(data,
 
         # Try to decrypt the data:
         if (not msg.decrypt(gpg, sender)):
+            _count_drop(drop_stats, msg.drop_reason)
             return
 
         # Try to decapsulate the application-layer structure if assuming it
         # is present (i.e., with "save-raw=False")
         if (decapsulate and not msg.decapsulate()):
+            _count_drop(drop_stats, 'decapsulation')
             return
 
     return msg
@@ -1,4 +1,5 @@
 """Socket communication"""
+import ctypes
 import errno
 import fcntl
 import ipaddress
@@ -10,17 +11,39 @@ logger = logging.getLogger(__name__)
 SIOCGIFINDEX = 0x8933  # Ioctl request for interface index
 IP_MULTICAST_ALL = 49
 MAX_READ = 2048
+SOL_UDP = 17
+UDP_SEGMENT = 103  # UDP generic segmentation offload (GSO) option
+UDP_MAX_SEGMENTS = 64  # Maximum number of segments per GSO send
+UDP_MAX_PAYLOAD = 65507  # Maximum UDP payload over IPv4
+UDP_HEADER_LEN = 8
+SO_ATTACH_FILTER = 26
+SO_RCVBUFFORCE = 33
+SO_TIMESTAMPNS = 35
+SO_RXQ_OVFL = 40
+PROC_NET_SNMP = '/proc/net/snmp'
+TIMESPEC_FMT = '@ll'  # struct timespec
+# Ancillary data buffer size for the drop count and the timestamp
+ANC_BUF_SIZE = socket.CMSG_SPACE(struct.calcsize('@I')) + \
+    socket.CMSG_SPACE(struct.calcsize(TIMESPEC_FMT))
+# Classic BPF opcodes
+BPF_LDB_ABS = 0x30  # BPF_LD | BPF_B | BPF_ABS
+BPF_JSET_K = 0x45  # BPF_JMP | BPF_JSET | BPF_K
+BPF_JEQ_K = 0x15  # BPF_JMP | BPF_JEQ | BPF_K
+BPF_RET_K = 0x06  # BPF_RET | BPF_K
 
 
 class UdpSock():
 
-    def __init__(self, sock_addr, ifname, mcast_rx=True):
+    def __init__(self, sock_addr, ifname, mcast_rx=True, bind=True):
         """Instantiate UDP socket
 
         Args:
             sock_addr : Socket address string
             ifname    : Network interface name
             mcast_rx  : Use socket to receive multicast packets.
+            bind      : Bind the socket to the port of the socket address.
+                        Transmit-only sockets can skip it to avoid receiving
+                        the traffic addressed to the same port on this host.
 
         Returns:
             Socket object
@@ -31,6 +54,13 @@ class UdpSock():
         assert (ipaddress.ip_address(self.ip))  # parse address
         self.port = int(sock_addr.split(":")[1])
         self.ifindex = None
+        self.gso = False
+        self.chan_filter = False
+        self.rxq_ovfl = False
+        self.rx_timestamps = False
+        self.rx_time = None
+        self._rxq_drops = 0
+        self._host_drops_base = None
 
         assert (self.ip is not None), "UDP source IP is not defined"
         assert (self.port is not None), "UDP port is not defined"
@@ -42,7 +72,8 @@ class UdpSock():
 
             # Allow reuse and bind
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            sock.bind(('', self.port))
+            if (bind):
+                sock.bind(('', self.port))
 
             # Get the network interface index
             self._get_ifindex(ifname)
@@ -125,6 +156,214 @@ class UdpSock():
         """
         self.sock.sendto(data, (self.ip, self.port))
 
+    def enable_gso(self):
+        """Enable UDP generic segmentation offload (GSO) on transmissions
+
+        With GSO, a sequence of equal-length datagrams can be sent with a
+        single system call, and the kernel segments the data into the
+        individual datagrams. Supported on Linux 4.18 or later.
+
+        Returns:
+            Bool indicating whether GSO is supported and enabled.
+
+        """
+        try:
+            self.sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+        except OSError as e:
+            logger.debug("UDP GSO not supported: {}".format(e))
+            self.gso = False
+            return False
+
+        self.gso = True
+        return True
+
+    def _send_segments(self, segments):
+        """Send equal-length datagrams (except the last) with a single GSO
+        system call"""
+        seg_size = len(segments[0])
+        self.sock.sendmsg(
+            [b''.join(segments)],
+            [(SOL_UDP, UDP_SEGMENT, struct.pack('@H', seg_size))], 0,
+            (self.ip, self.port))
+
+    def send_many(self, datagrams):
+        """Transmit multiple UDP packets
+
+        When GSO is enabled, consecutive datagrams with equal length (the
+        last may be shorter) are transmitted with a single system call.
+        Otherwise, or if the GSO transmission fails, each datagram is sent
+        individually.
+
+        Args:
+            datagrams : List with the data to transmit over each UDP payload
+
+        """
+        if (not self.gso or len(datagrams) < 2):
+            for data in datagrams:
+                self.send(data)
+            return
+
+        i_start = 0
+        while (i_start < len(datagrams)):
+            seg_size = len(datagrams[i_start])
+            max_segs = min(UDP_MAX_SEGMENTS, UDP_MAX_PAYLOAD // seg_size)
+            i_end = i_start + 1
+            while (i_end < len(datagrams) and i_end - i_start < max_segs):
+                seg_len = len(datagrams[i_end])
+                if (seg_len > seg_size):
+                    break
+                i_end += 1
+                if (seg_len < seg_size):  # a shorter segment must be last
+                    break
+
+            segments = datagrams[i_start:i_end]
+            if (len(segments) == 1):
+                self.send(segments[0])
+            else:
+                try:
+                    self._send_segments(segments)
+                except OSError as e:
+                    logger.warning(
+                        "UDP GSO transmission failed ({}). Falling back to "
+                        "individual transmissions.".format(e))
+                    self.gso = False
+                    for data in datagrams[i_start:]:
+                        self.send(data)
+                    return
+            i_start = i_end
+
+    def set_chan_filter(self, chan_num):
+        """Filter the received Blocksat packets by channel within the kernel
+
+        Attaches a classic BPF socket filter that accepts only the datagrams
+        carrying a Blocksat packet of type API (see pkt.py) on the given
+        channel, so that the packets from other channels are dropped before
+        reaching userspace. The filter sees the UDP header, so the Blocksat
+        header starts at offset UDP_HEADER_LEN. Supported on Linux only.
+
+        Args:
+            chan_num : API channel number to accept.
+
+        Returns:
+            Bool indicating whether the filter was attached.
+
+        """
+        assert (chan_num >= 0 and chan_num < 256), \
+            "Channel number must be >=0 && < 256"
+        drop_offset = 3  # jump offset from the type check to the drop
+        prog = [
+            (BPF_LDB_ABS, 0, 0, UDP_HEADER_LEN),  # type/MF octet
+            (BPF_JSET_K, 0, drop_offset, 1),  # type bit set?
+            (BPF_LDB_ABS, 0, 0, UDP_HEADER_LEN + 1),  # channel octet
+            (BPF_JEQ_K, 0, 1, chan_num),
+            (BPF_RET_K, 0, 0, 0xffffffff),  # accept the whole datagram
+            (BPF_RET_K, 0, 0, 0)  # drop
+        ]
+        filter_buf = ctypes.create_string_buffer(b''.join(
+            [struct.pack('@HBBI', *insn) for insn in prog]))
+        fprog = struct.pack('@HP', len(prog), ctypes.addressof(filter_buf))
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+        except OSError as e:
+            logger.debug("Socket filter not supported: {}".format(e))
+            return False
+        self.chan_filter = True
+        return True
+
+    def set_rcvbuf(self, size):
+        """Set the socket receive buffer size
+
+        The kernel limits the buffer size to the net.core.rmem_max sysctl
+        value, unless the process has the CAP_NET_ADMIN capability.
+
+        Args:
+            size : Desired receive buffer size in bytes. The buffer is never
+                   reduced below its current size.
+
+        Returns:
+            Effective receive buffer size in bytes.
+
+        """
+        # NOTE: the kernel doubles the requested value to account for its
+        # bookkeeping overhead and reports the doubled value back.
+        eff_size = self.sock.getsockopt(socket.SOL_SOCKET,
+                                        socket.SO_RCVBUF) // 2
+        if (eff_size >= size):  # never shrink the buffer
+            return eff_size
+
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        eff_size = self.sock.getsockopt(socket.SOL_SOCKET,
+                                        socket.SO_RCVBUF) // 2
+        if (eff_size < size):
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, size)
+                eff_size = self.sock.getsockopt(socket.SOL_SOCKET,
+                                                socket.SO_RCVBUF) // 2
+            except OSError:
+                pass
+
+        logger.debug("UDP receive buffer: {} bytes".format(eff_size))
+        return eff_size
+
+    def enable_drop_count(self):
+        """Enable the counting of datagrams dropped by the kernel
+
+        Counts the datagrams dropped due to receive buffer overflow, i.e.,
+        when the application does not read the socket fast enough. The count
+        comes from the SO_RXQ_OVFL ancillary data of each received datagram.
+        However, the socket's counter also includes the datagrams rejected by
+        the channel filter (see set_chan_filter). Hence, when the channel
+        filter is attached, the count comes instead from the host-wide UDP
+        receive buffer error counter.
+
+        """
+        self._host_drops_base = read_udp_rcvbuf_errors()
+        if (self.chan_filter):
+            return
+
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            self.rxq_ovfl = True
+        except OSError as e:
+            logger.debug("SO_RXQ_OVFL not supported: {}".format(e))
+
+    def enable_timestamps(self):
+        """Enable the kernel reception timestamps (SO_TIMESTAMPNS)
+
+        When enabled, attribute rx_time holds the time (seconds since epoch)
+        at which the kernel received the last datagram read via recv().
+
+        Returns:
+            Bool indicating whether the timestamps are supported and enabled.
+
+        """
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        except OSError as e:
+            logger.debug("SO_TIMESTAMPNS not supported: {}".format(e))
+            return False
+        self.rx_timestamps = True
+        return True
+
+    def get_drops(self):
+        """Get the number of datagrams dropped by the kernel
+
+        Returns:
+            Number of datagrams dropped due to receive buffer overflow since
+            the drop count was enabled, or None if the count is not
+            available.
+
+        """
+        if (self.rxq_ovfl):
+            return self._rxq_drops
+
+        if (self._host_drops_base is None):
+            return None
+        host_drops = read_udp_rcvbuf_errors()
+        if (host_drops is None):
+            return None
+        return host_drops - self._host_drops_base
+
     def recv(self):
         """Blocking receive
 
@@ -132,4 +371,33 @@ class UdpSock():
             Received data.
 
         """
-        return self.sock.recvfrom(MAX_READ)
+        if (not self.rxq_ovfl and not self.rx_timestamps):
+            return self.sock.recvfrom(MAX_READ)
+
+        data, ancdata, _, addr = self.sock.recvmsg(MAX_READ, ANC_BUF_SIZE)
+        for level, ctype, cdata in ancdata:
+            if (level != socket.SOL_SOCKET):
+                continue
+            if (ctype == SO_RXQ_OVFL):
+                self._rxq_drops, = struct.unpack('@I', cdata)
+            elif (ctype == SO_TIMESTAMPNS):
+                sec, nsec = struct.unpack(TIMESPEC_FMT, cdata)
+                self.rx_time = sec + nsec * 1e-9
+        return data, addr
+
+
+def read_udp_rcvbuf_errors():
+    """Read the host-wide count of UDP receive buffer errors
+
+    Returns:
+        Number of UDP datagrams dropped due to receive buffer overflow on
+        the host or None if the count is not available.
+
+    """
+    try:
+        with open(PROC_NET_SNMP) as fd:
+            udp_lines = [x.split() for x in fd if x.startswith('Udp:')]
+        stats = dict(zip(udp_lines[0][1:], udp_lines[1][1:]))
+        return int(stats['RcvbufErrors'])
+    except (OSError, IndexError, KeyError, ValueError):
+        return None
@@ -1,7 +1,10 @@
 import json
 import logging
 import os
+import queue
+import threading
 import time
+import uuid
 from enum import Enum
 
 import requests
@@ -35,11 +38,214 @@ ORDER_STATUS = [
     'pending', 'paid', 'transmitting', 'sent', 'received', 'cancelled',
     'expired', 'confirming'
 ]
+FINAL_ORDER_STATUS = ['sent', 'received', 'cancelled', 'expired']
 ORDER_QUEUES = [
     'pending', 'paid', 'transmitting', 'confirming', 'queued', 'sent',
     'rx-pending', 'received', 'retransmitting'
 ]
 
+UPLOAD_CHUNK_SIZE = 2**16
+POLL_INTERVAL = 0.5  # order polling interval in seconds
+SSE_POLL_INTERVAL = 2  # fallback polling interval while subscribed to events
+SSE_RETRY_INTERVAL = 2  # interval between SSE reconnection attempts
+SSE_READ_TIMEOUT = 60  # max interval without data on the SSE connection
+TRACKER_POLL_INTERVAL = 2  # order tracker polling interval
+SSE_TRACKER_POLL_INTERVAL = 10  # order tracker polling interval with SSE
+
+
+def iter_sse_events(response, event):
+    """Iterate over the events broadcast by a server-sent events (SSE) server
+
+    Args:
+        response : Streaming response from the SSE server.
+        event    : Name of the target event.
+
+    Yields:
+        str: Data carried by each event of the target type.
+
+    """
+    event_line = 'event:' + event
+    event_next = False
+    for line in response.iter_lines():
+        if not line:
+            continue
+
+        dec_line = line.decode()
+
+        if dec_line.startswith(':'):  # comment to be ignored
+            continue
+
+        logger.debug(line)
+
+        if dec_line.startswith(event_line):
+            event_next = True
+            continue
+
+        if event_next and dec_line.startswith('data:'):
+            yield dec_line.replace('data:', '')
+            event_next = False
+
+
+class OrderEventStream(threading.Thread):
+    """Background subscription to the API order events
+
+    Subscribes to the server-sent events (SSE) of an API channel and calls
+    the given callback with the order information carried by each event.
+    Reconnects automatically if the connection drops, in which case the
+    "connected" attribute is cleared until the subscription is restored.
+
+    Args:
+        server   : API server address.
+        channel  : API channel whose events should be followed.
+        callback : Function called with the order dictionary of each event.
+        tls_cert : API client certificate.
+        tls_key  : API client key.
+        session  : Optional requests session.
+
+    """
+
+    def __init__(self,
+                 server,
+                 channel,
+                 callback,
+                 tls_cert=None,
+                 tls_key=None,
+                 session=None):
+        super().__init__(daemon=True)
+        admin = tls_cert is not None and tls_key is not None
+        self.sse_channel = API_CHANNEL_SSE_NAME[channel]
+        self.url = server + ('/admin/subscribe/'
+                             if admin else '/subscribe/') + self.sse_channel
+        self.callback = callback
+        self.cert = (tls_cert, tls_key)
+        self.session = session if session is not None else requests
+        self.connected = False
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None  # response of the current connection
+
+    def run(self):
+        while (not self._stop_event.is_set()):
+            r = None
+            try:
+                r = self.session.get(self.url,
+                                     stream=True,
+                                     cert=self.cert,
+                                     timeout=(10, SSE_READ_TIMEOUT))
+                with self._lock:
+                    self._response = r
+                # Check after publishing the response, so that a concurrent
+                # stop() either interrupts it or is seen here
+                if (self._stop_event.is_set()):
+                    break
+                r.raise_for_status()
+                self.connected = True
+                for data in iter_sse_events(r, self.sse_channel):
+                    if (self._stop_event.is_set()):
+                        break
+                    self.callback(json.loads(data))
+            except requests.exceptions.RequestException as e:
+                logger.debug(e)
+            except ValueError as e:  # invalid JSON data
+                logger.debug(e)
+            finally:
+                self.connected = False
+                with self._lock:
+                    self._response = None
+                if (r is not None):
+                    r.close()
+
+            self._stop_event.wait(SSE_RETRY_INTERVAL)
+
+    def _interrupt(self):
+        """Interrupt the read of the current connection, if any
+
+        Returns:
+            Whether the read could be interrupted (or there was no read to
+            interrupt).
+
+        """
+        with self._lock:
+            r = self._response
+        if (r is None):
+            return True
+        # Only urllib3 2.3 or later can interrupt a blocked read from another
+        # thread
+        shutdown = getattr(r.raw, 'shutdown', None)
+        if (shutdown is None):
+            return False
+        shutdown()
+        return True
+
+    def stop(self):
+        """Stop the subscription
+
+        Interrupts the current connection and waits for the thread to
+        finish. If the installed urllib3 version cannot interrupt the
+        connection, return immediately instead, in which case the connection
+        is released on the next event or read timeout.
+
+        """
+        self._stop_event.set()
+        if (self._interrupt() and self.is_alive()
+                and threading.current_thread() is not self):
+            self.join()
+
+
+class MultipartFileStream:
+    """Multipart form-data body streamed from a file object
+
+    Produces the same multipart/form-data body that requests generates when
+    given the "data" and "files" arguments, but reads the file content in
+    chunks while the body is sent, rather than buffering the whole file in
+    memory. The total body length is known upfront, so the request is sent
+    with a Content-Length header instead of a chunked transfer encoding.
+
+    Args:
+        fields : Dictionary with the form fields sent before the file.
+        fd     : Binary file object with the file content.
+        name   : Name of the form field carrying the file.
+
+    """
+
+    def __init__(self, fields, fd, name='file'):
+        self.fd = fd
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(
+            self.boundary)
+
+        head = b''
+        for key, val in fields.items():
+            head += self._part_header(
+                'form-data; name="{}"'.format(key)) + str(val).encode() + \
+                b'\r\n'
+        head += self._part_header(
+            'form-data; name="{0}"; filename="{0}"'.format(name))
+        self._head = head
+        self._tail = '\r\n--{}--\r\n'.format(self.boundary).encode()
+
+        # File size from the current position until the end of the file
+        start = fd.tell()
+        fd.seek(0, os.SEEK_END)
+        self._file_len = fd.tell() - start
+        fd.seek(start)
+
+    def _part_header(self, disposition):
+        return '--{}\r\nContent-Disposition: {}\r\n\r\n'.format(
+            self.boundary, disposition).encode()
+
+    def __len__(self):
+        return len(self._head) + self._file_len + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        while True:
+            chunk = self.fd.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        yield self._tail
+
 
 class ApiOrder:
     """API Transmission Order
@@ -51,6 +257,9 @@ class ApiOrder:
         seq_num  : Sequence number corresponding to this API message
         tls_key  : API client key
         tls_cert : API client certificate
+        session  : Optional requests session used to reuse connections
+                   across orders. If not defined, each request opens its own
+                   connection.
 
     """
 
@@ -59,12 +268,17 @@ class ApiOrder:
                  seq_num=None,
                  tls_cert=None,
                  tls_key=None,
-                 capture_error=False):
+                 capture_error=False,
+                 session=None):
         self.uuid = None
         self.auth_token = None
         self.ln_invoice = None
         self.order = {}
         self.capture_error = capture_error
+        self.session = session if session is not None else requests
+        self._stop_wait_state = False
+        self._wait_events = None
+        self._orders_cache = {}  # validators and results of order lists
 
         # API server address
         self.server = server
@@ -95,9 +309,9 @@ class ApiOrder:
         assert (self.auth_token is not None)
 
         endpoint = '/admin/order/' if self.admin else '/order/'
-        r = requests.get(self.server + endpoint + self.uuid,
-                         headers={'X-Auth-Token': self.auth_token},
-                         cert=(self.tls_cert, self.tls_key))
+        r = self.session.get(self.server + endpoint + self.uuid,
+                             headers={'X-Auth-Token': self.auth_token},
+                             cert=(self.tls_cert, self.tls_key))
 
         if (r.status_code != requests.codes.ok):
             log_error_and_exit(r, logger, sys_exit_out=self.capture_error)
@@ -122,7 +336,12 @@ class ApiOrder:
         self.auth_token = auth_token
         self._fetch()
 
-    def get_orders(self, status: list, channel=1, queue='queued', limit=20):
+    def get_orders(self,
+                   status: list,
+                   channel=1,
+                   queue='queued',
+                   limit=20,
+                   conditional=False):
         """Get API orders with a target status
 
         Args:
@@ -132,6 +351,10 @@ class ApiOrder:
             queue (str): Queue from which the order can be fetched (pending,
                 queued, or sent orders). Defaults to the 'queued' queue.
             limit (int): Maximum number of orders on the result.
+            conditional (bool): Whether to make a conditional request based
+                on the validators (ETag or Last-Modified headers) returned by
+                the server on the previous request for the same list, if any.
+                When the list is not modified, the previous result is reused.
 
         Returns:
             list: List with the filtered orders.
@@ -141,20 +364,43 @@ class ApiOrder:
         assert status is None or [x in ORDER_STATUS for x in status]
         endpoint = '/admin/orders/' + queue if self.admin \
             else '/orders/' + queue
-        r = requests.get(self.server + endpoint,
-                         params={
-                             'channel': channel,
-                             'limit': limit
-                         },
-                         headers={'X-Auth-Token': self.auth_token},
-                         cert=(self.tls_cert, self.tls_key))
+        headers = {'X-Auth-Token': self.auth_token}
+        cache_key = (endpoint, channel, limit)
+        cached = self._orders_cache.get(cache_key) if conditional else None
+        if (cached is not None):
+            if (cached['etag'] is not None):
+                headers['If-None-Match'] = cached['etag']
+            if (cached['last_modified'] is not None):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        r = self.session.get(self.server + endpoint,
+                             params={
+                                 'channel': channel,
+                                 'limit': limit
+                             },
+                             headers=headers,
+                             cert=(self.tls_cert, self.tls_key))
+
+        if (cached is not None
+                and r.status_code == requests.codes.not_modified):
+            orders = cached['orders']
+        else:
+            if (r.status_code != requests.codes.ok):
+                log_error_and_exit(r, logger, sys_exit_out=self.capture_error)
 
-        if (r.status_code != requests.codes.ok):
-            log_error_and_exit(r, logger, sys_exit_out=self.capture_error)
+            r.raise_for_status()
 
-        r.raise_for_status()
+            orders = r.json()
 
-        orders = r.json()
+            if (conditional):
+                etag = r.headers.get('ETag')
+                last_modified = r.headers.get('Last-Modified')
+                if (etag is not None or last_modified is not None):
+                    self._orders_cache[cache_key] = {
+                        'etag': etag,
+                        'last_modified': last_modified,
+                        'orders': orders
+                    }
 
         if status is None:
             return orders
@@ -166,19 +412,26 @@ class ApiOrder:
 
         return filtered_orders
 
-    def send(self, data, bid, regions=None, channel=None):
+    def send(self, data, bid, regions=None, channel=None, verbose=True):
         """Send the transmission order
 
         Args:
-            data : Data as bytes array to broadcast over satellite
+            data : Data to broadcast over satellite, given either as a bytes
+                   array or as a binary file object. The latter is uploaded
+                   in chunks without loading the file in memory.
             bid  : Bid in msat
             regions : List of regions over which to send the order.
+            channel : API channel over which to send the order.
+            verbose : Whether to print the order UUID, authentication token,
+                      and Lightning invoice.
 
         Returns:
             Dictionary with order metadata
 
         """
-        assert (isinstance(data, bytes))
+        streaming = not isinstance(data, bytes)
+        if streaming:
+            assert hasattr(data, 'read')
 
         req_data = {}
 
@@ -191,10 +444,17 @@ class ApiOrder:
 
         # Post request to the API
         endpoint = '/admin/order' if self.admin else '/order'
-        r = requests.post(self.server + endpoint,
-                          data=req_data,
-                          files={'file': data},
-                          cert=(self.tls_cert, self.tls_key))
+        if streaming:
+            body = MultipartFileStream(req_data, data)
+            r = self.session.post(self.server + endpoint,
+                                  data=body,
+                                  headers={'Content-Type': body.content_type},
+                                  cert=(self.tls_cert, self.tls_key))
+        else:
+            r = self.session.post(self.server + endpoint,
+                                  data=req_data,
+                                  files={'file': data},
+                                  cert=(self.tls_cert, self.tls_key))
 
         # In case of failure, check the API error message
         if (r.status_code != requests.codes.ok):
@@ -212,12 +472,17 @@ class ApiOrder:
         logger.debug("API Response:")
         logger.debug(json.dumps(res, indent=4, sort_keys=True))
 
+        if ("lightning_invoice" in res):
+            self.ln_invoice = res["lightning_invoice"]
+
+        if (not verbose):
+            return res
+
         logger.info("Data successfully queued for transmission\n")
         print("--\nUUID:\n%s" % (res["uuid"]))
         print("--\nAuthentication Token:\n%s" % (res["auth_token"]))
 
-        if ("lightning_invoice" in res):
-            self.ln_invoice = res["lightning_invoice"]
+        if (self.ln_invoice is not None):
             print_invoice(self.ln_invoice)
 
         return res
@@ -227,8 +492,8 @@ class ApiOrder:
         logger.debug("Fetch message #%s from API" % (self.seq_num))
 
         endpoint = '/admin/message/' if self.admin else '/message/'
-        r = requests.get(self.server + endpoint + str(self.seq_num),
-                         cert=(self.tls_cert, self.tls_key))
+        r = self.session.get(self.server + endpoint + str(self.seq_num),
+                             cert=(self.tls_cert, self.tls_key))
 
         r.raise_for_status()
 
@@ -236,14 +501,21 @@ class ApiOrder:
             data = r.content
             return data
 
-    def wait_state(self, target, timeout=120):
+    def wait_state(self, target, timeout=120, sse=True):
         """Wait until the order achieves a target state (or states)
 
+        Subscribes to the order events broadcast by the server, if enabled,
+        so that state transitions are detected as soon as they happen. The
+        order is still polled, but less frequently while the subscription is
+        active, since not all state transitions generate events.
+
         Args:
             target : String or list of strings with the state(s) to wait
                      for. When given as a list, this function waits until any
                      of the states is achieved.
             timeout : Timeout in seconds.
+            sse : Whether to subscribe to the order events. If False, or if
+                  the subscription fails, rely on polling only.
 
         Returns:
             (bool) Whether any of the target states was successfully reached.
@@ -289,41 +561,84 @@ class ApiOrder:
 
         s_time = time.time()
         self._stop_wait_state = False
+        self._wait_events = queue.Queue()
         target_detected = False
-        while (self._stop_wait_state is False):
-            self._fetch()
-
-            if (self.order['status'] in state_seen
-                    and not state_seen[self.order['status']]):
-                state_seen[self.order['status']] = True
-
-                # If the status is not polled fast enough, some intermediate
-                # states may not be seen. Mark the implied states as observed
-                # and print their messages.
-                for prereq_state in requires[self.order['status']]:
-                    if (not state_seen[prereq_state]):
-                        state_seen[prereq_state] = True
-                        print(msg[prereq_state])
-
-                # Print the current state
-                print(msg[self.order['status']])
-
-            if (any([state_seen[x] for x in target])):
-                target_detected = True
-                break
-
-            c_time = time.time()
-            if ((c_time - s_time) > timeout):
-                print("Timeout")
-                break
-
-            time.sleep(0.5)
+        event_stream = None
+        next_poll = s_time
+        try:
+            while (self._stop_wait_state is False):
+                if (time.time() >= next_poll):
+                    self._fetch()
+
+                    # Subscribe to the order events once the order's channel
+                    # is known from the first fetch
+                    if (sse and event_stream is None):
+                        event_stream = OrderEventStream(
+                            self.server,
+                            self.order.get('channel', ApiChannel.USER.value),
+                            self._wait_events.put,
+                            tls_cert=self.tls_cert,
+                            tls_key=self.tls_key,
+                            session=self.session)
+                        event_stream.start()
+
+                    poll_interval = SSE_POLL_INTERVAL if (
+                        event_stream is not None
+                        and event_stream.connected) else POLL_INTERVAL
+                    next_poll = time.time() + poll_interval
+
+                if (self.order['status'] in state_seen
+                        and not state_seen[self.order['status']]):
+                    state_seen[self.order['status']] = True
+
+                    # If the status is not polled fast enough, some
+                    # intermediate states may not be seen. Mark the implied
+                    # states as observed and print their messages.
+                    for prereq_state in requires[self.order['status']]:
+                        if (not state_seen[prereq_state]):
+                            state_seen[prereq_state] = True
+                            print(msg[prereq_state])
+
+                    # Print the current state
+                    print(msg[self.order['status']])
+
+                if (any([state_seen[x] for x in target])):
+                    target_detected = True
+                    break
+
+                c_time = time.time()
+                if ((c_time - s_time) > timeout):
+                    print("Timeout")
+                    break
+
+                # Wait for the next event or the next polling instant
+                try:
+                    event = self._wait_events.get(timeout=max(
+                        min(next_poll, s_time + timeout) - c_time, 0))
+                except queue.Empty:
+                    continue
+
+                if (event is None):  # stop request
+                    continue
+
+                # Take the state directly from events carrying this order's
+                # information. Fetch the order on events that do not identify
+                # the order.
+                if ('uuid' not in event):
+                    next_poll = time.time()
+                elif (event['uuid'] == self.uuid and 'status' in event):
+                    self.order['status'] = event['status']
+        finally:
+            if (event_stream is not None):
+                event_stream.stop()
 
         return target_detected
 
     def stop_wait_state(self):
         """Stop waiting for the order to achieve a target state"""
         self._stop_wait_state = True
+        if (self._wait_events is not None):
+            self._wait_events.put(None)
 
     def confirm_tx(self, regions):
         """Confirm transmission of an API message
@@ -343,9 +658,9 @@ class ApiOrder:
         logger.info("Confirm transmission of message {} on regions {}".format(
             self.seq_num, regions))
 
-        r = requests.post(self.server + '/order/tx/' + str(self.seq_num),
-                          data={'regions': json.dumps(regions)},
-                          cert=(self.tls_cert, self.tls_key))
+        r = self.session.post(self.server + '/order/tx/' + str(self.seq_num),
+                              data={'regions': json.dumps(regions)},
+                              cert=(self.tls_cert, self.tls_key))
 
         if not r.ok:
             logger.error("Failed to confirm Tx of message {} "
@@ -371,9 +686,9 @@ class ApiOrder:
         logger.info("Confirm reception of API message {} on region {}".format(
             self.seq_num, region))
 
-        r = requests.post(self.server + '/order/rx/' + str(self.seq_num),
-                          data={'region': region},
-                          cert=(self.tls_cert, self.tls_key))
+        r = self.session.post(self.server + '/order/rx/' + str(self.seq_num),
+                              data={'region': region},
+                              cert=(self.tls_cert, self.tls_key))
 
         if not r.ok:
             logger.error("Failed to confirm Rx of message {} "
@@ -431,12 +746,12 @@ class ApiOrder:
         assert (isinstance(bid, int))
 
         # Post bump request
-        r = requests.post(self.server + '/order/' + self.uuid + "/bump",
-                          data={
-                              'bid_increase': bid - previous_bid,
-                              'auth_token': self.auth_token
-                          },
-                          cert=(self.tls_cert, self.tls_key))
+        r = self.session.post(self.server + '/order/' + self.uuid + "/bump",
+                              data={
+                                  'bid_increase': bid - previous_bid,
+                                  'auth_token': self.auth_token
+                              },
+                              cert=(self.tls_cert, self.tls_key))
 
         if (r.status_code != requests.codes.ok):
             log_error_and_exit(r, logger, sys_exit_out=self.capture_error)
@@ -465,9 +780,9 @@ class ApiOrder:
 
         # Post delete request
         endpoint = '/admin/order/' if self.admin else '/order/'
-        r = requests.delete(self.server + endpoint + self.uuid,
-                            headers={'X-Auth-Token': self.auth_token},
-                            cert=(self.tls_cert, self.tls_key))
+        r = self.session.delete(self.server + endpoint + self.uuid,
+                                headers={'X-Auth-Token': self.auth_token},
+                                cert=(self.tls_cert, self.tls_key))
 
         if (r.status_code != requests.codes.ok):
             log_error_and_exit(r, logger, sys_exit_out=self.capture_error)
@@ -482,19 +797,20 @@ class ApiOrder:
 
         return r.json()
 
-    def record_tx_log(self, cfg_dir: str):
-        """Record the transmission information locally"""
+    def _get_tx_record(self):
+        """Get the transmission record to be saved on the tx log"""
         if (self.auth_token is None or self.uuid is None):
             logger.error("Cannot record tx log. Auth token or UUID not set")
             return
 
-        cache = Cache(os.path.join(cfg_dir, "api"), filename="tx_log.json")
         record = {'auth_token': self.auth_token}
         if self.ln_invoice:
             record['invoices'] = [self.ln_invoice]
-        cache.set(self.uuid, record)
-        cache.save()
-        return True
+        return record
+
+    def record_tx_log(self, cfg_dir: str):
+        """Record the transmission information locally"""
+        return record_tx_logs(cfg_dir, [self]) == 1
 
     def record_tx_bump_log(self, cfg_dir: str, invoice: dict):
         """Record the bump transaction information locally"""
@@ -506,3 +822,262 @@ class ApiOrder:
             cache.save()
             return True
         return False
+
+
+class OrderTracker:
+    """Tracker of the state of multiple API orders
+
+    Follows any number of orders through a single server-sent events (SSE)
+    subscription, complemented by a periodic poll of the server queues. Each
+    poll lists only the queues where the tracked orders can be found (e.g.,
+    the pending and queued orders for an order waiting for payment) and
+    fetches individually only the orders missing from the queue listings.
+
+    Args:
+        server    : API server address.
+        channel   : API channel of the tracked orders.
+        callback  : Function called with the UUID and the order dictionary
+                    whenever the state of any tracked order changes.
+        sse       : Whether to subscribe to the order events.
+        tls_cert  : API client certificate.
+        tls_key   : API client key.
+        session   : Optional requests session.
+
+    """
+    # Queues to be listed based on the last known state of an order. The
+    # subsequent queue is listed as well in case the order has moved. Orders
+    # in an unknown state are searched on all queues, whereas cancelled and
+    # expired orders are no longer polled.
+    state_queues = {
+        None: ['pending', 'queued', 'sent'],
+        'pending': ['pending', 'queued'],
+        'paid': ['queued', 'sent'],
+        'transmitting': ['queued', 'sent'],
+        'confirming': ['queued', 'sent'],
+        'sent': ['sent'],
+        'received': ['sent'],
+        'cancelled': [],
+        'expired': []
+    }
+
+    def __init__(self,
+                 server,
+                 channel=ApiChannel.USER.value,
+                 callback=None,
+                 sse=True,
+                 tls_cert=None,
+                 tls_key=None,
+                 session=None):
+        self.server = server
+        self.channel = channel
+        self.callback = callback
+        self.sse = sse
+        self.tls_cert = tls_cert
+        self.tls_key = tls_key
+        self.session = session if session is not None else requests
+        self._orders = {}
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._event_stream = None
+
+    def add(self, uuid, auth_token=None, callback=None, order=None):
+        """Start tracking an order
+
+        Args:
+            uuid       : Order UUID.
+            auth_token : Authentication token. Used to fetch the order
+                         individually when it is not found on the queues.
+            callback   : Function called with the UUID and the order
+                         dictionary whenever the state of this order changes.
+            order      : Order dictionary already known by the caller, if
+                         any. The callbacks run only on subsequent changes.
+
+        """
+        with self._cond:
+            if uuid in self._orders:
+                return
+            self._orders[uuid] = {
+                'auth_token': auth_token,
+                'callback': callback,
+                'order': dict(order) if order else {}
+            }
+
+    def remove(self, uuid):
+        """Stop tracking an order"""
+        with self._cond:
+            self._orders.pop(uuid, None)
+
+    def get_state(self, uuid):
+        """Get the last known state of a tracked order"""
+        with self._cond:
+            if uuid not in self._orders:
+                return None
+            return self._orders[uuid]['order'].get('status')
+
+    @property
+    def uuids(self):
+        """UUIDs of the tracked orders"""
+        with self._cond:
+            return list(self._orders.keys())
+
+    def _update(self, uuid, order_info):
+        """Update the state of a tracked order and run the callbacks"""
+        with self._cond:
+            if uuid not in self._orders or 'status' not in order_info:
+                return
+            entry = self._orders[uuid]
+            prev_state = entry['order'].get('status')
+            entry['order'].update(order_info)
+            if order_info['status'] == prev_state:
+                return
+            order = dict(entry['order'])
+            callback = entry['callback']
+            self._cond.notify_all()
+
+        logger.debug("Order {} state: {}".format(uuid, order['status']))
+        for cb in [callback, self.callback]:
+            if cb is not None:
+                cb(uuid, order)
+
+    def _handle_event(self, order_info):
+        """Handle an order event broadcast by the SSE server"""
+        if 'uuid' in order_info:
+            self._update(order_info['uuid'], order_info)
+
+    def poll(self):
+        """Poll the state of all tracked orders"""
+        with self._cond:
+            entries = {
+                order_uuid: (x['order'].get('status'), x['auth_token'])
+                for order_uuid, x in self._orders.items()
+            }
+
+        if not entries:
+            return
+
+        queues = set()
+        for state, _ in entries.values():
+            queues.update(self.state_queues.get(state, []))
+
+        order_mgr = ApiOrder(self.server,
+                             tls_cert=self.tls_cert,
+                             tls_key=self.tls_key,
+                             capture_error=True,
+                             session=self.session)
+        found = set()
+        for order_queue in sorted(queues):
+            try:
+                orders = order_mgr.get_orders(None,
+                                              self.channel,
+                                              order_queue,
+                                              limit=max(20, len(entries)))
+            except (requests.exceptions.RequestException, SystemExit) as e:
+                logger.debug(e)
+                continue
+
+            for order_info in orders:
+                if order_info.get('uuid') in entries:
+                    found.add(order_info['uuid'])
+                    self._update(order_info['uuid'], order_info)
+
+        # Fetch the remaining orders individually, if possible
+        for order_uuid, (state, auth_token) in entries.items():
+            if (order_uuid in found or auth_token is None
+                    or not self.state_queues.get(state, True)):
+                continue
+            try:
+                order_mgr.get(order_uuid, auth_token)
+            except (requests.exceptions.RequestException, SystemExit) as e:
+                logger.debug(e)
+                continue
+            self._update(order_uuid, order_mgr.order)
+
+    def _run(self):
+        """Polling loop"""
+        while True:
+            self.poll()
+            connected = self._event_stream is not None and \
+                self._event_stream.connected
+            interval = SSE_TRACKER_POLL_INTERVAL if connected else \
+                TRACKER_POLL_INTERVAL
+            if self._stop_event.wait(interval):
+                break
+
+    def start(self):
+        """Start tracking the orders in the background"""
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        if self.sse:
+            self._event_stream = OrderEventStream(self.server,
+                                                  self.channel,
+                                                  self._handle_event,
+                                                  tls_cert=self.tls_cert,
+                                                  tls_key=self.tls_key,
+                                                  session=self.session)
+            self._event_stream.start()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop tracking the orders"""
+        self._stop_event.set()
+        if self._event_stream is not None:
+            self._event_stream.stop()
+            self._event_stream = None
+        self._thread = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, target, timeout=None):
+        """Wait until all tracked orders achieve one of the target states
+
+        Args:
+            target  : List of target states.
+            timeout : Timeout in seconds. None to wait indefinitely.
+
+        Returns:
+            (bool) Whether all orders achieved any of the target states.
+
+        """
+        assert (isinstance(target, list))
+
+        def _done():
+            return all(x['order'].get('status') in target
+                       for x in self._orders.values())
+
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: _done() or self._stop_event.is_set(),
+                timeout=timeout) and _done()
+
+
+def record_tx_logs(cfg_dir: str, orders: list):
+    """Record the transmission information of multiple orders locally
+
+    Loads and saves the tx log file only once for all orders.
+
+    Args:
+        cfg_dir (str): Configuration directory.
+        orders (list): List of ApiOrder objects.
+
+    Returns:
+        int: Number of orders recorded on the tx log.
+
+    """
+    cache = Cache(os.path.join(cfg_dir, "api"), filename="tx_log.json")
+    n_recorded = 0
+    for order in orders:
+        record = order._get_tx_record()
+        if record is None:
+            continue
+        cache.set(order.uuid, record)
+        n_recorded += 1
+
+    if n_recorded > 0:
+        cache.save()
+
+    return n_recorded
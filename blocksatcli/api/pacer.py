@@ -0,0 +1,133 @@
+"""Transmission pacing"""
+import math
+import time
+
+# Default bucket depth in seconds worth of data at the target rate, to absorb
+# the sleep overshoot and scheduling delays when the bucket is otherwise too
+# shallow (i.e., at high rates).
+DEFAULT_BURST_INTERVAL = 5e-3
+
+
+class Pacer:
+    """Token-bucket pacer
+
+    Paces a packet stream to a target bit rate. The bucket accumulates tokens
+    (bytes) at the target rate up to the burst allowance, and each
+    transmission consumes the tokens corresponding to its length, blocking
+    until enough tokens are available. Unlike sleeping a fixed interval after
+    each packet, the bucket compensates for oversleeping on the following
+    transmissions, so the average rate converges to the target rate, while
+    the burst allowance bounds the short-term excess.
+
+    The pacer also keeps statistics of the achieved rate and of the jitter,
+    defined as the root-mean-square deviation between the actual interval
+    preceding each transmission and the nominal interval that the target rate
+    implies for its length.
+
+    Args:
+        kbps  : Target bit rate in kbps. Zero or negative for no pacing.
+        burst : Burst allowance (bucket depth) in bytes. Defaults to the
+                length of the first transmission or the amount of data
+                transmitted over DEFAULT_BURST_INTERVAL at the target rate,
+                whichever is larger.
+        clock : Monotonic clock function returning the time in seconds.
+        sleep : Sleep function taking the interval in seconds.
+
+    """
+
+    def __init__(self,
+                 kbps,
+                 burst=None,
+                 clock=time.monotonic,
+                 sleep=time.sleep):
+        self.kbps = kbps
+        self.byte_rate = kbps * 1e3 / 8 if kbps > 0 else 0
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = None
+        self._last_refill = None
+
+        # Statistics
+        self.n_tx = 0
+        self.n_bytes = 0
+        self._first_tx = None
+        self._first_len = None
+        self._last_tx = None
+        self._sq_dev_sum = 0
+        self._max_dev = 0
+
+    def _refill(self, now):
+        """Add the tokens accumulated since the last refill"""
+        self.tokens = min(
+            self.burst,
+            self.tokens + (now - self._last_refill) * self.byte_rate)
+        self._last_refill = now
+
+    def pace(self, n_bytes):
+        """Wait until the given number of bytes can be transmitted
+
+        Args:
+            n_bytes : Number of bytes of the upcoming transmission.
+
+        """
+        if self.byte_rate > 0:
+            if self.tokens is None:  # first transmission: full bucket
+                if self.burst is None:
+                    self.burst = self.byte_rate * DEFAULT_BURST_INTERVAL
+                self.burst = max(self.burst, n_bytes)
+                self.tokens = self.burst
+                self._last_refill = self.clock()
+
+            self._refill(self.clock())
+            deficit = n_bytes - self.tokens
+            if deficit > 0:
+                self.sleep(deficit / self.byte_rate)
+                self._refill(self.clock())
+            self.tokens -= n_bytes
+
+        self._record(n_bytes, self.clock())
+
+    def _record(self, n_bytes, now):
+        """Record the statistics of a transmission"""
+        if self._first_tx is None:
+            self._first_tx = now
+            self._first_len = n_bytes
+        elif self.byte_rate > 0:
+            nominal = n_bytes / self.byte_rate
+            dev = (now - self._last_tx) - nominal
+            self._sq_dev_sum += dev**2
+            self._max_dev = max(self._max_dev, abs(dev))
+
+        self._last_tx = now
+        self.n_tx += 1
+        self.n_bytes += n_bytes
+
+    def get_stats(self):
+        """Get the pacing statistics
+
+        Returns:
+            Dictionary with the target and achieved bit rates in kbps, and
+            the RMS and maximum jitter in milliseconds. The achieved rate is
+            None when there are less than two transmissions, and the jitter
+            is None without pacing.
+
+        """
+        achieved_kbps = None
+        if self.n_tx > 1 and self._last_tx > self._first_tx:
+            # The first transmission is sent immediately, so only the
+            # subsequent ones count over the elapsed interval
+            achieved_kbps = 8e-3 * (self.n_bytes - self._first_len) / (
+                self._last_tx - self._first_tx)
+
+        jitter_ms = max_jitter_ms = None
+        if self.byte_rate > 0 and self.n_tx > 1:
+            jitter_ms = 1e3 * math.sqrt(self._sq_dev_sum / (self.n_tx - 1))
+            max_jitter_ms = 1e3 * self._max_dev
+
+        return {
+            'target_kbps': self.kbps if self.kbps > 0 else None,
+            'achieved_kbps': achieved_kbps,
+            'jitter_ms': jitter_ms,
+            'max_jitter_ms': max_jitter_ms
+        }
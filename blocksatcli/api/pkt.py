@@ -55,7 +55,8 @@ class BlocksatPkt:
                  frag_num=None,
                  chan_num=None,
                  more_frags=None,
-                 payload=None):
+                 payload=None,
+                 rx_time=None):
         if (chan_num is not None):
             assert (chan_num >= 0 and chan_num < 256), \
                 "Channel number must be >=0 && < 256"
@@ -64,6 +65,7 @@ class BlocksatPkt:
         self.chan_num = chan_num
         self.more_frags = more_frags
         self.payload = payload
+        self.rx_time = rx_time  # reception timestamp (seconds since epoch)
 
     def pack(self):
         """Form Blocksat Packet
@@ -74,11 +76,13 @@ class BlocksatPkt:
                              self.frag_num, self.seq_num)
         return header + self.payload
 
-    def unpack(self, udp_payload):
+    def unpack(self, udp_payload, rx_time=None):
         """Unpack Blocksat Packet from UDP payload
 
         Args:
             udp_payload : UDP payload received via socket (bytes)
+            rx_time     : Reception timestamp of the UDP datagram (seconds
+                          since epoch), if available
 
         Returns:
             Tuple with the Blocksat Packet's payload (bytes) and sequence
@@ -91,6 +95,7 @@ class BlocksatPkt:
         # Separate header and payload
         header = udp_payload[:HEADER_LEN]
         self.payload = udp_payload[HEADER_LEN:]
+        self.rx_time = rx_time
 
         # Parse header
         octet_0, self.chan_num, self.frag_num, self.seq_num = struct.unpack(
@@ -128,6 +133,10 @@ class BlocksatPktHandler:
         """
         self.frag_map = {}
         self.timeout = timeout
+        # Statistics
+        self.dup_frags = 0  # repeated fragments
+        self.ooo_frags = 0  # out-of-order fragments
+        self.pending_bytes = 0  # payload bytes held in the fragment map
 
     def _check_gaps(self, seq_num):
         """Check if there is any fragment number gap
@@ -207,7 +216,8 @@ class BlocksatPktHandler:
             self.frag_map[pkt.seq_num] = {
                 'high_frag': None,
                 'last_frag': None,
-                'concat': bytearray()
+                'concat': bytearray(),
+                'n_bytes': 0
             }
             self.frag_map[pkt.seq_num]['frags'] = {}
 
@@ -215,6 +225,7 @@ class BlocksatPktHandler:
         if (pkt.frag_num in self.frag_map[pkt.seq_num]['frags']):
             logger.debug("BlocksatPktHandler: fragment {} has already "
                          "been received".format(pkt.frag_num))
+            self.dup_frags += 1
             # Check if the repeated fragment actually has the same contents
             pre_existing_pkt = self.frag_map[pkt.seq_num]['frags'][
                 pkt.frag_num]
@@ -226,11 +237,20 @@ class BlocksatPktHandler:
             return self._check_ready(pkt.seq_num)
 
         self.frag_map[pkt.seq_num]['frags'][pkt.frag_num] = pkt
+        self.frag_map[pkt.seq_num]['n_bytes'] += len(pkt.payload)
+        self.pending_bytes += len(pkt.payload)
 
         # Timestamp the last fragment reception of this sequence number. Use
         # this timestamp to clean old fragments that were never decoded.
         self.frag_map[pkt.seq_num]['t_last'] = time.time()
 
+        # Track the arrival of the first and last fragments for latency
+        # measurements, preferably based on the packet reception timestamps
+        rx_time = pkt.rx_time if pkt.rx_time is not None else \
+            self.frag_map[pkt.seq_num]['t_last']
+        self.frag_map[pkt.seq_num].setdefault('t_first_rx', rx_time)
+        self.frag_map[pkt.seq_num]['t_last_rx'] = rx_time
+
         # Concatenate payload by payload instead of waiting to concatenate
         # everything in the end when the message is ready.
         self._concat_pkt(pkt)
@@ -241,6 +261,8 @@ class BlocksatPktHandler:
         if (self.frag_map[pkt.seq_num]['high_frag'] is None
                 or pkt.frag_num > self.frag_map[pkt.seq_num]['high_frag']):
             self.frag_map[pkt.seq_num]['high_frag'] = pkt.frag_num
+        else:
+            self.ooo_frags += 1
 
         # Track the last fragment of the sequence. This information is used to
         # more quickly verify whether the message is ready (see
@@ -257,6 +279,17 @@ class BlocksatPktHandler:
         """Get the Blocksat Packets sorted by fragment number"""
         return [x[1] for x in sorted(self.frag_map[seq_num]['frags'].items())]
 
+    def get_rx_times(self, seq_num):
+        """Get the reception times of the first and last fragments
+
+        Returns:
+            Tuple with the reception timestamps (seconds since epoch) of the
+            first and the last fragments received for the sequence number.
+
+        """
+        return (self.frag_map[seq_num]['t_first_rx'],
+                self.frag_map[seq_num]['t_last_rx'])
+
     def get_n_frags(self, seq_num):
         """Return the number of fragments corresponding to a sequence number"""
         return len(self.frag_map[seq_num]['frags'].keys())
@@ -324,6 +357,11 @@ class BlocksatPktHandler:
             # Add to fragment map
             self.append(pkt)
 
+    def remove(self, seq_num):
+        """Remove the fragments of a sequence number from the fragment map"""
+        self.pending_bytes -= self.frag_map[seq_num]['n_bytes']
+        del self.frag_map[seq_num]
+
     def clean(self):
         """Throw away old (timed-out) pending fragments
         """
@@ -338,7 +376,7 @@ class BlocksatPktHandler:
         for seq_num in timed_out:
             logger.debug("BlocksatPktHandler: Delete Seq Num {} from fragment "
                          "map".format(seq_num))
-            del self.frag_map[seq_num]
+            self.remove(seq_num)
 
 
 def calc_ota_msg_len(msg_len):
@@ -0,0 +1,173 @@
+"""On-disk cache of packed Blocksat packets"""
+import logging
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+HEADER_FMT = '!I'  # message length
+PKT_LEN_FMT = '!H'  # length prefix of each packet
+HEADER_LEN = struct.calcsize(HEADER_FMT)
+PKT_LEN_LEN = struct.calcsize(PKT_LEN_FMT)
+FILE_EXT = '.pkts'
+
+
+class PktCache():
+    """Least-recently used (LRU) cache of packed Blocksat packets on disk
+
+    Stores the packets of each API message on a file named after the message's
+    transmission sequence number, so that the message can be transmitted
+    again without downloading and splitting it again. The file holds the
+    original message length followed by the length-prefixed packets. When the
+    total size of the cached files exceeds the capacity, the least recently
+    used messages are evicted. The recency order persists across sessions
+    through the modification time of the files.
+
+    Args:
+        path     : Cache directory.
+        max_size : Cache capacity in bytes.
+
+    """
+
+    def __init__(self, path, max_size):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # seq_num -> file size, LRU first
+        self._size = 0
+        self._load()
+
+    def _get_path(self, seq_num):
+        return os.path.join(self.path, str(seq_num) + FILE_EXT)
+
+    def _load(self):
+        """Index the files saved on previous sessions"""
+        entries = []
+        for filename in os.listdir(self.path):
+            name, ext = os.path.splitext(filename)
+            if (ext == '.tmp'):  # leftover from an interrupted write
+                os.remove(os.path.join(self.path, filename))
+                continue
+            if (ext != FILE_EXT or not name.isdigit()):
+                continue
+            stat = os.stat(os.path.join(self.path, filename))
+            entries.append((stat.st_mtime, int(name), stat.st_size))
+
+        for _, seq_num, size in sorted(entries):
+            self._entries[seq_num] = size
+            self._size += size
+        self._evict()
+
+    def _remove(self, seq_num):
+        """Remove an entry (lock must be held)"""
+        self._size -= self._entries.pop(seq_num)
+        try:
+            os.remove(self._get_path(seq_num))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, reserve=0):
+        """Evict the LRU entries until the given size fits (lock held)"""
+        while (self._entries and self._size + reserve > self.max_size):
+            seq_num = next(iter(self._entries))
+            logger.debug("Evict message {} from the cache".format(seq_num))
+            self._remove(seq_num)
+
+    def get(self, seq_num, msg_len=None):
+        """Get the packets of a message from the cache
+
+        Args:
+            seq_num : Transmission sequence number of the API message.
+            msg_len : Expected length of the API message, if known. A cached
+                      message with a different length is treated as stale and
+                      evicted.
+
+        Returns:
+            Tuple with the packed packets or None on cache miss.
+
+        """
+        with self._lock:
+            if (seq_num not in self._entries):
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._get_path(seq_num), 'rb') as fd:
+                    blob = fd.read()
+                cached_len, = struct.unpack_from(HEADER_FMT, blob)
+            except (OSError, struct.error) as e:
+                logger.debug("Failed to read cached message {}: {}".format(
+                    seq_num, e))
+                cached_len = None
+
+            if (cached_len is None
+                    or (msg_len is not None and cached_len != msg_len)):
+                self._remove(seq_num)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(seq_num)
+            os.utime(self._get_path(seq_num))
+            self.hits += 1
+
+        pkts = []
+        offset = HEADER_LEN
+        while (offset < len(blob)):
+            pkt_len, = struct.unpack_from(PKT_LEN_FMT, blob, offset)
+            offset += PKT_LEN_LEN
+            pkts.append(blob[offset:offset + pkt_len])
+            offset += pkt_len
+        return tuple(pkts)
+
+    def put(self, seq_num, msg_len, pkts):
+        """Save the packets of a message on the cache
+
+        Args:
+            seq_num : Transmission sequence number of the API message.
+            msg_len : Length of the API message.
+            pkts    : Sequence with the packed packets.
+
+        """
+        chunks = [struct.pack(HEADER_FMT, msg_len)]
+        for pkt in pkts:
+            chunks.append(struct.pack(PKT_LEN_FMT, len(pkt)))
+            chunks.append(pkt)
+        size = sum([len(x) for x in chunks])
+        if (size > self.max_size):
+            return
+
+        # Write to a temporary file first so that readers never see a
+        # partially written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(chunks)
+
+        with self._lock:
+            if (seq_num in self._entries):
+                self._size -= self._entries.pop(seq_num)
+            self._evict(reserve=size)
+            os.replace(tmp_path, self._get_path(seq_num))
+            self._entries[seq_num] = size
+            self._size += size
+
+    def get_stats(self):
+        """Get the cache statistics
+
+        Returns:
+            Dictionary with the number of cache hits and misses, the number
+            of cached messages, and the total size of the cache in bytes.
+
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'size': self._size
+            }
@@ -0,0 +1,154 @@
+"""In-process consumers (plugins) of the received API messages"""
+import importlib
+import logging
+import queue
+import threading
+from importlib.metadata import entry_points
+
+logger = logging.getLogger(__name__)
+ENTRY_POINT_GROUP = 'blocksat.api_plugins'
+DEFAULT_WORKERS = 1
+DEFAULT_QUEUE_SIZE = 16  # messages waiting for the plugins
+
+
+def load_plugin(spec):
+    """Load a plugin given as "module:callable"
+
+    Args:
+        spec : Module path and (possibly dotted) name of the callable, e.g.,
+               "mypkg.consumer:Consumer.on_msg".
+
+    Returns:
+        Plugin callable.
+
+    """
+    module_name, sep, attr = spec.partition(':')
+    if (not sep or not module_name or not attr):
+        raise ValueError(
+            "Invalid plugin {} (expected module:callable)".format(spec))
+
+    try:
+        obj = importlib.import_module(module_name)
+        for name in attr.split('.'):
+            obj = getattr(obj, name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError("Failed to load plugin {}: {}".format(spec, e))
+
+    if (not callable(obj)):
+        raise ValueError("Plugin {} is not callable".format(spec))
+    return obj
+
+
+def load_entry_point_plugins():
+    """Load the plugins installed under the blocksat.api_plugins entry points
+
+    Returns:
+        Dictionary with the plugin callables indexed by entry point name.
+
+    """
+    try:
+        eps = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:  # Python 3.9
+        eps = entry_points().get(ENTRY_POINT_GROUP, [])
+
+    plugins = {}
+    for ep in eps:
+        try:
+            plugins[ep.name] = ep.load()
+        except Exception as e:
+            logger.error("Failed to load plugin {}: {}".format(ep.name, e))
+    return plugins
+
+
+class PluginPool():
+    """Pool of worker threads feeding the decoded messages to plugins
+
+    Each plugin is a callable receiving two arguments: a read-only memoryview
+    of the decoded message data and a dictionary with the message metadata
+    (see submit). The plugins are called in order for each message, on one of
+    the pool's worker threads. With a single worker, the messages are
+    consumed in the order they are received.
+
+    The messages wait for the workers on a bounded queue. When the queue is
+    full, submit() blocks until there is room (backpressure), so that slow
+    plugins throttle the message processing instead of accumulating an
+    unbounded backlog.
+
+    Args:
+        plugins    : List of plugin callables.
+        workers    : Number of worker threads.
+        queue_size : Maximum number of messages waiting for the workers.
+
+    """
+
+    def __init__(self,
+                 plugins,
+                 workers=DEFAULT_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        assert (workers > 0)
+        self.plugins = list(plugins)
+        self._queue = queue.Queue(maxsize=queue_size)
+
+        # Statistics
+        self.delivered = 0  # messages consumed by all plugins
+        self.errors = 0  # exceptions raised by the plugins
+        self.stalls = 0  # submissions that had to wait for room
+
+        self._workers = []
+        for _ in range(workers):
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def get_backlog(self):
+        """Number of messages waiting for the workers"""
+        return self._queue.qsize()
+
+    def submit(self, data, meta):
+        """Submit a decoded message to the plugins
+
+        Args:
+            data : Decoded message data (bytes).
+            meta : Dictionary with the message's channel ('chan_num'),
+                   sequence number ('seq_num'), fingerprint of the verified
+                   signer ('signer', None if not signed or not verified),
+                   file name ('filename'), and path to the saved file
+                   ('path', None if not saved). With a background
+                   DownloadWriter, the file may still be in flight.
+
+        """
+        item = (memoryview(data).toreadonly(), meta)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.stalls += 1
+            logger.debug("Plugin queue full: waiting for the plugins")
+            self._queue.put(item)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if (item is None):
+                    break
+                data, meta = item
+                for plugin in self.plugins:
+                    try:
+                        plugin(data, meta)
+                    except Exception:
+                        self.errors += 1
+                        logger.exception("Plugin {} failed on message "
+                                         "{}".format(
+                                             getattr(plugin, '__name__',
+                                                     plugin),
+                                             meta.get('seq_num')))
+                self.delivered += 1
+            finally:
+                self._queue.task_done()
+
+    def close(self):
+        """Wait for the pending messages and stop the workers"""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
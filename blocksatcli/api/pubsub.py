@@ -0,0 +1,324 @@
+"""Local distribution of the decoded API messages over a Unix socket"""
+import errno
+import json
+import logging
+import os
+import selectors
+import socket
+import stat
+import struct
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+FRAME_HDR_FMT = '!II'  # metadata length, data length
+FRAME_HDR_LEN = struct.calcsize(FRAME_HDR_FMT)
+DEFAULT_MAX_BUFFER = 2**24  # bytes buffered per subscriber
+MAX_REQUEST_LEN = 4096  # maximum length of the subscription request
+READ_SIZE = 4096
+
+
+def pack_frame_header(meta, data_len):
+    """Pack the frame header and metadata preceding a message's data
+
+    Each frame consists of the metadata length and the data length as
+    big-endian 32-bit integers, followed by the metadata in JSON format and
+    the message data.
+
+    """
+    meta_bytes = json.dumps(meta).encode()
+    return struct.pack(FRAME_HDR_FMT, len(meta_bytes), data_len) + meta_bytes
+
+
+def subscribe(path, channels=None):
+    """Subscribe to the messages published on a Unix socket
+
+    Args:
+        path     : Path to the publisher's Unix socket.
+        channels : List of API channels to subscribe to. If None or empty,
+                   subscribe to all channels.
+
+    Returns:
+        Generator of (metadata, data) tuples, one per received message. The
+        generator ends when the publisher closes the connection.
+
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.sendall((json.dumps({'channels': channels or []}) + '\n').encode())
+    with sock, sock.makefile('rb') as fd:
+        while True:
+            header = fd.read(FRAME_HDR_LEN)
+            if (len(header) < FRAME_HDR_LEN):
+                return
+            meta_len, data_len = struct.unpack(FRAME_HDR_FMT, header)
+            meta = json.loads(fd.read(meta_len))
+            data = fd.read(data_len)
+            if (len(data) < data_len):
+                return
+            yield meta, data
+
+
+def _remove_stale_socket(path):
+    """Remove the socket file left by a previous session
+
+    Remove the file only if it is a socket on which no other publisher is
+    listening. Otherwise, raise an error instead of replacing it.
+
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+
+    if (not stat.S_ISSOCK(mode)):
+        raise FileExistsError(
+            "{} already exists and is not a socket".format(path))
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        if (e.errno != errno.ECONNREFUSED):
+            raise
+    else:
+        raise FileExistsError(
+            "Socket {} is in use by another publisher".format(path))
+    finally:
+        sock.close()
+
+    logger.debug("Removing stale socket {}".format(path))
+    os.remove(path)
+
+
+class Subscriber():
+    """Connection of a subscriber to the MsgPublisher"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.channels = None  # subscribed channels (empty for all)
+        self.request = b''  # partially received subscription request
+        self.chunks = deque()  # memoryviews waiting to be sent
+        self.buffered = 0  # bytes waiting to be sent
+        self.offset = 0  # bytes of the first chunk already sent
+        self.closing = False
+
+    def wants(self, chan_num):
+        return (self.channels is not None and not self.closing
+                and (not self.channels or chan_num in self.channels))
+
+
+class MsgPublisher():
+    """Publisher of decoded API messages to local subscribers
+
+    Serves the decoded messages over a Unix domain socket, so that multiple
+    local applications can consume the messages decoded by a single listener.
+    Each subscriber connects to the socket and sends a subscription request
+    consisting of a JSON object terminated by a newline, with the list of API
+    channels of interest (e.g., '{"channels": [1, 4]}'). An empty list
+    subscribes to all channels. The publisher then sends a frame per message
+    (see pack_frame_header), including the metadata passed to publish().
+
+    The messages wait on a buffer of limited size for each subscriber. If a
+    subscriber does not keep up with the messages and its buffer fills up,
+    the publisher disconnects it, so that a slow subscriber cannot hold the
+    others or accumulate an unbounded backlog.
+
+    Method publish() has the plugin call signature, so that the publisher can
+    be fed by the PluginPool (see plugins.py).
+
+    Args:
+        path       : Path to the Unix socket.
+        max_buffer : Maximum number of bytes buffered for each subscriber.
+
+    """
+
+    def __init__(self, path, max_buffer=DEFAULT_MAX_BUFFER):
+        self.path = path
+        self.max_buffer = max_buffer
+        self._lock = threading.Lock()
+        self._subs = []
+        self.enabled = True
+
+        # Statistics
+        self.published = 0
+        self.disconnects = 0  # slow subscribers disconnected
+
+        _remove_stale_socket(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        self._server.setblocking(False)
+
+        # Socket pair used to wake up the I/O thread on new messages
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._io_loop, daemon=True)
+        self._thread.start()
+        logger.info("Publishing the decoded messages at {}".format(path))
+
+    def get_n_subscribers(self):
+        """Number of subscribers with an active subscription"""
+        with self._lock:
+            return sum(1 for x in self._subs
+                       if x.channels is not None and not x.closing)
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except BlockingIOError:
+            pass  # already woken
+
+    def publish(self, data, meta):
+        """Publish a decoded message
+
+        Args:
+            data : Message data (bytes or memoryview).
+            meta : Dictionary with the message metadata, including the API
+                   channel ('chan_num'). Must be serializable to JSON.
+
+        """
+        data = memoryview(data)
+        header = memoryview(pack_frame_header(meta, len(data)))
+        frame_len = len(header) + len(data)
+        with self._lock:
+            for sub in self._subs:
+                if (not sub.wants(meta['chan_num'])):
+                    continue
+                if (sub.buffered + frame_len > self.max_buffer):
+                    logger.warning("Disconnecting slow subscriber (buffer "
+                                   "full)")
+                    sub.closing = True
+                    sub.chunks.clear()
+                    sub.buffered = 0
+                    self.disconnects += 1
+                    continue
+                sub.chunks.extend([header, data])
+                sub.buffered += frame_len
+            self.published += 1
+        self._wake()
+
+    def _accept(self):
+        try:
+            conn, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        sub = Subscriber(conn)
+        with self._lock:
+            self._subs.append(sub)
+        self._selector.register(conn, selectors.EVENT_READ, sub)
+        logger.debug("New subscriber connected")
+
+    def _read_request(self, sub):
+        """Read the subscription request (lock must be held)"""
+        try:
+            data = sub.conn.recv(READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if (not data):
+            sub.closing = True
+            return
+
+        if (sub.channels is not None):
+            return  # ignore anything after the subscription request
+
+        sub.request += data
+        if (b'\n' not in sub.request):
+            if (len(sub.request) > MAX_REQUEST_LEN):
+                logger.warning("Invalid subscription request")
+                sub.closing = True
+            return
+
+        try:
+            request = json.loads(sub.request.split(b'\n')[0])
+            channels = request.get('channels', [])
+            assert (isinstance(channels, list))
+            assert (all(isinstance(x, int) for x in channels))
+        except (ValueError, AttributeError, AssertionError):
+            logger.warning("Invalid subscription request")
+            sub.closing = True
+            return
+
+        sub.channels = set(channels)
+        logger.info("New subscription to {}".format(
+            "all channels" if not channels else "channel(s) " +
+            ", ".join([str(x) for x in sorted(channels)])))
+
+    def _write(self, sub):
+        """Send the buffered frames (lock must be held)"""
+        while (sub.chunks):
+            chunk = sub.chunks[0]
+            try:
+                n_sent = sub.conn.send(chunk[sub.offset:])
+            except BlockingIOError:
+                return
+            except OSError:
+                sub.closing = True
+                return
+            sub.offset += n_sent
+            sub.buffered -= n_sent
+            if (sub.offset == len(chunk)):
+                sub.chunks.popleft()
+                sub.offset = 0
+
+    def _close_sub(self, sub):
+        """Close a subscriber's connection (lock must be held)"""
+        self._selector.unregister(sub.conn)
+        sub.conn.close()
+        self._subs.remove(sub)
+        logger.debug("Subscriber disconnected")
+
+    def _io_loop(self):
+        while self.enabled:
+            for key, events in self._selector.select():
+                if (key.fileobj is self._server):
+                    self._accept()
+                elif (key.fileobj is self._wake_r):
+                    try:
+                        while self._wake_r.recv(READ_SIZE):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif (events & selectors.EVENT_READ):
+                    with self._lock:
+                        self._read_request(key.data)
+
+            with self._lock:
+                for sub in list(self._subs):
+                    if (not sub.closing):
+                        self._write(sub)
+                    if (sub.closing):
+                        self._close_sub(sub)
+                        continue
+                    events = selectors.EVENT_READ
+                    if (sub.chunks):
+                        events |= selectors.EVENT_WRITE
+                    self._selector.modify(sub.conn, events, sub)
+
+        # Send what the sockets can take without blocking and disconnect
+        with self._lock:
+            for sub in list(self._subs):
+                if (not sub.closing):
+                    self._write(sub)
+                self._close_sub(sub)
+
+    def close(self):
+        """Stop the publisher and disconnect the subscribers"""
+        self.enabled = False
+        self._wake()
+        self._thread.join()
+        self._selector.close()
+        self._server.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        if (os.path.exists(self.path)):
+            os.remove(self.path)
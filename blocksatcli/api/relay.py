@@ -0,0 +1,214 @@
+"""Relay of the received Blocksat packets to other hosts"""
+import ipaddress
+import logging
+import selectors
+import time
+from collections import OrderedDict
+
+from . import net
+from .order import ApiChannel
+from .pkt import HEADER_LEN
+
+logger = logging.getLogger(__name__)
+DEDUPE_WINDOW = 8192  # Number of packet headers remembered for dedupe
+DEFAULT_BATCH = 32  # Maximum number of packets relayed per send batch
+DEFAULT_REPORT_INTERVAL = 10  # Interval between throughput reports (sec)
+POLL_TIMEOUT = 0.1  # Timeout of each poll of the input sockets (sec)
+
+
+class DestStats():
+    """Transmission statistics of a relay destination"""
+
+    def __init__(self):
+        self.pkts = 0
+        self.bytes = 0
+        self.errors = 0
+        self.last_report_bytes = 0  # bytes sent until the last report
+
+
+class ApiRelay():
+    """Relay of Blocksat packets
+
+    Receives the Blocksat packets from one or more input sockets (e.g., one
+    per receiver interface) and re-emits them to multiple unicast or multicast
+    destinations. The packets received within each poll of the inputs are
+    relayed in batches, so that each destination socket can send them with a
+    single system call when UDP GSO is enabled (see UdpSock.send_many).
+
+    Optionally, the relay forwards a single API channel only, dropping the
+    other channels within the kernel when possible. It can also drop the
+    packets received repeatedly (e.g., over redundant inputs) by remembering
+    the headers of the last relayed packets. The header uniquely identifies
+    each fragment by channel, sequence number, and fragment number.
+
+    Args:
+        in_socks  : List of UdpSock objects to receive the packets from.
+        out_socks : List of UdpSock objects to send the packets to.
+        channel   : API channel to relay. Set 0 (ApiChannel.ALL) to relay
+                    all channels.
+        dedupe    : Whether to drop the repeated packets.
+        batch     : Maximum number of packets relayed per batch.
+
+    """
+
+    def __init__(self,
+                 in_socks,
+                 out_socks,
+                 channel=ApiChannel.ALL.value,
+                 dedupe=True,
+                 batch=DEFAULT_BATCH):
+        assert (len(in_socks) > 0)
+        assert (len(out_socks) > 0)
+        assert (batch > 0)
+        self.in_socks = in_socks
+        self.out_socks = out_socks
+        self.channel = channel
+        self.dedupe = dedupe
+        self.batch = batch
+        self.enabled = True
+
+        # Statistics
+        self.rx_pkts = 0
+        self.filtered = 0  # packets from other channels
+        self.invalid = 0  # non-API packets
+        self.dups = 0
+        self.dest_stats = [DestStats() for _ in out_socks]
+
+        self._seen = OrderedDict()  # headers of the last relayed packets
+        # Whether the kernel drops the packets from other channels
+        self._chan_filtered = True
+        if (channel != ApiChannel.ALL.value):
+            for sock in in_socks:
+                if (not sock.set_chan_filter(channel)):
+                    self._chan_filtered = False
+
+        self._selector = selectors.DefaultSelector()
+        for sock in in_socks:
+            sock.sock.setblocking(False)
+            self._selector.register(sock.sock, selectors.EVENT_READ, sock)
+
+    def stop(self):
+        logger.debug("Stopping API relay")
+        self.enabled = False
+
+    def _accept(self, pkt):
+        """Check whether a received packet should be relayed"""
+        self.rx_pkts += 1
+
+        if (len(pkt) < HEADER_LEN or not (pkt[0] & 1)):
+            self.invalid += 1
+            return False
+
+        if (not self._chan_filtered and pkt[1] != self.channel):
+            self.filtered += 1
+            return False
+
+        if (self.dedupe):
+            header = pkt[:HEADER_LEN]
+            if (header in self._seen):
+                self.dups += 1
+                return False
+            self._seen[header] = None
+            if (len(self._seen) > DEDUPE_WINDOW):
+                self._seen.popitem(last=False)
+
+        return True
+
+    def _recv_batch(self):
+        """Receive the packets available on the input sockets"""
+        pkts = []
+        for key, _ in self._selector.select(timeout=POLL_TIMEOUT):
+            sock = key.data
+            while (len(pkts) < self.batch):
+                try:
+                    pkt, _ = sock.recv()
+                except BlockingIOError:
+                    break
+                if (self._accept(pkt)):
+                    pkts.append(pkt)
+        return pkts
+
+    def _send_batch(self, pkts):
+        """Send a batch of packets to all destinations"""
+        n_bytes = sum(len(x) for x in pkts)
+        for sock, stats in zip(self.out_socks, self.dest_stats):
+            try:
+                sock.send_many(pkts)
+            except OSError as e:
+                stats.errors += 1
+                logger.debug("Failed to relay to {}:{}: {}".format(
+                    sock.ip, sock.port, e))
+                continue
+            stats.pkts += len(pkts)
+            stats.bytes += n_bytes
+
+    def log_stats(self, interval=None):
+        """Log the relay statistics and the throughput per destination
+
+        Args:
+            interval : Time in seconds since the last report, used to compute
+                       the throughput. If None, omit the throughput.
+
+        """
+        logger.info("Received: {} packets; Duplicates: {}; Other channels: "
+                    "{}; Invalid: {}".format(self.rx_pkts, self.dups,
+                                             self.filtered, self.invalid))
+        for sock, stats in zip(self.out_socks, self.dest_stats):
+            rate_str = ""
+            if (interval):
+                rate_str = "{:.1f} kbps; ".format(
+                    (stats.bytes - stats.last_report_bytes) * 8 / interval /
+                    1e3)
+                stats.last_report_bytes = stats.bytes
+            logger.info("{}:{} -> {}{} packets, {} bytes, {} errors".format(
+                sock.ip, sock.port, rate_str, stats.pkts, stats.bytes,
+                stats.errors))
+
+    def run(self, report_interval=DEFAULT_REPORT_INTERVAL):
+        """Run loop
+
+        Args:
+            report_interval : Interval in seconds between the reports of the
+                              relay statistics. Set 0 to disable the reports.
+
+        """
+        logger.info("Relaying {} to {}".format(
+            "all channels" if self.channel == ApiChannel.ALL.value else
+            "channel {}".format(self.channel),
+            ", ".join(["{}:{}".format(x.ip, x.port) for x in self.out_socks])))
+        t_report = time.monotonic()
+        while self.enabled:
+            pkts = self._recv_batch()
+            if (pkts):
+                self._send_batch(pkts)
+
+            if (report_interval):
+                now = time.monotonic()
+                if (now - t_report >= report_interval):
+                    self.log_stats(now - t_report)
+                    t_report = now
+
+        self._selector.close()
+
+
+def open_dest_sock(dest, interface=None, ttl=1, dscp=0, gso=False):
+    """Open the UdpSock used to relay packets to a destination
+
+    Args:
+        dest      : Destination address (ip:port).
+        interface : Network interface over which to send multicast packets.
+        ttl       : Time-to-live of multicast packets.
+        dscp      : Differentiated services code point (DSCP).
+        gso       : Whether to enable UDP GSO.
+
+    Returns:
+        UdpSock object.
+
+    """
+    sock = net.UdpSock(dest, interface, mcast_rx=False, bind=False)
+    if (ipaddress.ip_address(sock.ip).is_multicast):
+        sock.set_mcast_tx_opts(ttl, dscp)
+    if (gso and not sock.enable_gso()):
+        logger.warning("UDP GSO is not supported on this system. Sending one "
+                       "packet at a time.")
+    return sock
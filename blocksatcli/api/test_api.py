@@ -0,0 +1,224 @@
+import io
+import os
+import tempfile
+import threading
+import unittest
+from argparse import Namespace
+from contextlib import redirect_stdout
+from http import HTTPStatus
+from unittest.mock import MagicMock, Mock, patch
+
+import requests
+
+from ..cache import Cache
+from . import api
+from .order import ApiChannel
+from .test_order import mock_post_api_resp
+
+
+def mock_error_resp():
+    return Mock(status_code=HTTPStatus.BAD_REQUEST,
+                json=lambda: {'errors': [{
+                    'title': 'Bid too low'
+                }]})
+
+
+class TestBatchSend(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_dir = os.path.join(self.tmp_dir.name, 'src')
+        self.cfg_dir = os.path.join(self.tmp_dir.name, 'cfg')
+        os.makedirs(self.src_dir)
+        os.makedirs(self.cfg_dir)
+        for name in ['b.txt', 'a.txt', 'c.txt']:
+            self._write(name, name.encode() * 10)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.src_dir, name)
+        with open(path, 'wb') as fd:
+            fd.write(data)
+        return path
+
+    def _args(self, batch, workers=1):
+        return Namespace(batch=batch,
+                         batch_workers=workers,
+                         channel=ApiChannel.USER.value,
+                         bid=1000,
+                         regions=None,
+                         tls_cert=None,
+                         tls_key=None,
+                         cfg_dir=self.cfg_dir,
+                         invoice_exec=None)
+
+    def _send_batch(self, args, post):
+        """Run send_batch with a mock session and capture the summary"""
+        session = MagicMock()
+        session.post.side_effect = post
+        stdout = io.StringIO()
+        with patch('requests.Session', return_value=session), \
+                redirect_stdout(stdout):
+            results = api.send_batch(args, {}, 'mock-server')
+        return results, stdout.getvalue()
+
+    def test_batch_files(self):
+        """Test the directory and manifest parsing"""
+        os.makedirs(os.path.join(self.src_dir, 'subdir'))
+
+        # Directory: regular files in alphabetical order, non-recursively
+        self.assertEqual(api._get_batch_files(self.src_dir), [
+            os.path.join(self.src_dir, name)
+            for name in ['a.txt', 'b.txt', 'c.txt']
+        ])
+
+        # Manifest: paths relative to the manifest's directory, skipping
+        # comments and empty lines
+        manifest = self._write(
+            'manifest', '# Files to send\nc.txt\n\n  a.txt  \n{}\n'.format(
+                os.path.join(self.tmp_dir.name, 'other.txt')).encode())
+        self.assertEqual(api._get_batch_files(manifest), [
+            os.path.join(self.src_dir, 'c.txt'),
+            os.path.join(self.src_dir, 'a.txt'),
+            os.path.join(self.tmp_dir.name, 'other.txt')
+        ])
+
+        # Empty batch
+        empty_dir = os.path.join(self.tmp_dir.name, 'empty')
+        os.makedirs(empty_dir)
+        with self.assertRaises(ValueError):
+            api.send_batch(self._args(empty_dir), {}, 'mock-server')
+
+    def test_send_batch(self):
+        """Test submitting the orders and recording them on the tx log"""
+        results, summary = self._send_batch(
+            self._args(self.src_dir),
+            lambda *args, **kwargs: mock_post_api_resp(1000))
+
+        self.assertEqual([os.path.basename(r['file']) for r in results],
+                         ['a.txt', 'b.txt', 'c.txt'])
+        cache = Cache(os.path.join(self.cfg_dir, "api"),
+                      filename="tx_log.json")
+        for r in results:
+            self.assertNotIn('error', r)
+            self.assertEqual(r['bid'], 1000)
+            self.assertGreater(r['tx_len'], 0)
+            self.assertIsNotNone(cache.get(r['order'].uuid))
+
+        # Summary table with a row per file
+        lines = summary.splitlines()
+        self.assertEqual(lines[0].split()[:3], ['File', 'Size', '(B)'])
+        for line, r in zip(lines[1:4], results):
+            self.assertEqual(line.split(), [
+                os.path.basename(r['file']),
+                str(r['tx_len']), '1000', r['order'].uuid, 'payreq'
+            ])
+        self.assertEqual(lines[-1], "3 of 3 transmission orders submitted")
+
+    def test_item_errors(self):
+        """Test capturing the errors of each file without stopping"""
+        self._write('d.txt', b'')  # empty file
+        manifest = self._write('manifest',
+                               b'a.txt\nmissing.txt\nb.txt\nc.txt\nd.txt\n')
+        responses = iter([
+            mock_post_api_resp(1000),
+            mock_error_resp(),
+            requests.exceptions.ConnectionError("Connection refused")
+        ])
+
+        def post(*args, **kwargs):
+            res = next(responses)
+            if (isinstance(res, Exception)):
+                raise res
+            return res
+
+        results, summary = self._send_batch(self._args(manifest), post)
+
+        self.assertIsNotNone(results[0]['order'])
+        self.assertNotIn('error', results[0])
+        self.assertIn('missing.txt', results[1]['error'])
+        self.assertIn('Bid too low', results[2]['error'])
+        self.assertEqual(results[3]['error'], "Connection refused")
+        self.assertEqual(results[4]['error'], "Empty file")
+        for r in results[1:]:
+            self.assertIsNone(r['order'])
+
+        # Only the submitted order is recorded
+        cache = Cache(os.path.join(self.cfg_dir, "api"),
+                      filename="tx_log.json")
+        self.assertIsNotNone(cache.get(results[0]['order'].uuid))
+
+        lines = summary.splitlines()
+        self.assertIn("Error: Empty file", lines[5])
+        self.assertEqual(lines[-1], "1 of 5 transmission orders submitted")
+
+    def test_unexpected_error(self):
+        """Test recording the submitted orders despite other failures"""
+
+        def generate_file(path, dst_dir, **kwargs):
+            if (path.endswith('b.txt')):
+                raise RuntimeError("Key expired")
+            return real_generate_file(path, dst_dir, **kwargs)
+
+        real_generate_file = api.api_msg.generate_file
+        with patch('blocksatcli.api.msg.generate_file', generate_file):
+            results, _ = self._send_batch(
+                self._args(self.src_dir, workers=3),
+                lambda *args, **kwargs: mock_post_api_resp(1000))
+
+        self.assertEqual(results[1]['error'], "Key expired")
+        cache = Cache(os.path.join(self.cfg_dir, "api"),
+                      filename="tx_log.json")
+        for r in [results[0], results[2]]:
+            self.assertIsNotNone(cache.get(r['order'].uuid))
+
+    def test_key_lookup(self):
+        """Test looking up the GPG keys once for all files"""
+        gpg = Mock()
+        gpg.get_default_public_key.return_value = {'fingerprint': 'AB'}
+        gpg.get_default_priv_key.return_value = {'fingerprint': 'CD'}
+
+        def encrypt_file(path, dst_path, recipient, **kwargs):
+            with open(path, 'rb') as src_fd, open(dst_path, 'wb') as dst_fd:
+                dst_fd.write(src_fd.read())
+            return Mock(ok=True)
+
+        gpg.encrypt_file.side_effect = encrypt_file
+        msg_opts = {'plaintext': False, 'sign': True, 'gpg': gpg}
+        session = MagicMock()
+        session.post.side_effect = \
+            lambda *args, **kwargs: mock_post_api_resp(1000)
+        with patch('requests.Session', return_value=session), \
+                redirect_stdout(io.StringIO()):
+            results = api.send_batch(self._args(self.src_dir, workers=3),
+                                     msg_opts, 'mock-server')
+
+        self.assertTrue(all(r['order'] is not None for r in results))
+        gpg.get_default_public_key.assert_called_once()
+        gpg.get_default_priv_key.assert_called_once()
+        self.assertEqual(gpg.encrypt_file.call_count, 3)
+        for c in gpg.encrypt_file.call_args_list:
+            self.assertEqual(c.args[2], 'AB')
+            self.assertEqual(c.kwargs['sign'], 'CD')
+
+    def test_workers(self):
+        """Test submitting the orders concurrently"""
+        n_workers = 3
+        barrier = threading.Barrier(n_workers, timeout=10)
+
+        def post(*args, **kwargs):
+            # Only returns once all workers are submitting concurrently
+            barrier.wait()
+            return mock_post_api_resp(1000)
+
+        results, summary = self._send_batch(
+            self._args(self.src_dir, n_workers), post)
+
+        # The results keep the order of the files
+        self.assertEqual([os.path.basename(r['file']) for r in results],
+                         ['a.txt', 'b.txt', 'c.txt'])
+        self.assertTrue(all(r['order'] is not None for r in results))
+        self.assertEqual(summary.splitlines()[-1],
+                         "3 of 3 transmission orders submitted")
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import unittest
+
+from .capture import CaptureWriter, read_capture, replay_capture
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'capture.bin')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, records):
+        writer = CaptureWriter(self.path)
+        for timestamp, addr, payload in records:
+            writer.write(payload, addr, timestamp)
+        writer.close()
+
+    def test_write_read(self):
+        """Test reading the captured records"""
+        records = [(1000.0 + i, ('192.168.1.{}'.format(i), 4433 + i),
+                    os.urandom(100 * i)) for i in range(5)]
+        self._write(records[:3])
+
+        # Captures are appended to the existing file
+        self._write(records[3:])
+        self.assertEqual(list(read_capture(self.path)), records)
+
+        # A truncated record is ignored
+        with open(self.path, 'r+b') as fd:
+            fd.truncate(os.path.getsize(self.path) - 10)
+        self.assertEqual(list(read_capture(self.path)), records[:-1])
+
+    def test_invalid_file(self):
+        """Test reading a file that is not a capture"""
+        with open(self.path, 'wb') as fd:
+            fd.write(b'not a capture')
+        with self.assertRaises(ValueError):
+            list(read_capture(self.path))
+        with self.assertRaises(ValueError):
+            CaptureWriter(self.path)
+
+    def test_replay_speed(self):
+        """Test the replay timing"""
+        records = [(1000.0 + 0.1 * i, ('127.0.0.1', 4433), bytes([i]))
+                   for i in range(5)]
+        self._write(records)
+
+        # As fast as possible
+        t_start = time.monotonic()
+        replayed = list(replay_capture(self.path))
+        self.assertLess(time.monotonic() - t_start, 0.1)
+        self.assertEqual(replayed, [(x[2], x[1]) for x in records])
+
+        # At twice the recorded speed
+        t_start = time.monotonic()
+        list(replay_capture(self.path, speed=2))
+        self.assertAlmostEqual(time.monotonic() - t_start, 0.2, delta=0.05)
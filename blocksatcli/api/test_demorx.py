@@ -0,0 +1,247 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from . import demorx, net
+from .demorx import DemoRx
+from .pkt import BlocksatPktHandler
+from .pktcache import PktCache
+
+
+class TestDemoRx(unittest.TestCase):
+
+    def _mock_sock(self, delay=0):
+        """Mock socket recording the transmission end time"""
+        sock = Mock(spec=net.UdpSock, ip="239.0.0.2", port=4433, ifindex=0)
+        sock.sent = []
+
+        def send_many(datagrams):
+            time.sleep(delay)
+            sock.sent.extend(datagrams)
+            sock.end_time = time.monotonic()
+
+        sock.send_many.side_effect = send_many
+        return sock
+
+    def _get_pkts(self, n_bytes):
+        handler = BlocksatPktHandler()
+        handler.split(os.urandom(n_bytes), 1, 1)
+        return handler.get_frags(1)
+
+    def test_parallel_sockets(self):
+        """Test independent transmission over multiple sockets"""
+        pkts = self._get_pkts(20000)
+        fast_sock = self._mock_sock()
+        slow_sock = self._mock_sock(delay=0.02)
+        demo_rx = DemoRx("mock-server", [fast_sock, slow_sock],
+                         kbps=0,
+                         tx_event="sent",
+                         channel=1)
+        all_stats = demo_rx._send_pkts(pkts, [fast_sock, slow_sock])
+
+        # All packets should be sent over both sockets
+        raw_pkts = [pkt.pack() for pkt in pkts]
+        self.assertEqual(fast_sock.sent, raw_pkts)
+        self.assertEqual(slow_sock.sent, raw_pkts)
+        self.assertEqual(len(all_stats), 2)
+
+        # The slow socket should not hold back the fast one
+        self.assertLess(fast_sock.end_time,
+                        slow_sock.end_time - 0.01 * len(pkts))
+
+    def test_paced_bursts(self):
+        """Test the paced transmission in bursts"""
+        pkts = self._get_pkts(30000)
+        sock = self._mock_sock()
+        kbps = 2000
+        demo_rx = DemoRx("mock-server", [sock],
+                         kbps=kbps,
+                         tx_event="sent",
+                         channel=1,
+                         burst=4)
+        stats = demo_rx._send_pkts(pkts, [sock])[0]
+
+        self.assertEqual(sock.send_many.call_count, -(-len(pkts) // 4))
+        self.assertEqual(sock.sent, [pkt.pack() for pkt in pkts])
+        self.assertAlmostEqual(stats['achieved_kbps'], kbps, delta=0.1 * kbps)
+
+    def _mock_get_data(self, messages, delay=0, fetched=None):
+        """Mock of the requests.get function serving /message/<seq_num>"""
+
+        def get(url, **kwargs):
+            seq_num = int(url.split('/')[-1])
+            time.sleep(delay)
+            if fetched is not None:
+                fetched.append(seq_num)
+            return Mock(status_code=200, content=messages[seq_num])
+
+        return get
+
+    def _event(self, seq_num, status, size=1000):
+        return json.dumps({
+            'tx_seq_num': seq_num,
+            'status': status,
+            'message_size': size,
+            'regions': [0]
+        })
+
+    @patch('blocksatcli.api.order.requests.post')
+    @patch('blocksatcli.api.order.requests.get')
+    def test_prefetch(self, mock_get, mock_post):
+        """Test transmission of prefetched orders"""
+        messages = {1: os.urandom(5000), 2: os.urandom(5000)}
+        fetched = []
+        mock_get.side_effect = self._mock_get_data(messages,
+                                                   delay=0.2,
+                                                   fetched=fetched)
+        sock = self._mock_sock()
+        demo_rx = DemoRx("mock-server", [sock],
+                         kbps=0,
+                         tx_event="sent",
+                         channel=1,
+                         tls_cert="cert",
+                         tls_key="key")
+
+        # The data of the transmitting order is downloaded in the background
+        demo_rx._handle_event(self._event(1, 'transmitting'))
+        self.assertIn(1, demo_rx._prefetch)
+        time.sleep(0.3)
+
+        # When the trigger event arrives, the packets are already available
+        t_start = time.monotonic()
+        demo_rx._handle_event(self._event(1, 'sent'))
+        self.assertLess(time.monotonic() - t_start, 0.1)
+        self.assertEqual(fetched, [1])
+        self.assertNotIn(1, demo_rx._prefetch)
+        self.assertEqual(demo_rx._prefetch_bytes, 0)
+        handler = BlocksatPktHandler()
+        handler.split(messages[1], 1, 1)
+        self.assertEqual(sock.sent, [x.pack() for x in handler.get_frags(1)])
+        mock_post.assert_called_once()
+
+        # The order is not prefetched again after its transmission
+        demo_rx._handle_event(self._event(1, 'transmitting'))
+        self.assertNotIn(1, demo_rx._prefetch)
+
+        # Without prefetching, the data is fetched on the trigger event
+        demo_rx._handle_event(self._event(2, 'sent'))
+        self.assertEqual(fetched, [1, 2])
+
+    @patch('blocksatcli.api.order.requests.get')
+    def test_prefetch_cache_capacity(self, mock_get):
+        """Test the eviction of the oldest prefetched orders"""
+        messages = {i: os.urandom(1000) for i in range(5)}
+        mock_get.side_effect = self._mock_get_data(messages)
+        demo_rx = DemoRx("mock-server", [self._mock_sock()],
+                         kbps=0,
+                         tx_event="sent",
+                         channel=1,
+                         prefetch_size=3000)
+
+        for seq_num in messages:
+            demo_rx._handle_event(self._event(seq_num, 'paid'))
+        self.assertEqual(list(demo_rx._prefetch), [2, 3, 4])
+        self.assertEqual(demo_rx._prefetch_bytes, 3000)
+
+        # Messages larger than the cache capacity are not prefetched
+        demo_rx._handle_event(self._event(5, 'paid', size=4000))
+        self.assertNotIn(5, demo_rx._prefetch)
+
+        # Prefetching is disabled with a zero capacity
+        demo_rx = DemoRx("mock-server", [self._mock_sock()],
+                         kbps=0,
+                         tx_event="sent",
+                         channel=1,
+                         prefetch_size=0)
+        demo_rx._handle_event(self._event(1, 'paid'))
+        self.assertEqual(len(demo_rx._prefetch), 0)
+
+    @patch('blocksatcli.api.order.requests.get')
+    def test_retransmission_cache(self, mock_get):
+        """Test retransmission of a message from the on-disk cache"""
+        messages = {1: os.urandom(5000)}
+        fetched = []
+        mock_get.side_effect = self._mock_get_data(messages, fetched=fetched)
+        sock = self._mock_sock()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            demo_rx = DemoRx("mock-server", [sock],
+                             kbps=0,
+                             tx_event="sent",
+                             channel=1,
+                             pkt_cache=PktCache(tmp_dir, 2**20))
+            demo_rx._handle_event(self._event(1, 'sent', size=5000))
+            demo_rx._handle_event(self._event(1, 'sent', size=5000))
+
+            # The message is downloaded only once and transmitted twice
+            self.assertEqual(fetched, [1])
+            n_pkts = len(sock.sent) // 2
+            self.assertEqual(sock.sent[:n_pkts], sock.sent[n_pkts:])
+            stats = demo_rx.pkt_cache.get_stats()
+            self.assertEqual(stats['hits'], 1)
+            self.assertEqual(stats['misses'], 1)
+
+    def test_poll_orders(self):
+        """Test polling of the transmitting orders"""
+        queues = {'queued': [], 'transmitting': []}
+        order_mgr = Mock()
+        order_mgr.get_orders.side_effect = \
+            lambda status, channel, queue, conditional: queues[queue]
+        demo_rx = DemoRx("mock-server", [self._mock_sock()],
+                         kbps=0,
+                         tx_event="sent",
+                         channel=1,
+                         prefetch_size=0)
+        demo_rx._handle_order = Mock()
+
+        # Idle
+        self.assertEqual(demo_rx._poll_orders(order_mgr), (0, False))
+
+        # New transmitting order
+        order_info = {'tx_seq_num': 1, 'status': 'transmitting'}
+        queues['transmitting'] = [order_info]
+        self.assertEqual(demo_rx._poll_orders(order_mgr), (1, True))
+        demo_rx._handle_order.assert_called_once_with(order_info)
+
+        # The order remains active, but it is not transmitted again
+        self.assertEqual(demo_rx._poll_orders(order_mgr), (0, True))
+
+        # Unless the server retransmits it
+        order_info['retransmission'] = {'retry_count': 1}
+        self.assertEqual(demo_rx._poll_orders(order_mgr), (1, True))
+
+        # Upcoming (paid) orders keep the polling active
+        queues['transmitting'] = []
+        queues['queued'] = [{'tx_seq_num': 2, 'status': 'paid'}]
+        demo_rx._next_queue_poll = 0
+        self.assertEqual(demo_rx._poll_orders(order_mgr), (0, True))
+
+        # The dedupe window is bounded
+        for seq_num in range(demorx.TX_DEDUPE_WINDOW + 10):
+            queues['transmitting'] = [{
+                'tx_seq_num': seq_num,
+                'status': 'transmitting'
+            }]
+            demo_rx._poll_orders(order_mgr)
+        self.assertEqual(len(demo_rx._tx_window), demorx.TX_DEDUPE_WINDOW)
+
+    def test_run_exit(self):
+        """Test releasing the worker threads when the run loop exits"""
+        socks = [self._mock_sock(), self._mock_sock()]
+        demo_rx = DemoRx("mock-server",
+                         socks,
+                         kbps=0,
+                         tx_event="sent",
+                         channel=1,
+                         poll=True)
+        demo_rx.run_poll_client = Mock(side_effect=SystemExit)
+        with self.assertRaises(SystemExit):
+            demo_rx.run()
+
+        # The executors no longer accept work
+        with self.assertRaises(RuntimeError):
+            demo_rx._tx_executor.submit(print)
+        with self.assertRaises(RuntimeError):
+            demo_rx._prefetch_executor.submit(print)
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from . import dlindex, msg, writer
+
+
+class TestDownloadIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dst_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        dlindex._indexes.clear()
+
+    def _save(self, data, filename='file.txt'):
+        return msg.ApiMsg(data, filename=filename).save(self.dst_dir)
+
+    def test_dedupe(self):
+        """Test the detection of repeated downloads"""
+        path1 = self._save(b'a')
+        path2 = self._save(b'b')
+        self.assertEqual(path1, os.path.join(self.dst_dir, 'file.txt'))
+        self.assertEqual(path2, os.path.join(self.dst_dir, 'file-2.txt'))
+
+        # Repeated downloads are detected on any of the numbered variants
+        # without reading the existing files
+        with patch('blocksatcli.api.dlindex._hash_file') as mock_hash:
+            self.assertEqual(self._save(b'b'), path2)
+            self.assertEqual(self._save(b'a'), path1)
+            self.assertEqual(self._save(b'c'),
+                             os.path.join(self.dst_dir, 'file-3.txt'))
+            # The same contents with another name is a different download
+            self.assertEqual(self._save(b'a', 'other.txt'),
+                             os.path.join(self.dst_dir, 'other.txt'))
+            mock_hash.assert_not_called()
+
+        # The index persists across sessions
+        dlindex._indexes.clear()
+        with patch('blocksatcli.api.dlindex._hash_file') as mock_hash:
+            self.assertEqual(self._save(b'b'), path2)
+            mock_hash.assert_not_called()
+
+        # The saved files and the index are not private to the user
+        for path in [path1, path2, dlindex.get_index(self.dst_dir).path]:
+            self.assertEqual(os.stat(path).st_mode & 0o777, writer.FILE_MODE)
+
+    def test_hidden_tmp_file(self):
+        """Test saving the index through a hidden temporary file"""
+        replace = os.replace
+        tmp_files = []
+
+        def mock_replace(src, dst):
+            tmp_files.append((os.path.basename(src), os.path.basename(dst)))
+            replace(src, dst)
+
+        with patch('os.replace', mock_replace):
+            self._save(b'a')
+        # Temporary files removed by writer.remove_tmp_files on startup
+        self.assertIn(dlindex.INDEX_FILE, [dst for _, dst in tmp_files])
+        for name, _ in tmp_files:
+            self.assertTrue(name.startswith(writer.TMP_PREFIX))
+            self.assertTrue(name.endswith(writer.TMP_SUFFIX))
+
+    def test_external_changes(self):
+        """Test the handling of files changed outside the index"""
+        # Pre-existing file that is not in the index yet
+        path = os.path.join(self.dst_dir, 'file.txt')
+        with open(path, 'wb') as fd:
+            fd.write(b'a')
+        self.assertEqual(self._save(b'a'), path)
+
+        # Modified file
+        with open(path, 'wb') as fd:
+            fd.write(b'modified')
+        self.assertEqual(self._save(b'a'),
+                         os.path.join(self.dst_dir, 'file-2.txt'))
+
+        # Removed files
+        os.remove(path)
+        os.remove(os.path.join(self.dst_dir, 'file-2.txt'))
+        self.assertEqual(self._save(b'a'), path)
+        self.assertEqual(self._save(b'modified'),
+                         os.path.join(self.dst_dir, 'file-3.txt'))
+
+        # Corrupt index
+        dlindex._indexes.clear()
+        with open(os.path.join(self.dst_dir, dlindex.INDEX_FILE), 'w') as fd:
+            fd.write('{')
+        self.assertEqual(self._save(b'a'), path)
+
+    def test_pending_writes(self):
+        """Test the detection of repeated downloads still being written"""
+        dl_writer = writer.DownloadWriter(fsync='none', background=True)
+        release = threading.Event()
+        atomic_write = writer.atomic_write
+
+        def slow_write(path, data, fsync):
+            release.wait()
+            atomic_write(path, data, fsync)
+
+        with patch('blocksatcli.api.writer.atomic_write', slow_write), \
+                patch('blocksatcli.api.msg.logger') as mock_logger:
+            api_msg = msg.ApiMsg(b'a', filename='file.txt')
+            path1 = api_msg.save(self.dst_dir, writer=dl_writer)
+            # The file is reported as saved only once written
+            mock_logger.info.assert_not_called()
+            self.assertEqual(api_msg.save(self.dst_dir, writer=dl_writer),
+                             path1)
+            # Different contents get a different name while pending
+            api_msg = msg.ApiMsg(b'b', filename='file.txt')
+            path2 = api_msg.save(self.dst_dir, writer=dl_writer)
+            self.assertNotEqual(path1, path2)
+            release.set()
+            dl_writer.close()
+            mock_logger.info.assert_any_call("Saved at {}.".format(path1))
+
+        self.assertEqual(sorted(os.listdir(self.dst_dir)),
+                         [dlindex.INDEX_FILE, 'file-2.txt', 'file.txt'])
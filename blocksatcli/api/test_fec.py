@@ -1,6 +1,8 @@
 import math
+import os
 import random
 import string
+import tempfile
 import unittest
 
 from . import fec, pkt
@@ -53,6 +55,37 @@ class TestFec(unittest.TestCase):
             decoded_data = fec_handler.decode(encoded_data)
             self.assertEqual(original_data, decoded_data)
 
+    def test_encoded_len(self):
+        """Test the computation of the FEC-encoded length without encoding"""
+        for overhead in [0, 0.1, 0.5, 2]:
+            fec_handler = fec.Fec(overhead)
+            for n_bytes in [1, fec.CHUNK_SIZE, 10000, 400000, 2**20]:
+                original_data = self._rnd_string(n_bytes)
+                encoded_data = fec_handler.encode(original_data)
+                self.assertEqual(fec_handler.calc_encoded_len(n_bytes),
+                                 len(encoded_data))
+
+    def test_encode_file(self):
+        """Test the file-based encoding of multiple message lengths"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = os.path.join(tmp_dir, 'src')
+            dst_path = os.path.join(tmp_dir, 'dst')
+            for n_bytes in [100, 2**10, 2**20]:
+                original_data = self._rnd_string(n_bytes)
+                with open(src_path, 'wb') as fd:
+                    fd.write(original_data)
+
+                fec_handler = fec.Fec()
+                encoded_len = fec_handler.encode_file(src_path, dst_path)
+                with open(dst_path, 'rb') as fd:
+                    encoded_data = fd.read()
+
+                self.assertEqual(encoded_len, len(encoded_data))
+                self.assertEqual(encoded_len,
+                                 fec_handler.calc_encoded_len(n_bytes))
+                self.assertEqual(fec_handler.decode(encoded_data),
+                                 original_data)
+
     def _drop_pkts(self, data, fraction):
         """Drop a fraction of the FEC packets"""
         n_pkts = len(data) // fec.PKT_SIZE
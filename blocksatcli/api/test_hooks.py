@@ -0,0 +1,251 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from . import hooks
+from .hooks import GossipLoader, HookExecutor
+
+
+def append_cmd(path, text):
+    """Command that appends a line of text to a file"""
+    return [
+        sys.executable, '-c',
+        'open({!r}, "a").write({!r} + "\\n")'.format(path, text)
+    ]
+
+
+def sleep_cmd(duration):
+    return [
+        sys.executable, '-c', 'import time; time.sleep({})'.format(duration)
+    ]
+
+
+class TestHookExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.tmp_dir, 'out')
+        self.spill_path = os.path.join(self.tmp_dir, 'spill.jsonl')
+        self.gate = threading.Event()
+
+    def tearDown(self):
+        self.gate.set()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def read_out(self):
+        with open(self.out_file) as fd:
+            return fd.read().split()
+
+    def block_worker(self, executor):
+        """Occupy the executor's single worker until the gate is set"""
+        started = threading.Event()
+
+        def callback():
+            started.set()
+            self.gate.wait()
+
+        executor.submit([], callback=callback)
+        started.wait()
+
+    def test_order_and_callback(self):
+        """Test that the jobs run in order and trigger their callbacks"""
+        executor = HookExecutor()
+        done = []
+        for i in range(5):
+            executor.submit([append_cmd(self.out_file, str(i))],
+                            callback=lambda i=i: done.append(i))
+        executor.close()
+        self.assertEqual(self.read_out(), [str(i) for i in range(5)])
+        self.assertEqual(done, list(range(5)))
+        self.assertEqual(executor.completed, 5)
+        self.assertEqual(executor.latency.count, 5)
+        self.assertEqual(executor.get_backlog(), 0)
+
+    def test_timeout_and_failure(self):
+        """Test the commands that time out or fail"""
+        # Leave enough time for the interpreter to start on a loaded machine
+        executor = HookExecutor(timeout=2)
+        executor.submit([sleep_cmd(30)])
+        executor.submit([[sys.executable, '-c', 'exit(1)']])
+        executor.submit([['/nonexistent-cmd']])
+        executor.close()
+        self.assertEqual(executor.timeouts, 1)
+        self.assertEqual(executor.failed, 3)
+        self.assertEqual(executor.completed, 0)
+
+    def test_concurrency(self):
+        """Test that a slow command does not hold the other workers"""
+        executor = HookExecutor(concurrency=2)
+        self.block_worker(executor)
+        done = threading.Event()
+        executor.submit([append_cmd(self.out_file, 'a')], callback=done.set)
+        self.assertTrue(done.wait(10))
+        self.gate.set()
+        executor.close()
+
+    def test_drop_oldest(self):
+        """Test the drop-oldest overflow policy"""
+        executor = HookExecutor(queue_size=2, overflow='drop-oldest')
+        self.block_worker(executor)
+        for i in range(4):
+            executor.submit([append_cmd(self.out_file, str(i))])
+        self.assertEqual(executor.dropped, 2)
+        self.assertEqual(executor.get_backlog(), 2)
+        self.gate.set()
+        executor.close()
+        self.assertEqual(self.read_out(), ['2', '3'])
+
+    def test_block(self):
+        """Test the block overflow policy"""
+        executor = HookExecutor(queue_size=1, overflow='block')
+        self.block_worker(executor)
+        executor.submit([append_cmd(self.out_file, '0')])
+        submitter = threading.Thread(target=executor.submit,
+                                     args=([append_cmd(self.out_file, '1')], ))
+        submitter.start()
+        submitter.join(0.2)
+        self.assertTrue(submitter.is_alive())  # waiting for room
+        self.gate.set()
+        submitter.join()
+        executor.close()
+        self.assertEqual(self.read_out(), ['0', '1'])
+
+    def test_spill(self):
+        """Test the spill overflow policy, including across restarts"""
+        executor = HookExecutor(queue_size=1,
+                                overflow='spill',
+                                spill_path=self.spill_path)
+        self.block_worker(executor)
+        for i in range(4):
+            executor.submit([append_cmd(self.out_file, str(i))])
+        self.assertEqual(executor.spilled, 3)
+        self.assertEqual(executor.get_backlog(), 4)
+
+        # Stop without running the jobs. The spilled jobs are kept on disk.
+        threading.Timer(0.1, self.gate.set).start()
+        executor.close(wait=False)
+        self.assertFalse(os.path.exists(self.out_file))
+
+        # A new executor resumes the spilled jobs in order. Stop it while the
+        # first job runs.
+        started = threading.Event()
+        run_cmd = hooks.run_cmd
+
+        def blocking_run_cmd(cmd, timeout):
+            res = run_cmd(cmd, timeout)
+            started.set()
+            self.gate.wait()
+            return res
+
+        self.gate.clear()
+        with mock.patch('blocksatcli.api.hooks.run_cmd', blocking_run_cmd), \
+                self.assertLogs('blocksatcli.api.hooks', level='INFO') as cm:
+            executor = HookExecutor(overflow='spill',
+                                    spill_path=self.spill_path)
+            started.wait()
+            threading.Timer(0.1, self.gate.set).start()
+            executor.close(wait=False)
+        self.assertEqual(self.read_out(), ['1'])
+        # The resumed commands are logged before running
+        self.assertTrue(
+            any("Running spilled hook command" in x for x in cm.output))
+
+        # The next executor does not run the first job again
+        executor = HookExecutor(overflow='spill', spill_path=self.spill_path)
+        executor.submit([append_cmd(self.out_file, '4')])
+        executor.close()
+        self.assertEqual(self.read_out(), ['1', '2', '3', '4'])
+        self.assertFalse(os.path.exists(self.spill_path))
+        self.assertFalse(
+            os.path.exists(self.spill_path + hooks.SPILL_OFFSET_SUFFIX))
+
+    def test_torn_spill_record(self):
+        """Test skipping a spilled job torn by a crash"""
+        with open(self.spill_path, 'w') as fd:
+            fd.write(
+                json.dumps({
+                    'tag': None,
+                    'cmds': [append_cmd(self.out_file, '0')]
+                }) + '\n')
+            fd.write('[["torn')
+
+        executor = HookExecutor(overflow='spill', spill_path=self.spill_path)
+        executor.submit([append_cmd(self.out_file, '1')])
+        executor.close()
+        self.assertEqual(self.read_out(), ['0', '1'])
+        self.assertFalse(os.path.exists(self.spill_path))
+
+        # The worker survives a spill file made of invalid records only
+        with open(self.spill_path, 'w') as fd:
+            fd.write('[["torn')
+        executor = HookExecutor(overflow='spill', spill_path=self.spill_path)
+        executor.submit([append_cmd(self.out_file, '2')])
+        executor.close()
+        self.assertEqual(self.read_out(), ['0', '1', '2'])
+
+    def test_spill_tag(self):
+        """Test discarding the jobs spilled under another --exec option"""
+        executor = HookExecutor(queue_size=1,
+                                overflow='spill',
+                                spill_path=self.spill_path,
+                                tag='old {}')
+        self.block_worker(executor)
+        for i in range(3):
+            executor.submit([append_cmd(self.out_file, str(i))])
+        threading.Timer(0.1, self.gate.set).start()
+        executor.close(wait=False)
+
+        # Resume under another --exec option
+        with self.assertLogs('blocksatcli.api.hooks', level='WARNING'):
+            executor = HookExecutor(overflow='spill',
+                                    spill_path=self.spill_path,
+                                    tag='new {}')
+            executor.submit([append_cmd(self.out_file, '3')])
+            executor.close()
+        self.assertEqual(self.read_out(), ['3'])
+        self.assertFalse(os.path.exists(self.spill_path))
+
+
+class TestGossipLoader(unittest.TestCase):
+
+    def test_coalescing(self):
+        """Test that only the newest of the waiting snapshots is loaded"""
+        gate = threading.Event()
+        started = threading.Event()
+        loaded = []
+
+        def run(cmd):
+            loaded.append(cmd[3])
+            started.set()
+            gate.wait()
+            return subprocess.CompletedProcess(cmd, 0)
+
+        results = {}
+        loader = GossipLoader('historian-cli', dest='127.0.0.1')
+        with mock.patch('subprocess.run', side_effect=run) as mock_run:
+            loader.submit('snap1', callback=lambda x: results.update(snap1=x))
+            started.wait()
+            # Snapshots received while snap1 loads
+            for name in ['snap2', 'snap3', 'snap4']:
+                loader.submit(
+                    name, callback=lambda x, n=name: results.update({n: x}))
+            gate.set()
+            loader.close()
+
+        self.assertEqual(loaded, ['snap1', 'snap4'])
+        mock_run.assert_called_with(
+            ['historian-cli', 'snapshot', 'load', 'snap4', '127.0.0.1'])
+        self.assertEqual(loader.loaded, 2)
+        self.assertEqual(loader.skipped, 2)
+        self.assertEqual(results, {
+            'snap1': True,
+            'snap2': False,
+            'snap3': False,
+            'snap4': True
+        })
@@ -0,0 +1,42 @@
+import json
+import os
+import tempfile
+import unittest
+
+from .latency import LatencyTracer
+
+
+class TestLatency(unittest.TestCase):
+
+    def test_tracer(self):
+        """Test the recording of message spans"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_file = os.path.join(tmp_dir, 'trace.jsonl')
+            tracer = LatencyTracer(trace_file)
+            spans = []
+            for i in range(100):
+                span = {
+                    'seq_num': i,
+                    'chan_num': 1,
+                    'first_pkt': 1000.0,
+                    'last_pkt': 1000.0 + 0.002,
+                    'decodable': 1000.0 + 0.003,
+                    'decrypted': 1000.0 + 0.02 + 0.001 * i
+                }
+                tracer.record(span)
+                spans.append(span)
+            tracer.close()
+
+            with open(trace_file) as fd:
+                self.assertEqual([json.loads(x) for x in fd], spans)
+
+        hists = tracer.get_histograms()
+        self.assertEqual(hists['decodable'].count, 100)
+        self.assertEqual(hists['saved'].count, 0)
+        self.assertIsNone(hists['saved'].quantile(0.5))
+        self.assertEqual(hists['last_pkt'].quantile(0.99), 0.0025)
+        self.assertAlmostEqual(hists['decrypted'].sum, 2 + 0.001 * 4950)
+        # Decryption latency from 20 to 119 ms
+        self.assertEqual(hists['decrypted'].quantile(0.05), 0.025)
+        self.assertEqual(hists['decrypted'].quantile(0.5), 0.1)
+        self.assertEqual(hists['decrypted'].quantile(0.99), 0.25)
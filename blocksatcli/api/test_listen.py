@@ -1,18 +1,24 @@
+import json
 import os
 import queue
 import random
 import string
+import subprocess
+import time
 from sys import platform
 from threading import Thread
 from unittest import TestCase, mock, skipIf
 
 from ..test_helpers import TestEnv
-from . import msg
+from . import latency, msg
+from .capture import read_capture, replay_capture
 from .gpg import Gpg
 from .listen import ApiListener
 from .net import UdpSock
 from .order import ApiChannel
 from .pkt import BlocksatPktHandler
+from .plugins import PluginPool
+from .writer import DownloadWriter
 
 gpgpassphrase = "test"
 test_env = TestEnv()
@@ -86,7 +92,11 @@ class TestApiListener(TestCase):
                       no_save=False,
                       exec_cmd=None,
                       gossip_opts=None,
-                      check_download=True):
+                      check_download=True,
+                      capture=None,
+                      trace=None,
+                      plugins=None,
+                      writer=None):
         """Send an API message through the loopback interface and receive it
 
         Receive the message through the API listener loop.
@@ -110,7 +120,11 @@ class TestApiListener(TestCase):
         kwargs = {
             'no_save': no_save,
             'exec_cmd': exec_cmd,
-            'gossip_opts': gossip_opts
+            'gossip_opts': gossip_opts,
+            'capture': capture,
+            'trace': trace,
+            'plugins': plugins,
+            'writer': writer
         }
 
         # Run the listener loop on a thread
@@ -148,6 +162,8 @@ class TestApiListener(TestCase):
             else:
                 self.assertTrue(os.path.exists(download_path))
 
+        return tx_data
+
     def test_raw_plaintext_msg(self):
         self.loopback_test(plaintext=True, raw=True)
 
@@ -164,6 +180,29 @@ class TestApiListener(TestCase):
         """Test listener loop configured not to save downloaded messages"""
         self.loopback_test(no_save=True)
 
+    def test_capture_replay(self):
+        """Test replaying the packets captured by the listener loop"""
+        capture_path = os.path.join(test_env.cfg_dir, "capture.bin")
+        tx_data = self.loopback_test(no_save=True, capture=capture_path)
+
+        # All packets should be captured
+        records = list(read_capture(capture_path))
+        self.assertGreater(len(records), 0)
+
+        # Process the captured packets again through the listener pipeline
+        rx_queue = queue.Queue()
+        ApiListener(recv_queue=rx_queue).run(
+            self.gpg,
+            self.download_dir,
+            None,
+            None,
+            self.channel,
+            plaintext=True,
+            save_raw=False,
+            no_save=True,
+            pkt_source=replay_capture(capture_path))
+        self.assertEqual(rx_queue.get_nowait(), tx_data)
+
     def test_exec_cmd(self):
         """Test execution of an mv command on the downloaded file"""
         dest = os.path.join(self.download_dir, "moved_file")
@@ -173,7 +212,97 @@ class TestApiListener(TestCase):
         self.loopback_test(exec_cmd=cmd, check_download=False)
         self.assertTrue(os.path.exists(dest))
 
-    @mock.patch('subprocess.run')
+    def test_latency_trace(self):
+        """Test the latency span of a received message"""
+        trace_file = os.path.join(test_env.cfg_dir, "trace.jsonl")
+        dest = os.path.join(self.download_dir, "traced_file")
+        t_start = time.time()
+        self.loopback_test(exec_cmd='mv {{}} {}'.format(dest),
+                           check_download=False,
+                           trace=trace_file)
+
+        with open(trace_file) as fd:
+            span = json.loads(fd.readline())
+        self.assertEqual(span['chan_num'], self.channel)
+        stages = ['first_pkt'] + latency.SPAN_STAGES
+        timestamps = [span[x] for x in stages]
+        self.assertGreaterEqual(timestamps[0], t_start)
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(
+            self.listen_loop.tracer.get_histograms()['hook_done'].count, 1)
+
+        # The message should be accounted in the listener metrics
+        metrics = self.listen_loop.metrics
+        self.assertEqual(metrics.decoded_msgs, 1)
+        self.assertEqual(metrics.hooks.get_backlog(), 0)
+        self.assertEqual(metrics.pkt_handler.pending_bytes, 0)
+        self.assertGreater(metrics.rx_pkts[self.channel], 0)
+
+    def test_plugin(self):
+        """Test feeding the decoded message to an in-process plugin"""
+        consumed = []
+
+        def plugin(data, meta):
+            consumed.append((bytes(data), data.readonly, meta))
+
+        pool = PluginPool([plugin])
+        filename = 'plugin_' + rnd_string(8).decode()
+        tx_data = self.loopback_test(filename=filename, plugins=pool)
+        pool.close()
+
+        self.assertEqual(len(consumed), 1)
+        data, readonly, meta = consumed[0]
+        self.assertEqual(data, tx_data)
+        self.assertTrue(readonly)
+        self.assertEqual(meta['chan_num'], self.channel)
+        self.assertEqual(meta['seq_num'], 1)
+        self.assertIsNone(meta['signer'])
+        self.assertEqual(meta['filename'], filename)
+        self.assertEqual(meta['path'], os.path.join(self.download_dir,
+                                                    filename))
+
+    def test_background_writer_plugins(self):
+        """Test feeding the plugins without waiting for background writes"""
+        consumed = []
+
+        def plugin(data, meta):
+            consumed.append((bytes(data), meta['path']))
+
+        # The plugins receive the data in memory without waiting for the
+        # file to be written
+        pool = PluginPool([plugin])
+        writer = DownloadWriter(fsync='batch', background=True)
+        with mock.patch.object(writer, 'wait', wraps=writer.wait) as \
+                mock_wait, \
+                mock.patch.object(writer, 'flush') as mock_flush:
+            tx_data = self.loopback_test(plugins=pool, writer=writer)
+            pool.close()
+            mock_wait.assert_not_called()
+            mock_flush.assert_not_called()
+        writer.close()
+        self.assertEqual(len(consumed), 1)
+        self.assertEqual(consumed[0][0], tx_data)
+        with open(consumed[0][1], 'rb') as fd:
+            self.assertEqual(fd.read(), tx_data)
+
+    def test_background_writer_hooks(self):
+        """Test waiting for the background writes before the hooks"""
+        # The hooks open the file, so they wait for it to be written
+        dest = os.path.join(self.download_dir, "moved_file")
+        writer = DownloadWriter(fsync='batch', background=True)
+        with mock.patch.object(writer, 'wait', wraps=writer.wait) as \
+                mock_wait, \
+                mock.patch.object(writer, 'flush') as mock_flush:
+            self.loopback_test(exec_cmd='mv {{}} {}'.format(dest),
+                               check_download=False,
+                               writer=writer)
+            mock_wait.assert_called_once()
+            mock_flush.assert_not_called()
+        writer.close()
+        self.assertTrue(os.path.exists(dest))
+
+    @mock.patch('subprocess.run',
+                side_effect=lambda cmd: subprocess.CompletedProcess(cmd, 0))
     def test_gossip(self, mock_subproc_run):
         """Test Lightning gossip reception"""
         filename = 'snapshot1.gsp'
@@ -185,7 +314,8 @@ class TestApiListener(TestCase):
         ]
         mock_subproc_run.assert_called_with(expected_cmd)
 
-    @mock.patch('subprocess.run')
+    @mock.patch('subprocess.run',
+                side_effect=lambda cmd: subprocess.CompletedProcess(cmd, 0))
     def test_gossip_with_dest(self, mock_subproc_run):
         """Test Lightning gossip reception with a specified destination"""
         filename = 'snapshot2.gsp'
@@ -0,0 +1,63 @@
+import unittest
+
+import requests
+
+from .metrics import CONTENT_TYPE, ListenerMetrics
+from .pkt import BlocksatPkt, BlocksatPktHandler
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self):
+        """Test the metrics in Prometheus text format"""
+        metrics = ListenerMetrics()
+        handler = BlocksatPktHandler()
+        metrics.pkt_handler = handler
+
+        # Out-of-order and repeated fragments of an incomplete message
+        for frag_num in [2, 0, 2]:
+            handler.append(BlocksatPkt(1, frag_num, 1, True, bytes(100)))
+        for _ in range(3):
+            metrics.count_pkt(1, 108)
+        metrics.count_pkt(4, 50)
+        metrics.drops['not_for_us'] = 2
+        metrics.save_latency.observe(0.003)
+
+        text = metrics.render()
+        expected = [
+            'blocksat_api_rx_packets_total{channel="1"} 3',
+            'blocksat_api_rx_packets_total{channel="4"} 1',
+            'blocksat_api_rx_bytes_total{channel="1"} 324',
+            'blocksat_api_duplicate_fragments_total 1',
+            'blocksat_api_out_of_order_fragments_total 1',
+            'blocksat_api_partial_messages 1',
+            'blocksat_api_reassembly_bytes 200',
+            'blocksat_api_dropped_messages_total{reason="not_for_us"} 2',
+            'blocksat_api_save_seconds_bucket{le="0.0025"} 0',
+            'blocksat_api_save_seconds_bucket{le="0.005"} 1',
+            'blocksat_api_save_seconds_bucket{le="+Inf"} 1',
+            'blocksat_api_save_seconds_count 1',
+            '# TYPE blocksat_api_save_seconds histogram'
+        ]
+        lines = text.splitlines()
+        for line in expected:
+            self.assertIn(line, lines)
+
+        # The reassembly bytes are released when the message is removed
+        handler.remove(1)
+        self.assertIn('blocksat_api_reassembly_bytes 0',
+                      metrics.render().splitlines())
+
+    def test_server(self):
+        """Test the metrics HTTP server"""
+        metrics = ListenerMetrics()
+        port = metrics.start_server(0, addr='127.0.0.1')
+        try:
+            metrics.count_pkt(1, 100)
+            r = requests.get('http://127.0.0.1:{}/metrics'.format(port))
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.headers['Content-Type'], CONTENT_TYPE)
+            self.assertIn('blocksat_api_rx_packets_total{channel="1"} 1',
+                          r.text)
+        finally:
+            metrics.stop_server()
@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+import unittest
+
+import requests
+
+from ..currency import CurrencyManager
+from .mockserver import MockApiServer
+from .order import ApiOrder, iter_sse_events
+
+
+class TestMockServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockApiServer(tx_rate=100)
+        self.url = self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _subscribe(self, events):
+        """Collect the events of the user channel on a background thread"""
+        r = requests.get(self.url + '/subscribe/transmissions', stream=True)
+
+        def run():
+            for event in iter_sse_events(r, 'transmissions'):
+                events.append(json.loads(event))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def test_order_lifecycle(self):
+        """Test the order states from creation to reception"""
+        events = []
+        self._subscribe(events)
+        data = b'test' * 100
+        order = ApiOrder(self.url)
+        res = order.send(data, 10000, verbose=False)
+        self.assertIn('lightning_invoice', res)
+
+        # The order is paid automatically and then transmitted
+        self.assertTrue(order.wait_state('sent', timeout=10))
+        order.get(order.uuid, order.auth_token)
+        seq_num = order.order['tx_seq_num']
+        self.assertEqual(order.order['message_size'], len(data))
+        self.assertEqual(ApiOrder(self.url, seq_num=seq_num).get_data(), data)
+        sent_orders = order.get_orders(['sent'], queue='sent')
+        self.assertEqual([x['uuid'] for x in sent_orders], [order.uuid])
+
+        # The order becomes received once all regions confirm reception
+        for region in order.order['regions']:
+            r = requests.post(self.url + '/order/rx/{}'.format(seq_num),
+                              data={'region': region})
+            self.assertTrue(r.ok)
+        order.get(order.uuid, order.auth_token)
+        self.assertEqual(order.order['status'], 'received')
+
+        time.sleep(0.1)
+        self.assertEqual([x['status'] for x in events],
+                         ['paid', 'transmitting', 'sent', 'received'])
+        self.assertTrue(all([x['uuid'] == order.uuid for x in events]))
+
+    def test_queue_behavior(self):
+        """Test the transmission order and the queue limits"""
+        self.server.pay_delay = -1  # leave orders unpaid
+        self.server.max_queued = 2
+        orders = []
+        for _ in range(2):
+            order = ApiOrder(self.url, capture_error=True)
+            order.send(b'test', 1000, verbose=False)
+            orders.append(order)
+        self.assertEqual(
+            len(orders[0].get_orders(['pending'], queue='pending')), 2)
+
+        # The queue is full
+        with self.assertRaises(SystemExit) as cm:
+            ApiOrder(self.url, capture_error=True).send(b'test',
+                                                        1000,
+                                                        verbose=False)
+        self.assertEqual(cm.exception.code['errors'][0]['code'], 503)
+
+        # The authentication token is required to cancel an order
+        orders[0].auth_token = 'invalid'
+        with self.assertRaises(SystemExit) as cm:
+            orders[0].delete()
+        self.assertEqual(cm.exception.code['errors'][0]['code'], 401)
+        orders[1].delete()
+        orders[1].get(orders[1].uuid, orders[1].auth_token)
+        self.assertEqual(orders[1].order['status'], 'cancelled')
+
+    def test_currency_rate(self):
+        """Test the exchange rate endpoint"""
+        currency_manager = CurrencyManager(self.url)
+        self.assertEqual(currency_manager.usd_to_msat(1),
+                         self.server.msat_per_usd)
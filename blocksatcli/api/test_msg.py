@@ -460,13 +460,16 @@ class TestApi(TestEnv):
                              fec=True,
                              sender=signer)
         self.assertEqual(rx_msg2.data['original'], data)
+        self.assertEqual(rx_msg2.signer, signer)
 
         # Clearsigned message
         tx_msg = msg.generate(data, gpg=gpg, sign=True, sign_key=signer)
         rx_msg1 = msg.decode(tx_msg.get_data())
         self.assertNotEqual(rx_msg1.data['original'], data)
+        self.assertIsNone(rx_msg1.signer)
         rx_msg2 = msg.decode(tx_msg.get_data(), gpg=gpg, sender=signer)
         self.assertEqual(rx_msg2.data['original'], data)
+        self.assertEqual(rx_msg2.signer, signer)
 
         # Clearsigned + encapsulated message
         tx_msg = msg.generate(data,
@@ -484,3 +487,138 @@ class TestApi(TestEnv):
                              gpg=gpg,
                              sender=signer)
         self.assertEqual(rx_msg3.data['original'], data)
+
+    def test_length_estimate(self):
+        """Test the analytical estimate of the API message length"""
+        gpg = self._setup_gpg()
+        fec_overhead = 0.2
+        options = [
+            {},  # plaintext
+            {
+                'encapsulate': True
+            },
+            {
+                'sign': True
+            },
+            {
+                'plaintext': False
+            },
+            {
+                'plaintext': False,
+                'sign': True,
+                'encapsulate': True
+            },
+        ]
+        if fec.fec_supported:
+            options.append({
+                'plaintext': False,
+                'encapsulate': True,
+                'fec': True,
+                'fec_overhead': fec_overhead
+            })
+
+        for n_bytes in [1, 1000, 100000]:
+            for opts in options:
+                if opts.get('sign') and opts.get('plaintext', True):
+                    # Clearsigning applies to text lines
+                    lines = [
+                        ''.join(
+                            random.choice(string.ascii_letters)
+                            for _ in range(80))
+                        for _ in range(math.ceil(n_bytes / 81))
+                    ]
+                    data = '\n'.join(lines)[:n_bytes].encode()
+                else:
+                    # Incompressible data (GPG compresses before encrypting)
+                    data = os.urandom(n_bytes)
+
+                tx_msg = msg.generate(data, gpg=gpg, **opts)
+                estimate = msg.estimate_length(len(data), gpg=gpg, **opts)
+
+                # The estimate should be a tight upper bound for the actual
+                # message length. GPG compresses the zero-padded encapsulation
+                # header, and, with FEC, the slack can add one FEC packet.
+                actual = tx_msg.get_length()
+                tolerance = max(0.01 * actual, 100)
+                if opts.get('encapsulate') and not opts.get('plaintext', True):
+                    tolerance += msg.MSG_HEADER_LEN
+                if opts.get('fec'):
+                    tolerance += fec.PKT_SIZE
+                self.assertGreaterEqual(estimate, actual, opts)
+                self.assertLessEqual(estimate - actual, tolerance, opts)
+
+        # GPG object is required if signing or encrypting
+        with self.assertRaises(ValueError):
+            msg.estimate_length(10, plaintext=False)
+        with self.assertRaises(ValueError):
+            msg.estimate_length(10, sign=True)
+
+    def test_file_msg_generator(self):
+        """Test the streaming generation of API messages from files"""
+        gpg = self._setup_gpg()
+        options = [
+            {},  # plaintext
+            {
+                'encapsulate': True
+            },
+            {
+                'sign': True
+            },
+            {
+                'plaintext': False,
+                'sign': True,
+                'encapsulate': True
+            },
+        ]
+        if fec.fec_supported:
+            options.append({
+                'plaintext': False,
+                'encapsulate': True,
+                'fec': True
+            })
+
+        src_path = os.path.join(self.cfg_dir, 'test_file.txt')
+        data = '\n'.join(['Hello World'] * 1000).encode()
+        with open(src_path, 'wb') as fd:
+            fd.write(data)
+
+        for opts in options:
+            dst_dir = os.path.join(self.cfg_dir, 'tx')
+            msg_path = msg.generate_file(src_path, dst_dir, gpg=gpg, **opts)
+            with open(msg_path, 'rb') as fd:
+                tx_data = fd.read()
+
+            # The streaming generator should produce the same message as the
+            # in-memory generator. Signatures and encryption are not
+            # deterministic, so compare the bytes only when neither is used.
+            # The encrypted messages should still have the same length, but
+            # the signed messages are only checked by decoding them.
+            if not opts.get('sign'):
+                tx_msg = msg.generate(data,
+                                      filename='test_file.txt',
+                                      gpg=gpg,
+                                      **opts)
+                if opts.get('plaintext', True):
+                    self.assertEqual(tx_data, tx_msg.get_data(), msg=opts)
+                else:
+                    self.assertEqual(len(tx_data),
+                                     tx_msg.get_length(),
+                                     msg=opts)
+
+            # And the message should be decodable
+            rx_msg = msg.decode(tx_data,
+                                plaintext=opts.get('plaintext', True),
+                                decapsulate=opts.get('encapsulate', False),
+                                fec=opts.get('fec', False),
+                                gpg=gpg)
+            if opts.get('encapsulate'):
+                self.assertEqual(rx_msg.filename, 'test_file.txt')
+            if opts.get('sign') and opts.get('plaintext', True):
+                # Clearsigned plaintext
+                self.assertIn(data, rx_msg.data['original'])
+            else:
+                self.assertEqual(rx_msg.data['original'], data)
+
+        # GPG object is required if signing or encrypting
+        with self.assertRaises(ValueError):
+            msg.generate_file(src_path, self.cfg_dir, plaintext=False)
@@ -1,5 +1,9 @@
+import os
+import socket
+import time
 import unittest
 from sys import platform
+from unittest.mock import Mock
 
 from . import net
 
@@ -37,3 +41,135 @@ class TestApi(unittest.TestCase):
         # Check
         self.assertEqual(data, rx_payload)
         self.assertEqual(rx_addr[1], port)
+
+    @unittest.skipIf(platform != 'linux', "Linux-only test")
+    def test_send_many(self):
+        """Test transmission of multiple packets with and without GSO"""
+        addr = "239.0.0.3:4445"
+        ifname = "lo"
+        data = [os.urandom(1472) for _ in range(49)] + [os.urandom(100)]
+
+        tx_sock = net.UdpSock(addr, ifname, mcast_rx=False)
+        tx_sock.set_mcast_tx_opts()
+        rx_sock = net.UdpSock(addr, ifname)
+        rx_sock.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2**20)
+        rx_sock.sock.settimeout(1)
+
+        for gso in [False, True]:
+            if gso and not tx_sock.enable_gso():
+                continue
+            tx_sock.send_many(data)
+            rx_data = [rx_sock.recv()[0] for _ in range(len(data))]
+            self.assertEqual(rx_data, data)
+
+    def test_gso_segmentation(self):
+        """Test the grouping of packets into GSO transmissions"""
+        sock = net.UdpSock("239.0.0.3:4445", None, mcast_rx=False)
+        sock.gso = True
+        sock.send = Mock()
+        sock._send_segments = Mock()
+
+        # Equal-length packets are grouped up to the maximum number of
+        # segments, and a shorter packet can only end a group
+        data = [bytes(1000)] * (net.UDP_MAX_SEGMENTS + 10) + [bytes(10)] + \
+            [bytes(1000)] * 3 + [bytes(2000)]
+        sock.send_many(data)
+        groups = [len(c.args[0]) for c in sock._send_segments.call_args_list]
+        self.assertEqual(groups, [net.UDP_MAX_SEGMENTS, 11, 3])
+        sock.send.assert_called_once_with(bytes(2000))
+
+        # Fall back to individual transmissions if GSO fails
+        sock.send.reset_mock()
+        sock._send_segments.side_effect = OSError("GSO failure")
+        sock.send_many(data)
+        self.assertFalse(sock.gso)
+        self.assertEqual(sock.send.call_count, len(data))
+
+    @unittest.skipIf(platform != 'linux', "Linux-only test")
+    def test_chan_filter(self):
+        """Test the filtering of Blocksat packets by channel"""
+        addr = "239.0.0.4:4446"
+        ifname = "lo"
+        tx_sock = net.UdpSock(addr, ifname, mcast_rx=False)
+        tx_sock.set_mcast_tx_opts()
+        rx_sock = net.UdpSock(addr, ifname)
+        rx_sock.sock.settimeout(0.5)
+        self.assertTrue(rx_sock.set_chan_filter(5))
+
+        # Only the API packets from channel 5 should pass through the filter
+        data = [
+            b'\x01\x05' + bytes(10),  # API packet, last fragment
+            b'\x01\x04' + bytes(10),  # other channel
+            b'\x00\x05' + bytes(10),  # not an API packet
+            b'\x81\x05' + bytes(10),  # API packet, more fragments
+            b'\x01'  # truncated header
+        ]
+        for pkt in data:
+            tx_sock.send(pkt)
+
+        rx_data = []
+        try:
+            while True:
+                rx_data.append(rx_sock.recv()[0])
+        except socket.timeout:
+            pass
+        self.assertEqual(rx_data, [data[0], data[3]])
+
+    @unittest.skipIf(platform != 'linux', "Linux-only test")
+    def test_rcvbuf_drops(self):
+        """Test the receive buffer sizing and the kernel drop count"""
+        addr = "239.0.0.5:4447"
+        ifname = "lo"
+        tx_sock = net.UdpSock(addr, ifname, mcast_rx=False)
+        tx_sock.set_mcast_tx_opts()
+        rx_sock = net.UdpSock(addr, ifname)
+        rx_sock.sock.settimeout(0.5)
+
+        # The buffer is never reduced
+        rcvbuf = rx_sock.set_rcvbuf(2**16)
+        self.assertGreaterEqual(rcvbuf, 2**16)
+        self.assertEqual(rx_sock.set_rcvbuf(1), rcvbuf)
+
+        # Overflow a minimal buffer
+        rx_sock.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1)
+        rx_sock.enable_drop_count()
+        self.assertTrue(rx_sock.rxq_ovfl)
+        n_pkts = 20
+        for _ in range(n_pkts):
+            tx_sock.send(os.urandom(1400))
+        n_rx = 0
+        try:
+            while True:
+                rx_sock.recv()
+                n_rx += 1
+        except socket.timeout:
+            pass
+
+        # The next reception reports the drops
+        tx_sock.send(os.urandom(1400))
+        rx_sock.recv()
+        self.assertEqual(rx_sock.get_drops(), n_pkts - n_rx)
+
+    @unittest.skipIf(platform != 'linux', "Linux-only test")
+    def test_rx_timestamps(self):
+        """Test the kernel reception timestamps"""
+        addr = "239.0.0.6:4448"
+        ifname = "lo"
+        tx_sock = net.UdpSock(addr, ifname, mcast_rx=False)
+        tx_sock.set_mcast_tx_opts()
+        rx_sock = net.UdpSock(addr, ifname)
+        rx_sock.sock.settimeout(1)
+        self.assertTrue(rx_sock.enable_timestamps())
+
+        # The kernel may enable the timestamping lazily, in which case the
+        # first datagrams are stamped on recv(). Wait until that settles.
+        tx_sock.send(bytes(10))
+        rx_sock.recv()
+        time.sleep(0.1)
+
+        t_tx = time.time()
+        tx_sock.send(bytes(10))
+        time.sleep(0.1)
+        rx_sock.recv()
+        # The timestamp refers to the arrival, not to the recv() call
+        self.assertAlmostEqual(rx_sock.rx_time, t_tx, delta=0.05)
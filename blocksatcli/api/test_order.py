@@ -1,8 +1,15 @@
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+from email.parser import BytesParser
 from http import HTTPStatus
 from unittest.mock import Mock, patch
 from uuid import uuid4
 
+from ..cache import Cache
 from . import order, pkt
 
 
@@ -14,7 +21,21 @@ def mock_get_api_resp(bid_msat, message_size, status='pending'):
                     'bid_per_byte': 0,
                     'message_size': message_size,
                     'status': status
-                })
+                },
+                iter_lines=lambda: iter([]))
+
+
+def mock_sse_resp(events, channel='transmissions', delay=0.1):
+    """Mock streaming response from the SSE server"""
+
+    def iter_lines():
+        for event in events:
+            time.sleep(delay)
+            yield ('event:' + channel).encode()
+            yield ('data:' + json.dumps(event)).encode()
+            yield b''
+
+    return Mock(status_code=HTTPStatus.OK, iter_lines=iter_lines)
 
 
 def mock_post_api_resp(bid_msat):
@@ -73,6 +94,118 @@ class TestOrder(unittest.TestCase):
         self.assertEqual(self.order.order['message_size'], len(data))
         self.assertEqual(self.order.order['status'], 'pending')
 
+    def test_wait_sse(self):
+        """Test waiting for a transmission state based on SSE events"""
+        self.order.uuid = str(uuid4())
+        self.order.auth_token = str(uuid4())
+        other_uuid = str(uuid4())
+        sse_events = [
+            {
+                'uuid': other_uuid,
+                'status': 'sent'
+            },  # another order
+            {
+                'uuid': self.order.uuid,
+                'status': 'transmitting'
+            },
+            {
+                'uuid': self.order.uuid,
+                'status': 'sent'
+            }
+        ]
+
+        def mock_get(url, **kwargs):
+            if '/subscribe/' in url:
+                return mock_sse_resp(sse_events)
+            return mock_get_api_resp(1000, 10, status='paid')
+
+        session = Mock()
+        session.get.side_effect = mock_get
+        self.order.session = session
+
+        # The order is polled only every SSE_POLL_INTERVAL seconds while the
+        # subscription is active. However, the final state should be detected
+        # through the events before that.
+        s_time = time.time()
+        self.assertTrue(self.order.wait_state('sent', timeout=5))
+        self.assertLess(time.time() - s_time, order.SSE_POLL_INTERVAL)
+        self.assertEqual(self.order.order['status'], 'sent')
+        order_fetches = [
+            c for c in session.get.call_args_list
+            if '/subscribe/' not in c.args[0]
+        ]
+        self.assertEqual(len(order_fetches), 1)
+
+        # Without the subscription, the state should be detected by polling
+        session.get.reset_mock()
+        self.assertTrue(self.order.wait_state('paid', timeout=1, sse=False))
+        for c in session.get.call_args_list:
+            self.assertNotIn('/subscribe/', c.args[0])
+
+    def test_event_stream_stop(self):
+        """Test interrupting the event subscription on stop"""
+        interrupted = threading.Event()
+        received = threading.Event()
+
+        def iter_lines():
+            yield b'event:transmissions'
+            yield ('data:' + json.dumps({'uuid': 'abc'})).encode()
+            yield b''
+            # Block until the connection is shut down
+            interrupted.wait()
+
+        resp = Mock(status_code=HTTPStatus.OK, iter_lines=iter_lines)
+        resp.raw.shutdown.side_effect = interrupted.set
+        session = Mock()
+        session.get.return_value = resp
+
+        event_stream = order.OrderEventStream("mock-server",
+                                              order.ApiChannel.USER.value,
+                                              lambda x: received.set(),
+                                              session=session)
+        event_stream.start()
+        self.assertTrue(received.wait(5))
+        event_stream.stop()
+        self.assertFalse(event_stream.is_alive())
+        resp.raw.shutdown.assert_called_once()
+        resp.close.assert_called_once()
+
+    @patch('blocksatcli.api.order.requests.post')
+    def test_streaming_transmission(self, mock_post):
+        """Test API order transmission with data streamed from a file"""
+        data = os.urandom(3 * order.UPLOAD_CHUNK_SIZE + 10)
+        bid = pkt.calc_ota_msg_len(len(data)) * 50
+        mock_post.return_value = mock_post_api_resp(bid)
+
+        with tempfile.TemporaryFile() as fd:
+            fd.write(data)
+            fd.seek(0)
+            res = self.order.send(fd, bid, regions=[0, 1])
+
+            # The request body should be a stream rather than the whole data
+            kwargs = mock_post.call_args.kwargs
+            body = kwargs['data']
+            self.assertIsInstance(body, order.MultipartFileStream)
+            self.assertNotIn('files', kwargs)
+
+            # Consume the stream and parse it as a multipart form
+            raw_body = b''.join(body)
+            self.assertEqual(len(raw_body), len(body))
+            parts = BytesParser().parsebytes(
+                b'Content-Type: ' +
+                kwargs['headers']['Content-Type'].encode() + b'\r\n\r\n' +
+                raw_body).get_payload()
+
+        form = {
+            p.get_param('name', header='content-disposition'): p
+            for p in parts
+        }
+        self.assertEqual(form['bid'].get_payload(), str(bid))
+        self.assertEqual(form['regions'].get_payload(), '[0, 1]')
+        self.assertEqual(form['file'].get_filename(), 'file')
+        self.assertEqual(form['file'].get_payload(decode=True), data)
+        self.assertEqual(res['uuid'], self.order.uuid)
+
     @patch('blocksatcli.api.order.requests.get')
     @patch('blocksatcli.api.order.requests.post')
     def test_wait(self, mock_post, mock_get):
@@ -152,3 +285,132 @@ class TestOrder(unittest.TestCase):
                                                   len(data),
                                                   status='cancelled')
         self.assertTrue(self.order.wait_state("cancelled", timeout=1))
+
+    def test_batch_tx_log(self):
+        """Test recording multiple orders over a shared session"""
+        data = "Hello".encode()
+        bid = pkt.calc_ota_msg_len(len(data)) * 50
+        session = Mock()
+        session.post.return_value = mock_post_api_resp(bid)
+
+        orders = []
+        for _ in range(3):
+            api_order = order.ApiOrder("mock-server", session=session)
+            api_order.send(data, bid, verbose=False)
+            orders.append(api_order)
+        self.assertEqual(session.post.call_count, 3)
+
+        # Orders without UUID and authentication token are not recorded
+        orders.append(order.ApiOrder("mock-server"))
+
+        with tempfile.TemporaryDirectory() as cfg_dir:
+            self.assertEqual(order.record_tx_logs(cfg_dir, orders), 3)
+            cache = Cache(os.path.join(cfg_dir, "api"), filename="tx_log.json")
+            for api_order in orders[:3]:
+                self.assertEqual(
+                    cache.get(api_order.uuid), {
+                        'auth_token': api_order.auth_token,
+                        'invoices': [api_order.ln_invoice]
+                    })
+
+    def test_conditional_get_orders(self):
+        """Test conditional requests for the order lists"""
+        orders = [{'uuid': str(uuid4()), 'status': 'transmitting'}]
+        session = Mock()
+        session.get.return_value = Mock(status_code=HTTPStatus.OK,
+                                        headers={'ETag': '"v1"'},
+                                        json=lambda: orders)
+        api_order = order.ApiOrder("mock-server", session=session)
+
+        # The first request is unconditional
+        res = api_order.get_orders(['transmitting'], conditional=True)
+        self.assertEqual(res, orders)
+        self.assertNotIn('If-None-Match',
+                         session.get.call_args.kwargs['headers'])
+
+        # The following requests carry the validator, and the previous result
+        # is reused when the list is not modified
+        session.get.return_value = Mock(status_code=HTTPStatus.NOT_MODIFIED)
+        res = api_order.get_orders(['transmitting'], conditional=True)
+        self.assertEqual(res, orders)
+        self.assertEqual(
+            session.get.call_args.kwargs['headers']['If-None-Match'], '"v1"')
+
+        # Non-conditional requests do not carry the validator
+        session.get.return_value = Mock(status_code=HTTPStatus.OK,
+                                        headers={},
+                                        json=lambda: [])
+        self.assertEqual(api_order.get_orders(['transmitting']), [])
+        self.assertNotIn('If-None-Match',
+                         session.get.call_args.kwargs['headers'])
+
+    def test_order_tracker(self):
+        """Test tracking of multiple orders with a batched poll"""
+        uuids = [str(uuid4()) for _ in range(3)]
+        tokens = [str(uuid4()) for _ in range(3)]
+        queues = {
+            'pending': [{
+                'uuid': uuids[0],
+                'status': 'pending'
+            }],
+            'queued': [
+                {
+                    'uuid': uuids[1],
+                    'status': 'transmitting'
+                },
+                {
+                    'uuid': str(uuid4()),  # untracked order
+                    'status': 'paid'
+                }
+            ],
+            'sent': []
+        }
+
+        def mock_get(url, **kwargs):
+            queue = url.split('/')[-1]
+            if queue in queues:
+                return Mock(status_code=HTTPStatus.OK,
+                            json=lambda: queues[queue])
+            # Individual fetch of the order missing from the queues
+            self.assertEqual(kwargs['headers']['X-Auth-Token'], tokens[2])
+            return mock_get_api_resp(1000, 10, status='expired')
+
+        session = Mock()
+        session.get.side_effect = mock_get
+        changes = []
+        tracker = order.OrderTracker(
+            "mock-server",
+            callback=lambda uuid, info: changes.append((uuid, info['status'])),
+            sse=False,
+            session=session)
+        for uuid, token in zip(uuids, tokens):
+            tracker.add(uuid, token)
+
+        # The first poll lists all queues and fetches the order missing from
+        # the listings individually
+        tracker.poll()
+        self.assertEqual(session.get.call_count, 4)
+        self.assertCountEqual(changes, [(uuids[0], 'pending'),
+                                        (uuids[1], 'transmitting'),
+                                        (uuids[2], 'expired')])
+
+        # The next poll lists only the queues where the orders can be found,
+        # and the callbacks run only on state changes
+        changes.clear()
+        session.get.reset_mock()
+        queues['pending'] = []
+        queues['queued'] = [{'uuid': uuids[0], 'status': 'paid'}]
+        queues['sent'] = [{'uuid': uuids[1], 'status': 'sent'}]
+        tracker.poll()
+        listed = sorted(c.args[0].split('/')[-1]
+                        for c in session.get.call_args_list)
+        self.assertEqual(listed, ['pending', 'queued', 'sent'])
+        self.assertCountEqual(changes, [(uuids[0], 'paid'),
+                                        (uuids[1], 'sent')])
+        self.assertEqual(tracker.get_state(uuids[2]), 'expired')
+
+        # SSE events update the tracked orders directly
+        tracker._handle_event({'uuid': uuids[0], 'status': 'sent'})
+        self.assertTrue(
+            tracker.wait(['sent', 'cancelled', 'expired'], timeout=1))
+        self.assertFalse(tracker.wait(['sent'], timeout=0.1))
@@ -0,0 +1,96 @@
+import random
+import unittest
+
+from .pacer import Pacer
+
+
+class FakeClock:
+    """Clock advanced by the sleep calls, with optional oversleeping"""
+
+    def __init__(self, max_oversleep=0):
+        self.now = 100.0
+        self.max_oversleep = max_oversleep
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, interval):
+        self.now += interval + random.uniform(0, self.max_oversleep)
+
+
+class TestPacer(unittest.TestCase):
+
+    def _run(self, pacer, clock, pkt_len, n_pkts):
+        departures = []
+        for _ in range(n_pkts):
+            pacer.pace(pkt_len)
+            departures.append(clock())
+        return departures
+
+    def test_target_rate(self):
+        """Test pacing at the exact target rate with an ideal clock"""
+        clock = FakeClock()
+        kbps = 1000
+        pkt_len = 1000
+        pacer = Pacer(kbps, clock=clock, sleep=clock.sleep)
+        departures = self._run(pacer, clock, pkt_len, n_pkts=100)
+
+        # One packet every 8 ms
+        for i, t in enumerate(departures):
+            self.assertAlmostEqual(t - departures[0], i * 8e-3)
+
+        stats = pacer.get_stats()
+        self.assertEqual(stats['target_kbps'], kbps)
+        self.assertAlmostEqual(stats['achieved_kbps'], kbps)
+        self.assertAlmostEqual(stats['jitter_ms'], 0)
+        self.assertAlmostEqual(stats['max_jitter_ms'], 0)
+
+    def test_oversleep_compensation(self):
+        """Test that the average rate holds when sleep overshoots"""
+        clock = FakeClock(max_oversleep=2e-3)
+        kbps = 1000
+        pkt_len = 1000
+        n_pkts = 1000
+        pacer = Pacer(kbps, burst=4 * pkt_len, clock=clock, sleep=clock.sleep)
+        departures = self._run(pacer, clock, pkt_len, n_pkts)
+
+        # The oversleeping is compensated by the accumulated tokens, so the
+        # total duration stays close to the nominal duration
+        nominal = (n_pkts - 1) * 8e-3
+        self.assertLess(departures[-1] - departures[0], nominal + 2e-3)
+        self.assertAlmostEqual(pacer.get_stats()['achieved_kbps'],
+                               kbps,
+                               delta=0.01 * kbps)
+
+        # But the jitter is reported
+        self.assertGreater(pacer.get_stats()['jitter_ms'], 0)
+
+    def test_burst_allowance(self):
+        """Test that a burst never exceeds the burst allowance"""
+        clock = FakeClock()
+        pkt_len = 1000
+        burst = 5 * pkt_len
+        pacer = Pacer(1000, burst=burst, clock=clock, sleep=clock.sleep)
+
+        # The first transmissions go back-to-back until the bucket empties
+        departures = self._run(pacer, clock, pkt_len, n_pkts=10)
+        self.assertEqual(len(set(departures[:5])), 1)
+        self.assertGreater(departures[5], departures[4])
+
+        # After an idle period, the bucket refills up to the burst allowance
+        clock.now += 10
+        departures = self._run(pacer, clock, pkt_len, n_pkts=10)
+        self.assertEqual(len(set(departures[:5])), 1)
+        self.assertGreater(departures[5], departures[4])
+
+    def test_no_pacing(self):
+        """Test the statistics without a target rate"""
+        clock = FakeClock()
+        pacer = Pacer(0, clock=clock, sleep=clock.sleep)
+        for _ in range(10):
+            pacer.pace(1000)
+            clock.now += 1e-3
+        stats = pacer.get_stats()
+        self.assertIsNone(stats['target_kbps'])
+        self.assertIsNone(stats['jitter_ms'])
+        self.assertAlmostEqual(stats['achieved_kbps'], 8000)
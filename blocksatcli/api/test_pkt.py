@@ -220,6 +220,30 @@ class TestOrder(unittest.TestCase):
         assert (seq_num not in handler.frag_map)
         assert (handler.frag_map == {})
 
+    def test_rx_times(self):
+        """Test tracking of the first and last fragment reception times"""
+        handler = pkt.BlocksatPktHandler()
+        seq_num = 1
+        tx_handler = pkt.BlocksatPktHandler()
+        tx_handler.split(self._rnd_string(n_bytes=5000), seq_num, 1)
+        frags = tx_handler.get_frags(seq_num)
+
+        # Out-of-order reception with the given reception timestamps
+        rx_times = [1000.0 + i for i in range(len(frags))]
+        for i in reversed(range(len(frags))):
+            rx_pkt = pkt.BlocksatPkt()
+            rx_pkt.unpack(frags[i].pack(), rx_time=rx_times[i])
+            handler.append(rx_pkt)
+        self.assertEqual(handler.get_rx_times(seq_num),
+                         (rx_times[-1], rx_times[0]))
+
+        # Without reception timestamps, use the processing time
+        t_start = time.time()
+        handler.split(self._rnd_string(n_bytes=10), seq_num + 1, 1)
+        t_first, t_last = handler.get_rx_times(seq_num + 1)
+        self.assertGreaterEqual(t_first, t_start)
+        self.assertEqual(t_first, t_last)
+
     def test_chan_number_backwards_compatibility(self):
         """Unpack the new header format using the previous unpacking format"""
         chan_num = ApiChannel.USER.value
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import time
+import unittest
+
+from .pktcache import PktCache
+
+
+class TestPktCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _gen_pkts(self, n_pkts, pkt_len=100):
+        return tuple(os.urandom(pkt_len) for _ in range(n_pkts))
+
+    def test_get_put(self):
+        """Test saving and reading packets from the cache"""
+        cache = PktCache(self.path, max_size=2**20)
+        pkts = self._gen_pkts(10) + (os.urandom(7), )
+        self.assertIsNone(cache.get(1))
+
+        cache.put(1, 1007, pkts)
+        self.assertEqual(cache.get(1), pkts)
+        self.assertEqual(cache.get(1, msg_len=1007), pkts)
+
+        # A cached message with an unexpected length is considered stale
+        self.assertIsNone(cache.get(1, msg_len=1000))
+        self.assertIsNone(cache.get(1))
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['entries'], 0)
+        self.assertEqual(stats['size'], 0)
+
+    def test_lru_eviction(self):
+        """Test the eviction of the least recently used messages"""
+        pkts = self._gen_pkts(10)
+        entry_size = 4 + 10 * (2 + 100)
+        cache = PktCache(self.path, max_size=3 * entry_size)
+        for seq_num in range(3):
+            cache.put(seq_num, 1000, pkts)
+
+        # Access the oldest message, so that message 1 becomes the LRU
+        self.assertIsNotNone(cache.get(0))
+        cache.put(3, 1000, pkts)
+        self.assertIsNone(cache.get(1))
+        for seq_num in [0, 2, 3]:
+            self.assertEqual(cache.get(seq_num), pkts)
+        self.assertEqual(cache.get_stats()['size'], 3 * entry_size)
+        self.assertEqual(len(os.listdir(self.path)), 3)
+
+        # A message larger than the capacity is not cached
+        cache.put(4, 4000, self._gen_pkts(40))
+        self.assertIsNone(cache.get(4))
+        self.assertEqual(cache.get_stats()['entries'], 3)
+
+    def test_persistence(self):
+        """Test loading the cache saved on a previous session"""
+        pkts = self._gen_pkts(10)
+        entry_size = 4 + 10 * (2 + 100)
+        cache = PktCache(self.path, max_size=3 * entry_size)
+        for seq_num in range(3):
+            cache.put(seq_num, 1000, pkts)
+            time.sleep(0.01)  # distinct modification times
+
+        # Restart with a smaller capacity. The oldest message is evicted.
+        cache = PktCache(self.path, max_size=2 * entry_size)
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.get(1), pkts)
+        self.assertEqual(cache.get(2), pkts)
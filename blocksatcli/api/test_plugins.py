@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+from importlib.metadata import EntryPoint
+from unittest import mock
+
+from . import plugins
+from .plugins import PluginPool, load_entry_point_plugins, load_plugin
+
+
+class Consumer():
+
+    @staticmethod
+    def on_msg(data, meta):
+        pass
+
+
+class TestPlugins(unittest.TestCase):
+
+    def test_load_plugin(self):
+        """Test loading plugins given as module:callable"""
+        self.assertIs(load_plugin(__name__ + ':Consumer.on_msg'),
+                      Consumer.on_msg)
+        self.assertIs(load_plugin('os.path:join'), __import__('os').path.join)
+        for spec in [
+                'no_callable', 'os.path:', ':join', 'os.path:nonexistent',
+                'nonexistent_module:f', 'os:sep'
+        ]:
+            with self.assertRaises(ValueError):
+                load_plugin(spec)
+
+    def test_entry_points(self):
+        """Test loading the plugins installed via entry points"""
+        eps = [
+            EntryPoint('consumer', __name__ + ':Consumer.on_msg',
+                       plugins.ENTRY_POINT_GROUP),
+            EntryPoint('broken', 'nonexistent_module:f',
+                       plugins.ENTRY_POINT_GROUP)
+        ]
+        with mock.patch.object(plugins, 'entry_points', return_value=eps):
+            res = load_entry_point_plugins()
+        self.assertEqual(res, {'consumer': Consumer.on_msg})
+
+    def test_pool(self):
+        """Test the delivery of messages to the plugins"""
+        consumed = []
+
+        def plugin(data, meta):
+            self.assertIsInstance(data, memoryview)
+            consumed.append((bytes(data), meta['seq_num']))
+
+        def failing_plugin(data, meta):
+            raise RuntimeError("plugin failure")
+
+        pool = PluginPool([failing_plugin, plugin])
+        for i in range(5):
+            pool.submit(bytes([i]) * 10, {'seq_num': i})
+        pool.close()
+
+        # A failing plugin does not prevent the others from running
+        self.assertEqual(consumed, [(bytes([i]) * 10, i) for i in range(5)])
+        self.assertEqual(pool.delivered, 5)
+        self.assertEqual(pool.errors, 5)
+
+    def test_backpressure(self):
+        """Test that submit blocks while the queue is full"""
+        gate = threading.Event()
+        pool = PluginPool([lambda data, meta: gate.wait()], queue_size=1)
+        pool.submit(b'0', {})  # taken by the worker, which blocks
+        while (pool.get_backlog() > 0):
+            time.sleep(0.01)
+        pool.submit(b'1', {})  # fills the queue
+
+        submitter = threading.Thread(target=pool.submit, args=(b'2', {}))
+        submitter.start()
+        submitter.join(0.2)
+        self.assertTrue(submitter.is_alive())
+        self.assertEqual(pool.stalls, 1)
+
+        gate.set()
+        submitter.join()
+        pool.close()
+        self.assertEqual(pool.delivered, 3)
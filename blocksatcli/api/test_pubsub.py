@@ -0,0 +1,120 @@
+import os
+import queue
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from threading import Thread
+
+from .pubsub import MsgPublisher, subscribe
+
+
+class TestPubSub(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'api.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def wait_subscribers(self, publisher, n_subs):
+        for _ in range(100):
+            if (publisher.get_n_subscribers() == n_subs):
+                return
+            time.sleep(0.01)
+        self.fail("Subscribers not ready")
+
+    def start_subscriber(self, channels=None):
+        """Collect the messages received by a subscriber on a queue"""
+        rx_queue = queue.Queue()
+
+        def run():
+            for meta, data in subscribe(self.path, channels):
+                rx_queue.put((meta, data))
+            rx_queue.put(None)  # publisher closed
+
+        Thread(target=run, daemon=True).start()
+        return rx_queue
+
+    def test_channels(self):
+        """Test the delivery of messages per subscribed channel"""
+        publisher = MsgPublisher(self.path)
+        all_queue = self.start_subscriber()
+        gossip_queue = self.start_subscriber([4])
+        self.wait_subscribers(publisher, 2)
+
+        msgs = [({
+            'chan_num': 1,
+            'seq_num': 1
+        }, b'user msg'), ({
+            'chan_num': 4,
+            'seq_num': 2
+        }, b'gossip msg'), ({
+            'chan_num': 5,
+            'seq_num': 3
+        }, b'btc src msg')]
+        for meta, data in msgs:
+            publisher.publish(memoryview(data), meta)
+        publisher.close()
+        self.assertFalse(os.path.exists(self.path))
+
+        self.assertEqual(list(iter(all_queue.get, None)), msgs)
+        self.assertEqual(list(iter(gossip_queue.get, None)), [msgs[1]])
+
+    def test_slow_subscriber(self):
+        """Test disconnecting a subscriber whose buffer fills up"""
+        publisher = MsgPublisher(self.path, max_buffer=2**16)
+        fast_queue = self.start_subscriber()
+
+        # Subscriber that never reads
+        slow_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        slow_sock.connect(self.path)
+        slow_sock.sendall(b'{"channels": []}\n')
+        self.wait_subscribers(publisher, 2)
+
+        data = bytes(2**14)
+        n_msgs = 0
+        while (publisher.disconnects == 0 and n_msgs < 1000):
+            publisher.publish(data, {'chan_num': 1})
+            n_msgs += 1
+            self.assertIsNotNone(fast_queue.get(timeout=5))
+        self.assertEqual(publisher.disconnects, 1)
+        self.wait_subscribers(publisher, 1)
+
+        # The fast subscriber continues to receive the messages
+        publisher.publish(data, {'chan_num': 1})
+        self.assertEqual(fast_queue.get(timeout=5), ({'chan_num': 1}, data))
+        publisher.close()
+        slow_sock.close()
+
+    def test_invalid_request(self):
+        """Test disconnecting a subscriber with an invalid request"""
+        publisher = MsgPublisher(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        sock.sendall(b'{"channels": "all"}\n')
+        sock.settimeout(5)
+        self.assertEqual(sock.recv(10), b'')  # closed by the publisher
+        sock.close()
+        publisher.close()
+
+    def test_existing_path(self):
+        """Test the handling of an existing file at the socket path"""
+        # Stale socket left by a previous session
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        sock.close()
+        publisher = MsgPublisher(self.path)
+
+        # Socket in use by another publisher
+        with self.assertRaises(FileExistsError):
+            MsgPublisher(self.path)
+        publisher.close()
+
+        # Regular file
+        open(self.path, 'w').close()
+        with self.assertRaises(FileExistsError):
+            MsgPublisher(self.path)
+        self.assertTrue(os.path.isfile(self.path))
@@ -0,0 +1,90 @@
+import socket
+import unittest
+from sys import platform
+from threading import Thread
+
+from . import net
+from .pkt import BlocksatPkt
+from .relay import ApiRelay, open_dest_sock
+
+
+def recv_all(sock):
+    """Receive the datagrams waiting on a socket"""
+    pkts = []
+    sock.settimeout(0.5)
+    while True:
+        try:
+            pkts.append(sock.recv(net.MAX_READ))
+        except socket.timeout:
+            return pkts
+
+
+@unittest.skipIf(platform != 'linux', "Linux-only test")
+class TestApiRelay(unittest.TestCase):
+
+    def setUp(self):
+        self.in_addr = "239.0.0.7:4449"
+        self.tx_sock = net.UdpSock(self.in_addr, "lo", mcast_rx=False)
+        self.tx_sock.set_mcast_tx_opts()
+
+        # Destination sockets
+        self.dest_socks = []
+        for _ in range(2):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', 0))
+            self.dest_socks.append(sock)
+
+    def tearDown(self):
+        for sock in self.dest_socks:
+            sock.close()
+
+    def run_relay(self, pkts, **kwargs):
+        """Relay the given packets from two redundant inputs"""
+        in_socks = [net.UdpSock(self.in_addr, "lo") for _ in range(2)]
+        out_socks = [
+            open_dest_sock('127.0.0.1:{}'.format(x.getsockname()[1]))
+            for x in self.dest_socks
+        ]
+        relay = ApiRelay(in_socks, out_socks, **kwargs)
+        t = Thread(target=relay.run, daemon=True)
+        t.start()
+
+        for pkt in pkts:
+            self.tx_sock.send(pkt)
+
+        rx_pkts = [recv_all(x) for x in self.dest_socks]
+        relay.stop()
+        t.join()
+        return relay, rx_pkts
+
+    def test_relay(self):
+        """Test relaying to multiple destinations with dedupe"""
+        pkts = [
+            BlocksatPkt(1, i, 1, i < 4,
+                        bytes([i]) * 100).pack() for i in range(5)
+        ]
+        relay, rx_pkts = self.run_relay(pkts + [pkts[0]] + [b'\x00invalid'])
+
+        # Each packet is received over both inputs, but relayed only once
+        for dest_pkts in rx_pkts:
+            self.assertEqual(dest_pkts, pkts)
+        self.assertEqual(relay.rx_pkts, 14)
+        self.assertEqual(relay.dups, 7)
+        self.assertEqual(relay.invalid, 2)
+        for stats in relay.dest_stats:
+            self.assertEqual(stats.pkts, 5)
+            self.assertEqual(stats.bytes, sum(len(x) for x in pkts))
+            self.assertEqual(stats.errors, 0)
+
+    def test_channel_and_no_dedupe(self):
+        """Test relaying a single channel without dedupe"""
+        pkts = [
+            BlocksatPkt(1, 0, chan, False, bytes(100)).pack()
+            for chan in [1, 4, 1]
+        ]
+        relay, rx_pkts = self.run_relay(pkts, channel=4, dedupe=False)
+
+        # The channel-4 packet is relayed once per input
+        for dest_pkts in rx_pkts:
+            self.assertEqual(dest_pkts, [pkts[1]] * 2)
+        self.assertEqual(relay.dups, 0)
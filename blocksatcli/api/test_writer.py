@@ -0,0 +1,104 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from . import writer
+
+
+class TestWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dst_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_atomic_write(self):
+        """Test atomic writes"""
+        path = os.path.join(self.dst_dir, 'file')
+        for fsync in [True, False]:
+            writer.atomic_write(path, b'data' + bytes([fsync]), fsync=fsync)
+            with open(path, 'rb') as fd:
+                self.assertEqual(fd.read(), b'data' + bytes([fsync]))
+            self.assertEqual(os.listdir(self.dst_dir), ['file'])
+
+        # The file gets the same mode as if created via open()
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o666 & ~umask)
+
+        # The temporary file is removed on failure
+        with patch('os.replace', side_effect=OSError("failure")):
+            with self.assertRaises(OSError):
+                writer.atomic_write(path, b'new data')
+        self.assertEqual(os.listdir(self.dst_dir), ['file'])
+
+        # Leftovers from interrupted writes are cleaned up
+        leftover = os.path.join(self.dst_dir,
+                                writer.TMP_PREFIX + 'abc' + writer.TMP_SUFFIX)
+        open(leftover, 'w').close()
+        writer.remove_tmp_files(self.dst_dir)
+        self.assertEqual(os.listdir(self.dst_dir), ['file'])
+
+    @patch('blocksatcli.api.writer._sync_fs')
+    def test_batch_sync(self, mock_sync_fs):
+        """Test the batched syncing of the written files"""
+        dl_writer = writer.DownloadWriter(fsync='batch', batch_interval=60)
+
+        # The first write is synced right away, and the following writes
+        # within the batch interval are synced together
+        for i in range(10):
+            dl_writer.write(os.path.join(self.dst_dir, str(i)), b'data')
+        dl_writer.close()
+        self.assertLessEqual(mock_sync_fs.call_count, 2)
+        mock_sync_fs.assert_called_with(self.dst_dir)
+
+    @patch('blocksatcli.api.writer._sync_fs')
+    def test_wait(self, mock_sync_fs):
+        """Test waiting for the background writes without syncing them"""
+        dl_writer = writer.DownloadWriter(fsync='batch',
+                                          batch_interval=60,
+                                          background=True)
+        for i in range(50):
+            path = os.path.join(self.dst_dir, str(i))
+            dl_writer.write(path, b'data')
+            dl_writer.wait()
+            self.assertTrue(os.path.exists(path))
+        # Only the batched syncs run
+        self.assertLessEqual(mock_sync_fs.call_count, 2)
+        dl_writer.close()
+
+    def test_background_writer(self):
+        """Test writing on a background thread"""
+        dl_writer = writer.DownloadWriter(fsync='none', background=True)
+        results = {}
+        release = threading.Event()
+        atomic_write = writer.atomic_write
+
+        def slow_write(path, data, fsync):
+            release.wait()
+            atomic_write(path, data, fsync)
+
+        with patch('blocksatcli.api.writer.atomic_write', slow_write):
+            for i in range(5):
+                path = os.path.join(self.dst_dir, str(i))
+                dl_writer.write(path,
+                                b'data',
+                                callback=lambda e, i=i: results.update({i: e}))
+            # The writes do not block the caller
+            self.assertEqual(os.listdir(self.dst_dir), [])
+            release.set()
+            dl_writer.flush()
+
+        self.assertEqual(results, {i: None for i in range(5)})
+        self.assertEqual(len(os.listdir(self.dst_dir)), 5)
+
+        # Failures are reported through the callback
+        dl_writer.write(os.path.join(self.dst_dir, 'missing', 'file'),
+                        b'data',
+                        callback=lambda e: results.update({'missing': e}))
+        dl_writer.close()
+        self.assertIsInstance(results['missing'], OSError)
@@ -0,0 +1,252 @@
+"""Atomic writer of the API downloads"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import queue
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+FSYNC_POLICIES = ['file', 'batch', 'none']
+DEFAULT_BATCH_INTERVAL = 0.1  # seconds between batched syncs
+TMP_PREFIX = '.blocksat-'
+TMP_SUFFIX = '.tmp'
+
+
+def _get_file_mode():
+    """Get the mode of the files created via open() under the current umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# NOTE: mkstemp creates the files with mode 0600, so the files are set with
+# the mode open() would give them instead. The umask is read once, given that
+# reading it requires changing it temporarily.
+FILE_MODE = _get_file_mode()
+
+
+def _fsync_dir(dir_path):
+    """Sync a directory so that the file renames within it are durable"""
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _load_syncfs():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc.syncfs
+    except (OSError, AttributeError):
+        return None
+
+
+_syncfs = _load_syncfs()
+
+
+def _sync_fs(dir_path):
+    """Sync the whole file system containing a directory
+
+    Uses a single syncfs system call (Linux only). Otherwise, falls back to a
+    system-wide sync.
+
+    """
+    if (_syncfs is None):
+        os.sync()
+        return
+
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        if (_syncfs(fd) != 0):
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data, fsync=True):
+    """Write a file atomically
+
+    Writes the data on a temporary file in the same directory and then renames
+    it to the destination path, so that readers never see a partially written
+    file, not even after a crash.
+
+    Args:
+        path  : Destination path.
+        data  : Data to write (bytes).
+        fsync : Whether to sync the file and its directory to disk before
+                returning.
+
+    """
+    dst_dir = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=dst_dir,
+                                    prefix=TMP_PREFIX,
+                                    suffix=TMP_SUFFIX)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.fchmod(f.fileno(), FILE_MODE)
+            f.write(data)
+            if (fsync):
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if (fsync):
+        _fsync_dir(dst_dir)
+
+
+def remove_tmp_files(dst_dir):
+    """Remove the temporary files left by interrupted writes"""
+    for filename in os.listdir(dst_dir):
+        if (filename.startswith(TMP_PREFIX) and filename.endswith(TMP_SUFFIX)):
+            logger.debug("Removing stale temporary file {}".format(filename))
+            try:
+                os.remove(os.path.join(dst_dir, filename))
+            except OSError:
+                pass
+
+
+class DownloadWriter():
+    """Writer of the API downloads
+
+    Writes each file atomically (see atomic_write) with a configurable sync
+    policy:
+
+    - "file": sync each file and its directory before the write completes.
+    - "batch": complete the writes without syncing and sync the file systems
+      holding the written files at most every batch_interval seconds, so that
+      high message rates do not pay one sync per file. A crash can lose the
+      files written within the last interval, but never leaves partial files.
+    - "none": leave the syncing to the operating system.
+
+    Optionally, the writes run on a background thread, in which case write()
+    returns immediately, wait() waits for the pending writes, and flush()
+    also syncs them.
+
+    Args:
+        fsync          : Sync policy ("file", "batch", or "none").
+        batch_interval : Interval in seconds between batched syncs.
+        background     : Whether to write the files on a background thread.
+
+    """
+
+    def __init__(self,
+                 fsync='file',
+                 batch_interval=DEFAULT_BATCH_INTERVAL,
+                 background=False):
+        assert (fsync in FSYNC_POLICIES), \
+            "Unknown fsync policy {}".format(fsync)
+        self.fsync = fsync
+        self.batch_interval = batch_interval
+        self.background = background
+        self._lock = threading.Lock()
+        self._unsynced_dirs = set()
+        self._sync_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._sync_thread = None
+        self._write_thread = None
+        self._queue = None
+
+        if (fsync == 'batch'):
+            self._sync_thread = threading.Thread(target=self._sync_loop,
+                                                 daemon=True)
+            self._sync_thread.start()
+
+        if (background):
+            self._queue = queue.Queue()
+            self._write_thread = threading.Thread(target=self._write_loop,
+                                                  daemon=True)
+            self._write_thread.start()
+
+    def _write(self, path, data, callback):
+        try:
+            atomic_write(path, data, fsync=(self.fsync == 'file'))
+        except OSError as e:
+            logger.error("Failed to save {}: {}".format(path, e))
+            if (callback is not None):
+                callback(e)
+            if (not self.background):
+                raise
+            return
+
+        if (self.fsync == 'batch'):
+            with self._lock:
+                self._unsynced_dirs.add(os.path.dirname(path) or '.')
+            self._sync_event.set()
+
+        if (callback is not None):
+            callback(None)
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if (item is None):
+                    break
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def _sync(self):
+        with self._lock:
+            dirs = self._unsynced_dirs
+            self._unsynced_dirs = set()
+        for dir_path in dirs:
+            try:
+                _sync_fs(dir_path)
+            except OSError as e:
+                logger.warning("Failed to sync {}: {}".format(dir_path, e))
+
+    def _sync_loop(self):
+        while not self._stop_event.is_set():
+            self._sync_event.wait()
+            self._sync_event.clear()
+            self._sync()
+            # Accumulate the writes of the next interval
+            self._stop_event.wait(self.batch_interval)
+
+    def write(self, path, data, callback=None):
+        """Write a file
+
+        Args:
+            path     : Destination path.
+            data     : Data to write (bytes).
+            callback : Optional callable to run once the write completes. It
+                       receives None on success or the OSError on failure.
+
+        """
+        if (self.background):
+            self._queue.put((path, data, callback))
+        else:
+            self._write(path, data, callback)
+
+    def wait(self):
+        """Wait for the pending writes, without syncing them"""
+        if (self.background):
+            self._queue.join()
+
+    def flush(self):
+        """Wait for the pending writes and sync them, if batching syncs"""
+        self.wait()
+        if (self.fsync == 'batch'):
+            self._sync()
+
+    def close(self):
+        """Complete the pending writes and stop the writer threads"""
+        self.flush()
+        if (self._write_thread is not None):
+            self._queue.put(None)
+            self._write_thread.join()
+        if (self._sync_thread is not None):
+            self._stop_event.set()
+            self._sync_event.set()
+            self._sync_thread.join()
@@ -7,7 +7,7 @@ from blocksatcli.api import msg as api_msg
 from blocksatcli.api import pkt
 from blocksatcli.api.api import get_server_addr
 from blocksatcli.api.gpg import Gpg
-from blocksatcli.api.order import ApiOrder
+from blocksatcli.api.order import ApiOrder, OrderTracker
 from blocksatcli.cache import Cache
 
 from ..components import threadlogger, worker
@@ -25,6 +25,7 @@ class SatApi(QObject):
     sig_gpg_pubkeys = Signal(list)
     sig_gpg_privkeys = Signal(list)
     sig_stop_wait_tx_payment = Signal()
+    sig_order_state = Signal(str, dict)
 
     def __init__(self, config_manager: ConfigManager):
         super().__init__()
@@ -44,9 +45,11 @@ class SatApi(QObject):
         self.tx_logs_cache = Cache(api_dir, "tx_log.json")
         self.rx_info = None
         self._api_thread = QThreadPool()
+        self._order_tracker = None
 
     def set_server(self, server):
         self.server = server
+        self.stop_order_tracker()
 
     def set_rx_config(self, rx_config):
         """Set the loaded receiver configuration file"""
@@ -70,6 +73,7 @@ class SatApi(QObject):
         """Set the bitcoin network"""
         self.bitcoin_net = bitcoin_net
         self.save_cache('api.bitcoin_net', bitcoin_net)
+        self.stop_order_tracker()
 
     def _parse_args(self, cmd):
         args = parser.parse_args(cmd)
@@ -173,31 +177,31 @@ class SatApi(QObject):
                      fec=False,
                      gpg=None,
                      recipient=None,
-                     trust=False,
                      sign_key=None,
                      fec_overhead=0.1,
                      **kwargs):
-        """Calculate the number of bytes used for satellite transmission"""
+        """Calculate the number of bytes used for satellite transmission
+
+        The message length is estimated analytically (see
+        api_msg.estimate_length), so neither the file is read nor the message
+        is encrypted or FEC-encoded.
+
+        """
         if is_file:
-            basename = data
-            with open(data, 'rb') as f:
-                data = f.read()
+            data_len = os.path.getsize(data)
         else:
-            data = data.encode()
-            basename = None
-
-        message = api_msg.generate(data,
-                                   filename=basename,
-                                   plaintext=plaintext,
-                                   encapsulate=(not send_raw),
-                                   sign=sign,
-                                   fec=fec,
-                                   gpg=gpg,
-                                   recipient=recipient,
-                                   trust=trust,
-                                   sign_key=sign_key,
-                                   fec_overhead=fec_overhead)
-        return self.calc_ota_msg_len(message.get_length())
+            data_len = len(data.encode())
+
+        msg_len = api_msg.estimate_length(data_len,
+                                          plaintext=plaintext,
+                                          encapsulate=(not send_raw),
+                                          sign=sign,
+                                          fec=fec,
+                                          gpg=gpg,
+                                          recipient=recipient,
+                                          sign_key=sign_key,
+                                          fec_overhead=fec_overhead)
+        return self.calc_ota_msg_len(msg_len)
 
     def calc_ota_msg_len(self, msg_len):
         """Calculate the number of bytes used for satellite transmission"""
@@ -301,6 +305,9 @@ class SatApi(QObject):
         the transmission is in the 'paid' or posterior state, it is assumed
         that the payment has been received.
 
+        The order state is followed through the events broadcast by the
+        server, with polling as fallback (see ApiOrder.wait_state).
+
         """
         target_state = ['paid']
         server = get_server_addr(self.bitcoin_net, self.server)
@@ -312,6 +319,34 @@ class SatApi(QObject):
                         args=(target_state, ),
                         callback=callback)
 
+    def track_orders(self, orders):
+        """Follow the state of the given orders in the background
+
+        All orders are followed by a single order tracker, which emits the
+        sig_order_state signal whenever the state of an order changes.
+
+        Args:
+            orders (list): List of order dictionaries.
+
+        """
+        if self._order_tracker is None:
+            server = get_server_addr(self.bitcoin_net, self.server)
+            self._order_tracker = OrderTracker(
+                server, callback=self.sig_order_state.emit)
+            self._order_tracker.start()
+
+        for order in orders:
+            tx = self.tx_logs_cache.get(order['uuid'])
+            auth_token = tx.get('auth_token') if tx else None
+            self._order_tracker.add(order['uuid'], auth_token, order=order)
+
+    def stop_order_tracker(self):
+        """Stop following the state of the orders"""
+        if self._order_tracker is not None:
+            self._order_tracker.stop()
+            self._order_tracker = None
+
     def stop_threads(self):
         """Stop all threads"""
         self.stop_listener()
+        self.stop_order_tracker()
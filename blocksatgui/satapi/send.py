@@ -15,6 +15,7 @@ logger = logging.getLogger(__name__)
 class SendView(page.Page):
 
     sig_file_selected = qt.Signal(object)
+    sig_tx_opts_changed = qt.Signal()
 
     def __init__(self):
         super().__init__(name="satapi-send", topbar_enabled=False)
@@ -30,6 +31,7 @@ class SendView(page.Page):
 
         self.sig_file_selected.connect(
             lambda x: self._set_file_selected_style(bool(x)))
+        self._connect_tx_opts_changed()
 
     def _gen_default_page(self):
         self._message = qt.QLabel("")
@@ -46,10 +48,13 @@ class SendView(page.Page):
         self.message_or_file = self._add_message_or_file()
         self.send_options = self._add_send_options()
         self.send_bnt = buttons.MainButton("Send")
+        self.tx_size_estimate = qt.QLabel("")
+        self.tx_size_estimate.setProperty("qssClass", "text_italic__gray")
 
         viewer, layout = page.get_widget('send-tab')
         layout.addWidget(self.message_or_file, 1)
         layout.addWidget(self.send_options, 1)
+        layout.addWidget(self.tx_size_estimate, alignment=qt.Qt.AlignCenter)
         layout.addWidget(self.send_bnt, alignment=qt.Qt.AlignCenter)
         return viewer
 
@@ -130,6 +135,21 @@ class SendView(page.Page):
         layout.addWidget(self.advanced_options_box, 1)
         return viewer
 
+    def _connect_tx_opts_changed(self):
+        """Notify changes on any input that affects the transmission size"""
+        self.message.textChanged.connect(self.sig_tx_opts_changed.emit)
+        self.sig_file_selected.connect(
+            lambda _: self.sig_tx_opts_changed.emit())
+        for group in ['gpg', 'format']:
+            for opt in self.advanced_opts[group].values():
+                widget = opt.widget
+                if isinstance(widget, qt.QCheckBox):
+                    widget.toggled.connect(
+                        lambda _: self.sig_tx_opts_changed.emit())
+                elif isinstance(widget, qt.QComboBox):
+                    widget.currentIndexChanged.connect(
+                        lambda _: self.sig_tx_opts_changed.emit())
+
     def _select_file(self):
         dialog = qt.QFileDialog(parent=self, caption="Select a file")
         if qt.PYSIDE_VERSION == "pyside2" and distro.id() == "fedora":
@@ -211,6 +231,13 @@ class SendView(page.Page):
         self._message.setText(message)
         self._details.setText(details)
 
+    def set_tx_size_estimate(self, tx_len=None):
+        if tx_len is None:
+            self.tx_size_estimate.setText("")
+        else:
+            self.tx_size_estimate.setText(
+                f"Estimated transmission size: {tx_len} bytes")
+
     def clear_data(self):
         if self.get_file():
             self._remove_selected_file()
@@ -259,11 +286,19 @@ class Send(qt.QObject):
         self.view = SendView()
         self.sat_api = sat_api
 
+        # Debounce the estimation of the transmission size while the user
+        # types the message or changes the options
+        self._tx_size_timer = qt.QTimer(self.view)
+        self._tx_size_timer.setSingleShot(True)
+        self._tx_size_timer.setInterval(300)
+        self._tx_size_timer.timeout.connect(self.update_tx_size_estimate)
+
         self._add_connections()
         self._get_gpg_keylist()
 
     def _add_connections(self):
         self.view.send_bnt.clicked.connect(self.send_message)
+        self.view.sig_tx_opts_changed.connect(self._tx_size_timer.start)
         self.sat_api.sig_gpg_pubkeys.connect(self.view.set_recipients)
         self.sat_api.sig_gpg_privkeys.connect(self.view.set_sign_keys)
         self.sat_api.config_manager.sig_is_api_server_valid.connect(
@@ -285,6 +320,28 @@ class Send(qt.QObject):
             api_valid=self.sat_api.config_manager.api_valid)
         self.view.switch_page("default" if enable_default_page else "send")
 
+    def update_tx_size_estimate(self):
+        """Show the estimated transmission size for the current inputs"""
+        is_file = bool(self.view.get_file())
+        data = self.view.get_file() if is_file else self.view.get_message()
+        opts = self.view.get_advanced_opts()
+
+        if not data or (not opts['plaintext']
+                        and not self.sat_api.has_gpg_pubkey()):
+            self.view.set_tx_size_estimate(None)
+            return
+
+        try:
+            tx_len = self.sat_api.calc_tx_size(data,
+                                               is_file,
+                                               **opts,
+                                               gpg=self.sat_api.gpg)
+        except (AssertionError, OSError, ValueError) as e:
+            logger.debug(f"Could not estimate the transmission size: {e}")
+            tx_len = None
+
+        self.view.set_tx_size_estimate(tx_len)
+
     def send_message(self):
         is_file = bool(self.view.get_file())
         data = self.view.get_file() if is_file else self.view.get_message()
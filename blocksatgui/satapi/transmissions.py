@@ -9,6 +9,7 @@ from .api import SatApi
 
 logger = logging.getLogger(__name__)
 
+TX_STATUS_IDX = 2  # Status column
 TX_TABLE_IDX = 5  # Transmission ID column
 
 
@@ -144,6 +145,15 @@ class TransmissionsView(page.Page):
         self.table.reset_model()
         self._data_uuid = uuids
 
+    def update_table_status(self, uuid, status):
+        """Update the status of the transmission with the given ID"""
+        for i_row, row in enumerate(self.table._model._data):
+            if row[TX_TABLE_IDX] == uuid:
+                item = list(row)
+                item[TX_STATUS_IDX] = status.title()
+                self.table.update_item(item, i_row)
+                return
+
     def update_default_page(self, on_internet=False, api_valid=False):
         message, details = "", ""
         if on_internet:
@@ -181,6 +191,9 @@ class Transmissions(qt.QObject):
             lambda: self.view.table.clear())
         self.view.tx_options.currentTextChanged.connect(
             lambda x: self._update_transmissions(x.lower()))
+        self.sat_api.sig_order_state.connect(
+            lambda uuid, order: self.view.update_table_status(
+                uuid, order['status']))
 
     def _add_table_delegate(self):
         """Add a button to manage the transmission on the table"""
@@ -201,11 +214,13 @@ class Transmissions(qt.QObject):
                 return
 
             queue_list = []
+            own_orders = []
             self.sat_api.tx_logs_cache.load()
             for data in worker.result:
                 # Skip the transmission if it's not in the cache
                 if not self.sat_api.tx_logs_cache.get(data['uuid']):
                     continue
+                own_orders.append(data)
                 bid = data['bid'] + data['unpaid_bid']
                 ota_size = self.sat_api.calc_ota_msg_len(data['message_size'])
                 bid_per_byte = (data['bid_per_byte']
@@ -221,6 +236,9 @@ class Transmissions(qt.QObject):
             self.view.update_table_data(queue_list,
                                         force=self._selected_option != option)
 
+            # Follow the state of the user's orders until the next update
+            self.sat_api.track_orders(own_orders)
+
         status, queue = None, "queued"
         if option == "queued":
             queue = "queued"
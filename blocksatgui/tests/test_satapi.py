@@ -4,6 +4,8 @@ from unittest.mock import ANY, patch
 from pytest import mark
 
 from blocksatcli import defs
+from blocksatcli.api import pkt
+from blocksatcli.api.msg import MSG_HEADER_LEN
 from blocksatgui import qt
 from blocksatgui.satapi import opts
 from blocksatgui.satapi.api import SatApi
@@ -11,6 +13,8 @@ from blocksatgui.satapi.dialogs import BidDialog
 from blocksatgui.satapi.listen import Listen
 from blocksatgui.satapi.satapi import SatApiPage
 from blocksatgui.satapi.send import Send
+from blocksatgui.satapi.transmissions import (TX_STATUS_IDX, TX_TABLE_IDX,
+                                              Transmissions)
 from blocksatgui.tests.conftest import pytestqt
 
 
@@ -102,6 +106,31 @@ class TestSapApiSendPage:
                                                  callback=ANY,
                                                  **expected_opts)
 
+    def test_tx_size_estimate(self, qtbot, sat_api):
+        """Test the live estimate of the transmission size"""
+        send_page = Send(sat_api)
+        qtbot.addWidget(send_page.view)
+        label = send_page.view.tx_size_estimate
+        assert (label.text() == "")
+
+        plaintext = send_page.view.advanced_opts['format']['plaintext'].widget
+        plaintext.setChecked(True)
+        send_page.view.message.setPlainText("message")
+        expected = pkt.calc_ota_msg_len(len("message") + MSG_HEADER_LEN)
+        qtbot.waitUntil(lambda: label.text() ==
+                        f"Estimated transmission size: {expected} bytes")
+
+        # Update when the options change
+        send_raw = send_page.view.advanced_opts['format']['send_raw'].widget
+        send_raw.setChecked(True)
+        expected = pkt.calc_ota_msg_len(len("message"))
+        qtbot.waitUntil(lambda: label.text() ==
+                        f"Estimated transmission size: {expected} bytes")
+
+        # Clear the estimate when there is no data
+        send_page.view.message.setPlainText("")
+        qtbot.waitUntil(lambda: label.text() == "")
+
     @patch('blocksatgui.components.messagebox.Message')
     def test_send_message_fails_with_empty_message(self, mock_messagebox,
                                                    qtbot, sat_api):
@@ -359,3 +388,24 @@ class TestSapApiListenPage:
 
         listen_page.view.set_network_interfaces(['eth0', 'wlan0', 'lo'], 'lo')
         assert (listen_page.view.get_advanced_options()['interface'] == 'lo')
+
+
+@pytestqt
+class TestSatApiTransmissionsPage:
+
+    def test_order_state_update(self, qtbot, sat_api):
+        """Test the live update of the order state on the table"""
+        tx_page = Transmissions(sat_api)
+        qtbot.addWidget(tx_page.view)
+        rows = [["", "2025-01-01 00:00:00", "Pending", "1.00", 10, uuid]
+                for uuid in ["uuid-1", "uuid-2"]]
+        tx_page.view.update_table_data(rows)
+
+        sat_api.sig_order_state.emit("uuid-2", {'status': 'paid'})
+
+        table = tx_page.view.table
+        statuses = {
+            table.get_data(i, TX_TABLE_IDX): table.get_data(i, TX_STATUS_IDX)
+            for i in range(2)
+        }
+        assert statuses == {"uuid-1": "Pending", "uuid-2": "Paid"}